@@ -1,4 +1,6 @@
 from fastapi import Request, HTTPException, status
+from fastapi.responses import StreamingResponse
+from app.services import rate_limit_service
 from app.services.user_manager import USERS_FILE, get_users_db # Just for checking, though session is in memory
 # Session storage is currently in-memory in server.py.
 # In a modular app, we need a place to store sessions.
@@ -20,3 +22,30 @@ async def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
     return username
+
+# 生成类流式响应（text/event-stream）的响应头：no-transform 禁止 frp / 反向代理压缩或改写，
+# X-Accel-Buffering 关闭 nginx 缓冲，保证逐段到达浏览器。压缩只用于 /static（见 core.static_assets）。
+SSE_HEADERS = {"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+
+def rate_limit_error(e) -> HTTPException:
+    headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+    return HTTPException(status_code=429, detail=str(e), headers=headers)
+
+class StreamSlotResponse(StreamingResponse):
+    """
+    占用了并发名额（rate_limit_service.admit_stream）的流式响应，响应结束时释放名额。
+    释放放在 ASGI 调用外层而不是生成器的 finally 中：客户端在第一段内容之前断开时，
+    Starlette 发送响应头就失败（或直接取消任务），生成器根本不会开始执行。
+    """
+    def __init__(self, username: str, content, slots: int = 1, **kwargs):
+        super().__init__(content, **kwargs)
+        self.username = username
+        self.slots = slots
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            rate_limit_service.release_stream(self.username, self.slots)
+            # 生成器中途被取消或从未开始时关闭它，执行其中的上游清理
+            await self.body_iterator.aclose()
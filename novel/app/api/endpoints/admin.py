@@ -1,7 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 from typing import List
-from app.models.schemas import Group, GroupCreate, UserGroupUpdate
-from app.services import group_service, user_manager
+from pydantic import ValidationError
+from app.models.schemas import (
+    Group, GroupCreate, UserGroupUpdate, BulkUserGroupUpdate, BulkGroupCreate,
+    UserImport, UserImportItem
+)
+from app.core import codec
+from app.core.config import COLD_AFTER_DAYS
+from app.services import group_service, user_manager, upstream_service, usage_service, stats_service, storage_service, text_cache, metrics
 from app.api.deps import get_current_user
 
 router = APIRouter()
@@ -38,3 +46,144 @@ async def update_user_group(update: UserGroupUpdate, admin: str = Depends(get_ad
         return {"status": "ok", "message": f"用户 {update.username} 已移动到组 {update.group_name}"}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+
+# --- Bulk ---
+# 批量接口默认原子执行（单次写文件，有失败项则整体不生效），返回逐项结果；
+# format=ndjson 时逐行流式返回结果，最后一行为 summary。
+
+def _bulk_response(results: list, applied: int, fmt: str):
+    summary = {"applied": applied, "failed": sum(1 for item in results if not item["ok"]), "total": len(results)}
+    if fmt == "ndjson":
+        def lines():
+            for item in results:
+                yield codec.dumps(item) + "\n"
+            yield codec.dumps({"summary": summary}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    return {**summary, "results": results}
+
+async def _iter_ndjson(request: Request):
+    """边接收请求体边按行解析，产出 (行号, 对象)；内存中只保留未完成的一行"""
+    buffer = bytearray()
+    lineno = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", start)) >= 0:
+            lineno += 1
+            line = bytes(buffer[start:end])
+            start = end + 1
+            if line.strip():
+                yield lineno, _parse_line(lineno, line)
+        del buffer[:start]
+    if buffer.strip():
+        lineno += 1
+        yield lineno, _parse_line(lineno, bytes(buffer))
+
+def _parse_line(lineno: int, line: bytes):
+    try:
+        return codec.loads(line)
+    except ValueError as e:
+        raise ValueError(f"第 {lineno} 行: {e}")
+
+@router.post("/users/group/bulk")
+async def bulk_update_user_group(update: BulkUserGroupUpdate, format: str = "json", admin: str = Depends(get_admin_user)):
+    valid_groups = set(group_service.get_groups_db().keys())
+    assignments = [(item.username, item.group_name) for item in update.assignments]
+    results, applied = user_manager.bulk_update_user_groups(assignments, valid_groups, update.allow_partial)
+    return _bulk_response(results, applied, format)
+
+@router.post("/groups/bulk")
+async def bulk_create_groups(req: BulkGroupCreate, format: str = "json", admin: str = Depends(get_admin_user)):
+    results, applied = group_service.create_groups(req.groups, req.allow_partial)
+    return _bulk_response(results, applied, format)
+
+@router.get("/users/export")
+async def export_users(format: str = "json", admin: str = Depends(get_admin_user)):
+    if format == "ndjson":
+        lines = (codec.dumps(user) + "\n" for user in user_manager.export_users())
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    return {"users": list(user_manager.export_users())}
+
+@router.post("/users/import")
+async def import_users(request: Request, format: str = "json", overwrite: bool = False,
+                       allow_partial: bool = False, admin: str = Depends(get_admin_user)):
+    """
+    导入用户，支持两种请求体：
+    1. application/json: UserImport（overwrite / allow_partial 写在 body 中）
+    2. application/x-ndjson: 每行一个 UserImportItem（overwrite / allow_partial 走查询参数）
+    """
+    valid_groups = set(group_service.get_groups_db().keys())
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            # 逐行校验并暂存到内存中的 users，不保留原始请求体；全部读完后一次性落盘
+            users, seen, results = user_manager.get_users_db(), set(), []
+            async for lineno, item in _iter_ndjson(request):
+                try:
+                    if not isinstance(item, dict):
+                        raise ValueError("应为 JSON 对象")
+                    record = UserImportItem(**item).dict()
+                except (ValueError, ValidationError) as e:
+                    raise ValueError(f"第 {lineno} 行: {e}")
+                results.append(user_manager.stage_import(users, seen, record, valid_groups, overwrite))
+            applied = user_manager.commit_import(users, results, allow_partial)
+            return _bulk_response(results, applied, format)
+        body = UserImport(**(await request.json()))
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=f"请求体格式错误: {e}")
+
+    records = [item.dict() for item in body.users]
+    results, applied = user_manager.import_users(records, valid_groups, body.overwrite, body.allow_partial)
+    return _bulk_response(results, applied, format)
+
+@router.get("/upstreams")
+async def list_upstreams(admin: str = Depends(get_admin_user)):
+    # 上游池配置、按任务类型的模型路由与各上游健康状态（首字延迟、失败次数等）
+    return {
+        "pools": upstream_service.get_upstreams_db(),
+        "routes": upstream_service.get_model_routes(),
+        "health": upstream_service.health_snapshot()
+    }
+
+@router.get("/metrics")
+async def get_metrics(admin: str = Depends(get_admin_user)):
+    return metrics.snapshot()
+
+@router.get("/cache")
+async def get_cache_stats(admin: str = Depends(get_admin_user)):
+    # 会话正文缓存的命中率与常驻内存
+    return {"text_cache": text_cache.stats()}
+
+@router.get("/usage")
+async def list_usage(admin: str = Depends(get_admin_user)):
+    # 今日各用户用量，按 token 总数倒序
+    return {"usage": usage_service.list_usage_today()}
+
+@router.get("/usage/{username}")
+async def get_user_usage(username: str, days: int = 30, admin: str = Depends(get_admin_user)):
+    return {"username": username, "usage": usage_service.get_user_usage(username, days)}
+
+@router.get("/stats")
+async def get_storage_stats(include_users: bool = False, admin: str = Depends(get_admin_user)):
+    # 增量维护的存储统计，直接返回内存汇总
+    return stats_service.get_summary(include_users)
+
+@router.get("/stats/users/{username}")
+async def get_user_storage_stats(username: str, admin: str = Depends(get_admin_user)):
+    return stats_service.get_user_stats(username)
+
+@router.post("/stats/reconcile")
+async def reconcile_storage_stats(admin: str = Depends(get_admin_user)):
+    # 全量扫描修正计数漂移，耗时与数据量成正比
+    return stats_service.reconcile()
+
+@router.get("/storage/report")
+async def get_storage_report(admin: str = Depends(get_admin_user)):
+    # 最近一次存储维护的结果，以及冷存储会话实际解压耗时的累计统计
+    return storage_service.get_report()
+
+@router.post("/storage/maintenance")
+async def run_storage_maintenance(dry_run: bool = False, compact: bool = True, freeze: bool = True,
+                                  cold_after_days: int = COLD_AFTER_DAYS, drop_views: bool = True,
+                                  admin: str = Depends(get_admin_user)):
+    # 立即执行一次历史压缩、视图清空与冷存储（在线程中运行）
+    return await asyncio.to_thread(storage_service.run_maintenance, compact, freeze, cold_after_days, dry_run, drop_views)
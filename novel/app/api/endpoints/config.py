@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from app.core import codec, etag
 from app.models.schemas import ConfigRequest
-from app.services.user_manager import get_user_config, save_user_config_split, get_user_group
-from app.services.group_service import can_use_free_mode
+from app.services.user_manager import get_user_config, save_user_config_split, get_user_group, config_version
+from app.services.group_service import can_use_free_mode, get_generation_profile
 from app.api.deps import get_current_user
 
 router = APIRouter()
 
 @router.get("/config")
-async def get_config(username: str = Depends(get_current_user)):
-    return get_user_config(username)
+async def get_config(request: Request, username: str = Depends(get_current_user)):
+    tag = etag.make(config_version(username))
+    cached = etag.not_modified(request, tag)
+    if cached:
+        return cached
+    return codec.json_response(get_user_config(username), headers=etag.headers(tag))
 
 @router.post("/config")
 async def update_config(config: ConfigRequest, username: str = Depends(get_current_user)):
@@ -21,6 +26,10 @@ async def update_config(config: ConfigRequest, username: str = Depends(get_curre
             # 为了用户体验，我们抛出明确的错误
             raise HTTPException(status_code=403, detail="当前用户组无权使用自由创作模式")
 
+    allowed_models = get_generation_profile(get_user_group(username))["allowed_models"]
+    if allowed_models is not None and config.model not in allowed_models:
+        raise HTTPException(status_code=403, detail=f"当前用户组不能使用模型 {config.model}")
+
     # 获取旧配置以保留 file_path (不让前端直接改 file_path 防止越权)
     old_config = get_user_config(username)
 
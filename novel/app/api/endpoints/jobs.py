@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from app.models.schemas import JobSubmitRequest
+from app.services import job_service, novel_service, rate_limit_service, upstream_service
+from app.services.rate_limit_service import RateLimitExceeded
+from app.api.deps import get_current_user, rate_limit_error, SSE_HEADERS
+
+router = APIRouter()
+
+@router.post("/jobs")
+async def submit_job(req: JobSubmitRequest, username: str = Depends(get_current_user)):
+    outline = req.outline.dict() if req.outline else None
+    # 生成档位在提交时先检查一次，执行时按当时的档位重新解析
+    task = upstream_service.TASK_OUTLINE if req.type == "outline" else upstream_service.TASK_CONTINUATION
+    try:
+        novel_service.resolve_profile(username, task)
+    except novel_service.GenerationNotAllowed as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    # 后台任务同样计入频率与每日配额；并发名额在 worker 开始执行时占用（见 job_service）
+    try:
+        rate_limit_service.check_request(username)
+    except RateLimitExceeded as e:
+        raise rate_limit_error(e)
+    try:
+        job = job_service.submit_job(username, req.type, req.user_prompt, outline)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"[{username}] 提交后台任务 {job['id']} ({req.type})")
+    return {"status": "queued", "job": job}
+
+@router.get("/jobs")
+async def list_jobs(username: str = Depends(get_current_user)):
+    return {"jobs": job_service.list_jobs(username)}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, include_output: bool = False, username: str = Depends(get_current_user)):
+    try:
+        return job_service.get_job(username, job_id).public(include_output)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, offset: int = 0, username: str = Depends(get_current_user)):
+    try:
+        job = job_service.get_job(username, job_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(job_service.stream_job(job, offset), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, username: str = Depends(get_current_user)):
+    try:
+        return job_service.cancel_job(username, job_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Job not found")
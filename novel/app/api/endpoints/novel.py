@@ -1,18 +1,85 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
+import re
+from typing import Optional
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from app.models.schemas import GenerateRequest, SaveRequest, DiscardRequest, OutlineRequest
-from app.services import novel_service
-from app.api.deps import get_current_user
+from app.core import codec, etag
+from app.services import novel_service, session_service, fork_store, rate_limit_service, upstream_service
+from app.services.rate_limit_service import RateLimitExceeded
+from app.api.deps import get_current_user, rate_limit_error, SSE_HEADERS, StreamSlotResponse
 
 router = APIRouter()
 
 @router.get("/novel")
-async def get_novel_content(full: bool = False, username: str = Depends(get_current_user)):
+async def get_novel_content(request: Request, full: bool = False, username: str = Depends(get_current_user)):
     try:
-        return novel_service.get_novel_content(username, full)
+        # 版本戳在读取正文之前计算：期间若有写入，下次请求 ETag 必然不同
+        tag = etag.make(novel_service.novel_version(username), full)
+        cached = etag.not_modified(request, tag)
+        if cached:
+            return cached
+        return codec.json_response(novel_service.get_novel_content(username, full), headers=etag.headers(tag))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/novel/download")
+async def download_novel(request: Request, filename: Optional[str] = None, username: str = Depends(get_current_user)):
+    """下载会话 txt（默认当前会话），支持 Range 断点续传，分块读取文件"""
+    try:
+        path = session_service.resolve_session_file(username, filename)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not fork_store.fork_ref(path):
+        return FileResponse(path, media_type="text/plain; charset=utf-8", filename=path.name)
+
+    # 分叉会话：拼接父会话共享前缀与自身内容输出，支持单个 Range
+    size = fork_store.size(path)
+    headers = {"Accept-Ranges": "bytes", "Content-Disposition": f"attachment; filename*=utf-8''{quote(path.name)}"}
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", request.headers.get("range", "").strip())
+    if not match or match.groups() == ("", ""):
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(fork_store.iter_bytes(path), media_type="text/plain; charset=utf-8", headers=headers)
+
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last) + 1 if last else size, size)
+    else:
+        start, end = max(0, size - int(last)), size
+    if start >= end:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(
+        fork_store.iter_bytes(path, start, end), status_code=206,
+        media_type="text/plain; charset=utf-8", headers=headers
+    )
+
+@router.get("/novel/chapters")
+async def get_chapters(request: Request, username: str = Depends(get_current_user)):
+    """章节列表（按标题切分）与历史块在 txt 中的字节区间"""
+    tag = etag.make(novel_service.novel_version(username), "chapters")
+    cached = etag.not_modified(request, tag)
+    if cached:
+        return cached
+    return codec.json_response(novel_service.get_chapters(username), headers=etag.headers(tag))
+
+@router.get("/novel/chapters/{index}")
+async def get_chapter(index: int, username: str = Depends(get_current_user)):
+    try:
+        return codec.json_response(novel_service.read_chapter(username, index))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/novel/range")
+async def get_novel_range(start: int = Query(0, ge=0), end: int = Query(..., ge=0),
+                          username: str = Depends(get_current_user)):
+    """按字节区间读取正文（单次最多 1MB），返回实际对齐后的区间"""
+    try:
+        return codec.json_response(novel_service.read_novel_range(username, start, end))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Files not found")
+
 @router.post("/auto_rename")
 async def auto_rename(username: str = Depends(get_current_user)):
     try:
@@ -22,28 +89,46 @@ async def auto_rename(username: str = Depends(get_current_user)):
         return {"status": "error", "detail": str(e)}
 
 @router.post("/outline")
-async def generate_outline(req: OutlineRequest, username: str = Depends(get_current_user)):
+async def generate_outline(req: OutlineRequest, request: Request, username: str = Depends(get_current_user)):
+    try:
+        profile = novel_service.resolve_profile(username, upstream_service.TASK_OUTLINE)
+    except novel_service.GenerationNotAllowed as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    try:
+        rate_limit_service.admit_stream(username)
+    except RateLimitExceeded as e:
+        raise rate_limit_error(e)
     print(f"[{username}] 生成大纲中...")
-    return StreamingResponse(
-        novel_service.generate_outline_stream(username, req),
-        media_type="text/event-stream"
-    )
+    stream = novel_service.generate_outline_stream(username, req, request.is_disconnected, profile)
+    return StreamSlotResponse(username, stream, media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.post("/generate")
-async def generate_novel(req: GenerateRequest, username: str = Depends(get_current_user)):
-    print(f"[{username}] 续写中...")
-    return StreamingResponse(
-        novel_service.generate_novel_stream(username, req.user_prompt),
-        media_type="text/event-stream"
-    )
+async def generate_novel(req: GenerateRequest, request: Request, username: str = Depends(get_current_user)):
+    try:
+        profile = novel_service.resolve_profile(username, upstream_service.TASK_CONTINUATION)
+    except novel_service.GenerationNotAllowed as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    # 每个候选都是一条独立的上游流，按候选数占用并发名额
+    try:
+        rate_limit_service.admit_stream(username, req.candidates)
+    except RateLimitExceeded as e:
+        raise rate_limit_error(e)
+    print(f"[{username}] 续写中... (候选数: {req.candidates})")
+    stream = novel_service.generate_novel_stream(username, req.user_prompt, req.candidates, request.is_disconnected, profile)
+    return StreamSlotResponse(username, stream, req.candidates, media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.post("/save")
 async def save_novel(req: SaveRequest, username: str = Depends(get_current_user)):
     try:
         block_id = novel_service.save_novel_content(username, req.content, req.prompt)
-        return {"status": "saved", "block_id": block_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    # 预生成失败不影响保存结果
+    try:
+        novel_service.start_speculation(username)
+    except Exception as e:
+        print(f"[{username}] 预生成启动失败: {e}")
+    return {"status": "saved", "block_id": block_id}
 
 @router.post("/discard")
 async def discard_novel(req: DiscardRequest, username: str = Depends(get_current_user)):
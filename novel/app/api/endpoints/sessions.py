@@ -1,5 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.services import session_service
+from typing import Optional
+from urllib.parse import quote
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.core import codec, etag
+from app.core.config import HISTORY_PAGE_MAX, SEARCH_MAX_RESULTS
+from app.models.schemas import ForkRequest
+from app.services import session_service, search_service
 from app.api.deps import get_current_user
 
 router = APIRouter()
@@ -7,12 +13,73 @@ router = APIRouter()
 @router.post("/sessions")
 async def get_sessions(username: str = Depends(get_current_user)):
     sessions = session_service.list_user_sessions(username)
-    return {"sessions": sessions}
+    return codec.json_response({"sessions": sessions})
+
+@router.get("/sessions")
+async def get_sessions_conditional(request: Request, username: str = Depends(get_current_user)):
+    tag = etag.make(session_service.sessions_version(username))
+    cached = etag.not_modified(request, tag)
+    if cached:
+        return cached
+    sessions = session_service.list_user_sessions(username)
+    return codec.json_response({"sessions": sessions}, headers=etag.headers(tag))
+
+@router.get("/sessions/export")
+async def export_sessions(username: str = Depends(get_current_user)):
+    """以 zip 流的形式导出全部会话与历史记录"""
+    return StreamingResponse(
+        session_service.export_sessions_zip(username),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(username)}_sessions.zip"}
+    )
 
 @router.post("/history")
 async def get_history(username: str = Depends(get_current_user)):
     history = session_service.get_session_history(username)
-    return {"history": history}
+    return codec.json_response({"history": history})
+
+@router.get("/history")
+async def get_history_page(
+    request: Request,
+    cursor: Optional[int] = Query(None, ge=0),
+    limit: int = Query(50, ge=1, le=HISTORY_PAGE_MAX),
+    include_discarded: bool = True,
+    fields: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    username: str = Depends(get_current_user)
+):
+    """
+    分页读取当前会话历史。
+    fields 为逗号分隔的字段列表，如 fields=id,role,status,content_length 只返回元数据；
+    返回的 next_cursor 作为下一页的 cursor，为 null 时表示没有更多。
+    """
+    tag = etag.make(session_service.history_version(username), cursor, limit, include_discarded, fields, order)
+    cached = etag.not_modified(request, tag)
+    if cached:
+        return cached
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    page = session_service.get_session_history_page(
+        username, cursor, limit, include_discarded, field_list, reverse=(order == "desc")
+    )
+    return codec.json_response(page, headers=etag.headers(tag))
+
+@router.get("/history/archived/{block_id}")
+async def get_archived_block(block_id: str, username: str = Depends(get_current_user)):
+    """读取已被压缩归档的丢弃块原文"""
+    block = session_service.get_archived_block(username, block_id)
+    if not block:
+        raise HTTPException(status_code=404, detail="Archived block not found")
+    return codec.json_response(block)
+
+@router.get("/search")
+async def search_sessions(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS),
+    session: Optional[str] = None,
+    username: str = Depends(get_current_user)
+):
+    """在当前用户所有会话的有效历史块中全文搜索，多个关键词以空格分隔；session 限定某个会话文件名"""
+    return codec.json_response(search_service.search(username, q, limit, session))
 
 @router.post("/switch_session")
 async def switch_session(req: dict, username: str = Depends(get_current_user)):
@@ -31,6 +98,16 @@ async def new_session(username: str = Depends(get_current_user)):
     result = session_service.create_new_session(username)
     return {"status": "ok", **result}
 
+@router.post("/fork")
+async def fork_session(req: ForkRequest, username: str = Depends(get_current_user)):
+    try:
+        result = session_service.fork_session(username, req.block_id, req.switch)
+        return {"status": "ok", **result}
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @router.post("/switch_file")
 async def switch_file(req: dict, username: str = Depends(get_current_user)):
     target_path = req.get("target_path")
@@ -0,0 +1,67 @@
+import os
+import json
+from pathlib import Path
+from typing import Any
+from starlette.responses import Response
+from app.core.config import JSON_STORAGE_PRETTY
+
+# JSON 编解码统一入口：历史记录、配置、用户库等存储文件以及大响应都经由这里。
+# 安装了 orjson 时使用 orjson，否则回退到标准库 json，两者输出格式一致：
+#   - UTF-8 原样输出中文（等价于 ensure_ascii=False）
+#   - 默认紧凑格式；pretty=True 时缩进 2 格（便于手工查看/编辑）
+# 读取时两种格式都能解析，已有的缩进文件无需迁移，下次写入时自动变为紧凑格式。
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+def loads(data) -> Any:
+    if orjson:
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+def dumpb(obj: Any, pretty: bool = False) -> bytes:
+    if orjson:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    return dumpb(obj, pretty).decode("utf-8")
+
+# --- Files ---
+
+def read_file(path: Path) -> Any:
+    return loads(Path(path).read_bytes())
+
+def write_file(path: Path, obj: Any, pretty: bool = None, atomic: bool = False):
+    """写入 JSON 文件；pretty 默认取 JSON_STORAGE_PRETTY，atomic 时先写临时文件再替换"""
+    path = Path(path)
+    data = dumpb(obj, JSON_STORAGE_PRETTY if pretty is None else pretty)
+    if not path.parent.exists():
+        # 数据目录按需创建（config.init_dirs 之前，或部署到新的数据根目录时）
+        path.parent.mkdir(parents=True, exist_ok=True)
+    if not atomic:
+        path.write_bytes(data)
+        return
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+# --- API ---
+
+def json_response(obj: Any, status_code: int = 200, headers: dict = None) -> Response:
+    """
+    直接编码好的 JSON 响应。endpoint 返回 Response 时 FastAPI 不再经过
+    jsonable_encoder + json.dumps，适合历史记录这类体积大的纯 dict/list 数据。
+    """
+    return Response(content=dumpb(obj), status_code=status_code, headers=headers, media_type="application/json")
@@ -1,18 +1,72 @@
+import os
+import json
+from dataclasses import dataclass, fields
 from pathlib import Path
 
+# 部署相关的设置，按优先级从高到低读取：
+#   1. 环境变量 NOVEL_<字段名大写>，如 NOVEL_PROJECT_ROOT=/srv/novel、NOVEL_JOB_WORKERS=4
+#   2. 环境变量 NOVEL_SETTINGS_FILE 指向的 JSON 文件，如 {"project_root": "/srv/novel", "port": 19001}
+#   3. Settings 中的默认值
+# 同一份代码换一组环境变量即可部署多个实例。数据目录不在导入时创建，见 init_dirs()。
+
+@dataclass
+class Settings:
+    project_root: Path = Path(r"D:\Code\Project\server_migration\novel")  # 适配 Windows 路径
+    host: str = "0.0.0.0"
+    port: int = 19000
+    job_workers: int = 2                          # 同时执行的后台任务数（进程内并发；服务本身须单进程运行，登录会话存于内存）
+    max_pending_jobs_per_user: int = 3            # 每个用户未完成任务上限
+    max_running_jobs_per_user: int = 1            # 每个用户同时执行的任务上限，其余任务让出 worker
+    text_cache_max_bytes: int = 256 * 1024 * 1024 # 会话正文内存缓存上限（字节）
+    upstream_max_connections: int = 1000          # 每个上游客户端的连接池大小（同 openai SDK 默认）
+    upstream_max_keepalive: int = 100             # 其中保持空闲的长连接数
+    block_store: bool = False                     # 新建会话是否使用块存储模式，见下方 BLOCK_STORE
+
+def _parse(value, kind):
+    if kind is bool and isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return kind(value)
+
+def load_settings() -> Settings:
+    values = {}
+    settings_file = os.environ.get("NOVEL_SETTINGS_FILE")
+    if settings_file:
+        values.update(json.loads(Path(settings_file).read_text(encoding="utf-8")))
+    names = {f.name for f in fields(Settings)}
+    for key in values.keys() - names:
+        print(f"Unknown setting ignored: {key}")
+    for name in names:
+        env = os.environ.get(f"NOVEL_{name.upper()}")
+        if env is not None:
+            values[name] = env
+    return Settings(**{f.name: _parse(values[f.name], f.type) for f in fields(Settings) if f.name in values})
+
+settings = load_settings()
+
 # Project Root
-# 适配 Windows 路径
-PROJECT_ROOT = Path(r"D:\Code\Project\server_migration\novel")
+PROJECT_ROOT = settings.project_root
 DATA_ROOT = PROJECT_ROOT / "data"
 CONFIG_ROOT = PROJECT_ROOT / "configs"
 PROMPT_DATA_ROOT = PROJECT_ROOT / "prompt_data"
 USERS_FILE = PROJECT_ROOT / "users.json"
 GROUPS_FILE = PROJECT_ROOT / "groups.json"
+UPSTREAMS_FILE = PROJECT_ROOT / "upstreams.json"
+MODEL_ROUTES_FILE = PROJECT_ROOT / "model_routes.json"
+JOBS_ROOT = PROJECT_ROOT / "jobs"
+USAGE_ROOT = PROJECT_ROOT / "usage"
+STATS_FILE = PROJECT_ROOT / "stats.json"
+SEARCH_ROOT = PROJECT_ROOT / "search"
+
+_DIRS_READY = False
 
-# 确保目录存在
-DATA_ROOT.mkdir(parents=True, exist_ok=True)
-CONFIG_ROOT.mkdir(parents=True, exist_ok=True)
-PROMPT_DATA_ROOT.mkdir(parents=True, exist_ok=True)
+def init_dirs():
+    """确保数据目录存在。服务启动（lifespan）和运维命令开始时调用，导入本模块不触及磁盘"""
+    global _DIRS_READY
+    if _DIRS_READY:
+        return
+    for path in (DATA_ROOT, CONFIG_ROOT, PROMPT_DATA_ROOT, JOBS_ROOT, USAGE_ROOT, SEARCH_ROOT):
+        path.mkdir(parents=True, exist_ok=True)
+    _DIRS_READY = True
 
 # 默认配置
 DEFAULT_API_CONFIG = {
@@ -30,3 +84,40 @@ DEFAULT_PROMPTS = {
     "pre_hidden_freecreate_prompt": "续写小说，详细描述做爱过程，比如鸡巴，小穴，乳头,菊花，改纯爱等并增加描述词，逐步推进小说剧情。直接开始生成正文，不要有任何开场白或自我介绍。",
     "post_hidden_freecreate_prompt": "续写小说，详细描述做爱过程，比如鸡巴，小穴，乳头,菊花，改纯爱等并增加描述词，逐步推进小说剧情。直接开始生成正文，不要有任何开场白或自我介绍。"
 }
+
+# 单次续写允许的最大候选数量
+MAX_CANDIDATES = 4
+
+# 预生成（用户组开启 speculative_generation 时）结果的保留时间，秒
+SPECULATIVE_TTL_SECONDS = 120
+
+# 后台任务
+JOB_WORKERS = settings.job_workers
+MAX_PENDING_JOBS_PER_USER = settings.max_pending_jobs_per_user
+MAX_RUNNING_JOBS_PER_USER = settings.max_running_jobs_per_user
+JOB_DEFER_SECONDS = 2.0          # 用户已达运行/并发上限时，任务延后重新入队的间隔
+JOB_RETENTION_DAYS = 7           # 已结束任务记录保留天数
+
+# 会话正文内存缓存上限（字节）
+TEXT_CACHE_MAX_BYTES = settings.text_cache_max_bytes
+
+# JSON 存储文件是否缩进输出（默认紧凑，便于手工查看时可改为 True）
+# 会话历史（<session>.json）不受此项影响，始终为每块一行的格式，见 history_store
+JSON_STORAGE_PRETTY = False
+
+# 历史分页接口单页最大块数
+HISTORY_PAGE_MAX = 500
+
+# 存储维护（历史压缩 + 冷存储），见 storage_service
+STORAGE_REPORT_FILE = PROJECT_ROOT / "storage_report.json"
+MAINTENANCE_INTERVAL_HOURS = 24  # 后台维护任务的运行间隔
+COMPACT_IDLE_MINUTES = 30        # 历史 json 超过该时间未修改才压缩已丢弃块
+COLD_AFTER_DAYS = 90             # 会话超过该天数未修改则压缩为冷存储
+
+# 全文搜索单次返回的最大结果数
+SEARCH_MAX_RESULTS = 100
+
+# 块存储模式（见 block_store）：历史块是唯一数据源，txt 只是按需补齐的视图。
+# 只影响新建的会话；已有会话可用 `python manage.py block-store on|off` 转换。
+BLOCK_STORE = settings.block_store
+VIEW_DROP_AFTER_DAYS = 7         # 块存储会话闲置超过该天数，维护任务清空其 txt 视图
@@ -0,0 +1,40 @@
+import os
+import hashlib
+from typing import Optional
+from starlette.requests import Request
+from starlette.responses import Response
+
+# 条件 GET：由廉价的版本戳（文件 mtime + size）生成强 ETag，
+# 请求头 If-None-Match 匹配时直接返回 304，不读取、不序列化实际数据。
+# 响应带 Cache-Control: no-cache，浏览器每次都会带上 If-None-Match 重新验证；
+# 不同用户共用同一 URL，因此按 Authorization 区分缓存。
+
+CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+def file_stamp(path) -> str:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return f"{path}:-"
+    return f"{path}:{st.st_mtime_ns}:{st.st_size}"
+
+def make(*parts) -> str:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+def headers(tag: str) -> dict:
+    return {"ETag": tag, **CACHE_HEADERS}
+
+def not_modified(request: Request, tag: str) -> Optional[Response]:
+    """If-None-Match 命中时返回 304 响应，否则返回 None"""
+    if matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers(tag))
+    return None
+
+def matches(header: Optional[str], tag: str) -> bool:
+    """If-None-Match 是否命中 tag"""
+    if not header:
+        return False
+    # If-None-Match 使用弱比较，忽略 W/ 前缀
+    candidates = [c.strip().removeprefix("W/") for c in header.split(",")]
+    return tag in candidates or "*" in candidates
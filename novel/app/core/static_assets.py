@@ -0,0 +1,126 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from app.core import etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# /static 的静态资源：服务启动时（lifespan 中调用 precompress）把文本类资源预压缩到内存
+# （gzip，装了 brotli 时再加 br），按请求的 Accept-Encoding 直接返回对应版本，不在每次请求时压缩。
+# 构造时不读取文件，导入 main 不产生压缩开销；未预压缩的文件在首次请求时加载。
+# 缓存策略：
+#   文件名带内容指纹（如 app.3f2a9c1b.js）  -> 一年且 immutable，内容变化时文件名随之变化
+#   其余文件（HTML 等）                      -> no-cache，每次带 If-None-Match 重新验证，未变化返回 304
+# ETag 由内容哈希生成，不同编码的版本 ETag 不同（带 -gzip / -br 后缀）。
+# 文件在运行中被修改（mtime 或大小变化）时，下次请求重新加载并压缩。
+# 生成类的流式接口不经过这里，也不做任何压缩（见 api.deps.SSE_HEADERS）。
+
+COMPRESSIBLE_SUFFIXES = {".html", ".js", ".mjs", ".css", ".json", ".svg", ".txt", ".map", ".xml"}
+MIN_COMPRESS_BYTES = 1024           # 过小的文件压缩收益不大，只缓存原文
+MAX_ASSET_BYTES = 8 * 1024 * 1024   # 更大的文件不缓存在内存中，按原样由 StaticFiles 输出
+FINGERPRINT_RE = re.compile(r"\.[0-9a-f]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+class _Asset:
+    def __init__(self, stamp: tuple, media_type: str, variants: Dict[str, bytes]):
+        self.stamp = stamp
+        self.media_type = media_type
+        self.variants = variants     # 编码 -> 内容，identity 为原文
+        self.digest = hashlib.sha1(variants["identity"]).hexdigest()[:32]
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+def _load(path: str, st: os.stat_result) -> Optional[_Asset]:
+    if Path(path).suffix.lower() not in COMPRESSIBLE_SUFFIXES or st.st_size > MAX_ASSET_BYTES:
+        return None
+    data = Path(path).read_bytes()
+    variants = {"identity": data}
+    if len(data) >= MIN_COMPRESS_BYTES:
+        variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variants["br"] = brotli.compress(data, quality=11)
+        # 压缩后没有变小的版本不使用
+        variants = {k: v for k, v in variants.items() if k == "identity" or len(v) < len(data)}
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return _Asset((st.st_mtime_ns, st.st_size), media_type, variants)
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """按 Accept-Encoding（含 q 值）从可用版本中选择，优先 br，其次 gzip"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in available and q > 0:
+            return encoding
+    return "identity"
+
+class PrecompressedStaticFiles(StaticFiles):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.assets: Dict[str, Optional[_Asset]] = {}
+
+    def precompress(self) -> dict:
+        """预先加载并压缩目录下的全部资源，返回统计"""
+        summary = {"files": 0, "bytes": 0, "gzip_bytes": 0, "br_bytes": 0}
+        if self.directory is None or not os.path.isdir(self.directory):
+            return summary
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                asset = self._get(path, os.stat(path))
+                if asset is None:
+                    continue
+                summary["files"] += 1
+                summary["bytes"] += len(asset.variants["identity"])
+                summary["gzip_bytes"] += len(asset.variants.get("gzip", asset.variants["identity"]))
+                summary["br_bytes"] += len(asset.variants.get("br", b""))
+        print(f"Static assets precompressed: {summary}（brotli {'可用' if brotli else '未安装'}）")
+        return summary
+
+    def _get(self, path: str, st: os.stat_result) -> Optional[_Asset]:
+        path = str(path)
+        asset = self.assets.get(path)
+        if path not in self.assets or (asset is not None and asset.stamp != (st.st_mtime_ns, st.st_size)):
+            asset = self.assets[path] = _load(path, st)
+        return asset
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        cache_control = IMMUTABLE_CACHE if FINGERPRINT_RE.search(str(full_path)) else REVALIDATE_CACHE
+        asset = self._get(full_path, stat_result)
+        # 不缓存的文件与 Range 请求交给 StaticFiles（FileResponse 支持断点续传）
+        if asset is None or "range" in request_headers:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            response.headers["Cache-Control"] = cache_control
+            return response
+
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), asset.variants)
+        tag = asset.etag(encoding)
+        headers = {"ETag": tag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if etag.matches(request_headers.get("if-none-match"), tag):
+            return Response(status_code=304, headers=headers)
+        return Response(asset.variants[encoding], status_code=status_code, media_type=asset.media_type, headers=headers)
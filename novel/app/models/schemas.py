@@ -1,5 +1,6 @@
-from typing import Optional
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+from app.core.config import MAX_CANDIDATES
 
 class UserLogin(BaseModel):
     username: str
@@ -12,6 +13,7 @@ class UserRegister(BaseModel):
 
 class GenerateRequest(BaseModel):
     user_prompt: Optional[str] = None
+    candidates: int = Field(1, ge=1, le=MAX_CANDIDATES) # 并发候选数量
 
 class SaveRequest(BaseModel):
     content: str
@@ -20,6 +22,10 @@ class SaveRequest(BaseModel):
 class DiscardRequest(BaseModel):
     block_id: str
 
+class ForkRequest(BaseModel):
+    block_id: str
+    switch: bool = True  # 分叉后切换到新会话
+
 class OutlineRequest(BaseModel):
     protagonist: str
     age: str
@@ -27,6 +33,11 @@ class OutlineRequest(BaseModel):
     plot: str
     word_count: str
 
+class JobSubmitRequest(BaseModel):
+    type: str # "generate" | "outline"
+    user_prompt: Optional[str] = None
+    outline: Optional[OutlineRequest] = None
+
 class ConfigRequest(BaseModel):
     base_url: str
     api_key: str
@@ -38,16 +49,56 @@ class ConfigRequest(BaseModel):
     pre_hidden_freecreate_prompt: Optional[str] = ""
     post_hidden_freecreate_prompt: Optional[str] = ""
 
+class GenerationProfile(BaseModel):
+    # 每类任务（continuation / outline）的 max_tokens，0 表示该组不能使用该任务
+    max_tokens: Dict[str, int] = Field(default_factory=lambda: {"continuation": 10000, "outline": 50000})
+    temperature: float = Field(0.9, ge=0, le=2)
+    top_p: float = Field(1.0, gt=0, le=1)
+    stream: bool = True # False 时整段生成完再返回（自由创作模式始终如此）
+    allowed_models: Optional[List[str]] = None # None 表示不限制
+
 class Group(BaseModel):
     name: str
     description: str
     allow_free_mode: bool = False
+    # 限流配置，None 表示不限制
+    requests_per_minute: Optional[int] = None
+    group_requests_per_minute: Optional[int] = None
+    max_concurrent_streams: Optional[int] = None
+    daily_token_limit: Optional[int] = None
+    speculative_generation: bool = False # save 后在后台预生成下一段续写
+    generation_profile: Optional[GenerationProfile] = None # None 使用默认档位
 
 class GroupCreate(BaseModel):
     name: str
     description: str
     allow_free_mode: bool = False
+    requests_per_minute: Optional[int] = None
+    group_requests_per_minute: Optional[int] = None
+    max_concurrent_streams: Optional[int] = None
+    daily_token_limit: Optional[int] = None
+    speculative_generation: bool = False # save 后在后台预生成下一段续写
+    generation_profile: Optional[GenerationProfile] = None # None 使用默认档位
 
 class UserGroupUpdate(BaseModel):
     username: str
     group_name: str
+
+class BulkUserGroupUpdate(BaseModel):
+    assignments: List[UserGroupUpdate]
+    allow_partial: bool = False # 默认原子执行：有失败项则全部不生效
+
+class BulkGroupCreate(BaseModel):
+    groups: List[GroupCreate]
+    allow_partial: bool = False
+
+class UserImportItem(BaseModel):
+    username: str
+    hash: str
+    salt: str
+    group: str = "default"
+
+class UserImport(BaseModel):
+    users: List[UserImportItem]
+    overwrite: bool = False
+    allow_partial: bool = False
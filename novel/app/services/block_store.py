@@ -0,0 +1,272 @@
+import os
+import uuid
+import datetime
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Optional
+from app.core import codec
+from app.services import history_store, fork_store, chapter_index, text_cache, stats_service
+
+# 块存储模式：会话历史（json）是唯一的数据源，txt 只是由正文块拼成的视图。
+# save 只向 json 追加块，不写 txt；读取正文前调用 ensure_view() 补齐视图。
+# 写入量的实际取舍：save 请求本身只写一份正文，但界面在保存后几乎都会立即读取，
+# 视图随即被补齐，活跃会话的每个块最终仍写入两次（json + txt），只是 txt 推迟到读取时。
+# 真正省下的是闲置会话：维护任务清空其视图（drop_view）后磁盘上只剩历史中的一份，
+# 以及连续多次 save 之间没有读取时，补齐合并为一次追加。
+# 块存储会话带有标记文件 <session>.view.json：
+# {
+#     "blocks": 12,                     # 自身历史的前 N 个块已反映在 txt 中
+#     "json_stamp": [mtime_ns, size],   # 上次同步时 json / txt 的版本戳，
+#     "txt_stamp": [mtime_ns, size],    # 两者都没变即视图是最新的；txt_stamp 为 null 表示需要整体重建
+#     "dropped_size": 40960             # 视图被清空前的大小（会话列表显示用）
+# }
+# 只有 json 变化时，从第 N 个块往后补齐（只追加，章节索引增量更新）；
+# txt 被外部改动或视图已被清空时按历史整体重建。
+# 维护任务清空闲置会话的 txt（drop_view），磁盘上只保留历史中的一份正文。
+#
+# 兼容：txt 文件始终存在（可能落后或为空），普通会话不受影响；
+# `python manage.py block-store off` 补齐所有视图并去掉标记，之后旧的 web_app/server.py 可直接使用。
+
+MARKER_SUFFIX = ".view.json"
+
+_LOCK = threading.RLock()
+
+def marker_path(path: Path) -> Path:
+    return Path(path).with_suffix(MARKER_SUFFIX)
+
+def _stamp(path: Path) -> Optional[list]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def _load(path: Path) -> Optional[dict]:
+    marker = marker_path(path)
+    if not marker.exists():
+        return None
+    try:
+        return codec.read_file(marker)
+    except Exception as e:
+        print(f"Error reading view marker {marker}: {e}")
+        return None
+
+def _write_marker(path: Path, blocks: int, txt_stamp="current", **extra) -> dict:
+    path = Path(path)
+    marker = {
+        "blocks": blocks,
+        "json_stamp": _stamp(path.with_suffix(".json")),
+        "txt_stamp": _stamp(path) if txt_stamp == "current" else txt_stamp,
+        **extra
+    }
+    codec.write_file(marker_path(path), marker)
+    return marker
+
+def is_block_mode(path: Path) -> bool:
+    return marker_path(path).exists()
+
+def is_text_block(block: dict) -> bool:
+    """块是否属于正文：有效且不是用户的 prompt"""
+    return block.get("status") == "active" and block.get("role") != "user"
+
+def _count_blocks(json_path: Path) -> int:
+    return sum(1 for _ in history_store.iter_raw(json_path))
+
+# 视图格式：每个正文块写为 分隔符 + 正文 + "\n"，前面已有正文时分隔符为 "\n"（即块之间空一行），
+# 结果与 discard 重建 txt（"\n\n".join + "\n"）相同。整体重建（_render）与增量补齐（_pending）
+# 都按这一格式生成，视图字节、章节偏移与是否经过重建无关。
+
+def _separator(has_text: bool) -> str:
+    return "\n" if has_text else ""
+
+def _render(json_path: Path, has_text: bool = False) -> Iterable[bytes]:
+    """按历史整体生成视图；has_text 表示前面已有正文（分叉会话的共享前缀）"""
+    for line in history_store.iter_raw(json_path):
+        block = codec.loads(line)
+        if not is_text_block(block):
+            continue
+        yield (_separator(has_text) + block["content"] + "\n").encode("utf-8")
+        has_text = True
+
+def _pending(json_path: Path, skip: int, has_text: bool) -> Iterable[tuple]:
+    """第 skip 个块之后的块，产出 (块, 分隔符)，非正文块的分隔符为 None"""
+    for line in islice(history_store.iter_raw(json_path), skip, None):
+        block = codec.loads(line)
+        if not is_text_block(block):
+            yield block, None
+            continue
+        yield block, _separator(has_text)
+        has_text = True
+
+# --- View ---
+
+def _catch_up(path: Path, marker: dict):
+    json_path = path.with_suffix(".json")
+    stamp_before = _stamp(path)
+    size_before = stamp_before[1]
+    offset = fork_store.prefix_size(path) + size_before
+    blocks = marker["blocks"]
+    pieces, appended = [], []
+    for block, sep in _pending(json_path, blocks, offset > 0):
+        blocks += 1
+        if sep is None:
+            continue
+        appended.append((offset + len(sep), block["content"], block["id"]))
+        data = (sep + block["content"] + "\n").encode("utf-8")
+        pieces.append(data)
+        offset += len(data)
+
+    if pieces:
+        data = b"".join(pieces)
+        with open(path, "ab") as f:
+            f.write(data)
+        username = path.parent.name
+        text_cache.append(username, path, data.decode("utf-8"))
+        chapter_index.on_append_blocks(
+            path, stamp_before, appended, history_loader=lambda: fork_store.load_history(json_path)
+        )
+        # 与 stats_service.reconcile 相同的口径：txt 在磁盘上的大小
+        stats_service.update(username, text_bytes=path.stat().st_size - size_before)
+    _write_marker(path, blocks)
+
+def _rebuild(path: Path):
+    json_path = path.with_suffix(".json")
+    size_before = path.stat().st_size
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        for chunk in _render(json_path, fork_store.prefix_size(path) > 0):
+            f.write(chunk)
+    os.replace(tmp, path)
+    username = path.parent.name
+    text_cache.invalidate(username)
+    chapter_index.rebuild(path, fork_store.load_history(json_path))
+    stats_service.update(username, text_bytes=path.stat().st_size - size_before)
+    _write_marker(path, _count_blocks(json_path))
+    print(f"Rebuilt txt view {path}")
+
+def ensure_view(path: Path) -> bool:
+    """块存储会话读取正文前调用：视图落后时补齐，返回是否改动了 txt"""
+    path = Path(path)
+    if not is_block_mode(path) or not path.exists():
+        return False
+    json_path = path.with_suffix(".json")
+    with _LOCK:
+        marker = _load(path)
+        if not marker:
+            return False
+        json_stamp = _stamp(json_path)
+        if json_stamp is None:
+            print(f"History missing for block-store session {path}, view left as is")
+            return False
+        txt_stamp = _stamp(path)
+        if marker["txt_stamp"] == txt_stamp and marker["json_stamp"] == json_stamp:
+            return False
+        if marker["txt_stamp"] != txt_stamp:
+            _rebuild(path)
+        else:
+            _catch_up(path, marker)
+        return True
+
+def sync(path: Path):
+    """txt 已按完整历史重写（discard、物化）后调用，记录视图为最新"""
+    path = Path(path)
+    if is_block_mode(path):
+        with _LOCK:
+            _write_marker(path, _count_blocks(path.with_suffix(".json")))
+
+def iter_bytes(path: Path) -> Iterable[bytes]:
+    """逻辑正文（同 fork_store.iter_bytes），视图落后时直接由历史生成，不写回 txt"""
+    path = Path(path)
+    marker = _load(path)
+    json_path = path.with_suffix(".json")
+    if not marker or (marker["txt_stamp"] == _stamp(path) and marker["json_stamp"] == _stamp(json_path)):
+        yield from fork_store.iter_bytes(path)
+        return
+    if marker["txt_stamp"] != _stamp(path):
+        prefix = fork_store.prefix_size(path)
+        if prefix:
+            yield from fork_store.iter_bytes(path, 0, prefix)
+        yield from _render(json_path, prefix > 0)
+        return
+    yield from fork_store.iter_bytes(path)
+    for block, sep in _pending(json_path, marker["blocks"], fork_store.size(path) > 0):
+        if sep is not None:
+            yield (sep + block["content"] + "\n").encode("utf-8")
+
+def drop_view(path: Path, dry_run: bool = False) -> Optional[dict]:
+    """清空闲置会话的 txt 视图（保留修改时间），下次读取时按历史重建"""
+    path = Path(path)
+    with _LOCK:
+        marker = _load(path)
+        txt_stamp = _stamp(path)
+        if not marker or not txt_stamp or not txt_stamp[1]:
+            return None
+        # txt 有历史中没有的外部改动时不清空
+        if marker["txt_stamp"] != txt_stamp:
+            return None
+        if dry_run:
+            return {"bytes_before": txt_stamp[1], "bytes_after": 0}
+        with open(path, "wb"):
+            pass
+        os.utime(path, ns=(txt_stamp[0], txt_stamp[0]))
+        chapter_index.index_path(path).unlink(missing_ok=True)
+        stats_service.update(path.parent.name, text_bytes=-txt_stamp[1])
+        _write_marker(path, 0, txt_stamp=None, dropped_size=txt_stamp[1])
+    return {"bytes_before": txt_stamp[1], "bytes_after": 0}
+
+def dropped_size(path: Path) -> int:
+    marker = _load(path)
+    return marker.get("dropped_size", 0) if marker and marker["txt_stamp"] is None else 0
+
+# --- Mode ---
+
+def create(path: Path):
+    """新建的空会话（txt 与 json 已创建）标记为块存储"""
+    with _LOCK:
+        _write_marker(path, _count_blocks(Path(path).with_suffix(".json")))
+
+def enable(path: Path) -> dict:
+    """把已有会话转为块存储。txt 与历史中的正文不一致（忽略空白）时不转换"""
+    path = Path(path)
+    json_path = path.with_suffix(".json")
+    with _LOCK:
+        if is_block_mode(path):
+            return {"status": "skipped", "reason": "already block store"}
+        if not path.exists():
+            return {"status": "skipped", "reason": "txt not found"}
+        text = path.read_text(encoding="utf-8")
+        if not json_path.exists():
+            history = []
+            if text.strip():
+                history.append({
+                    "id": str(uuid.uuid4()),
+                    "timestamp": datetime.datetime.now().isoformat(),
+                    "role": "system",
+                    "content": text.strip(),
+                    "prompt": "Original File Content (Base)",
+                    "status": "active"
+                })
+            history_store.save(json_path, history)
+            stats_service.update(path.parent.name, blocks=len(history))
+        rendered = b"".join(_render(json_path, fork_store.prefix_size(path) > 0)).decode("utf-8")
+        if "".join(text.split()) != "".join(rendered.split()):
+            return {"status": "skipped", "reason": "txt does not match history"}
+        # 只有空白不同（如旧版 save 追加的 "\n\n" 分隔）时按视图格式重写，之后补齐只需追加
+        if text != rendered:
+            _rebuild(path)
+        else:
+            _write_marker(path, _count_blocks(json_path))
+    return {"status": "enabled"}
+
+def disable(path: Path) -> dict:
+    """补齐视图并去掉标记，恢复为普通会话"""
+    path = Path(path)
+    with _LOCK:
+        if not is_block_mode(path):
+            return {"status": "skipped", "reason": "not block store"}
+        if not path.exists():
+            return {"status": "skipped", "reason": "txt not found"}
+        ensure_view(path)
+        marker_path(path).unlink()
+    return {"status": "disabled"}
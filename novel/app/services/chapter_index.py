@@ -0,0 +1,139 @@
+import re
+from pathlib import Path
+from typing import List, Optional
+from app.core import codec
+from app.services import fork_store
+
+# 章节索引：<session>.index.json，与 txt/json 同目录。
+# {
+#     "stamp": [mtime_ns, size],   # 建索引时 txt 的版本戳，不一致即视为过期并重建
+#     "chapters": [{"title": "第1章 ...", "start": 0}],           # 章节标题所在行的字节偏移
+#     "segments": [{"block_id": "...", "role": "assistant", "start": 0, "end": 120}]  # 历史块在 txt 中的字节区间
+# }
+# save 追加时增量更新（只扫描新追加的内容），discard 重写 txt 后整体重建。
+# 章节结束位置 = 下一章开始位置或文件末尾，读取时按字节偏移 seek，不加载整本小说。
+# 偏移均针对逻辑正文（分叉会话包含父会话的共享前缀，见 fork_store），"size" 为逻辑正文长度。
+
+HEADING_PATTERN = re.compile(
+    r"^\s*(第[0-9０-９零一二三四五六七八九十百千万两〇]+[章回节卷集部篇]|chapter\s*\d+)",
+    re.IGNORECASE
+)
+HEADING_MAX_CHARS = 50      # 超过该长度的行不视为标题
+PROLOGUE_TITLE = "开头"     # 第一个标题之前的正文
+RANGE_MAX_BYTES = 1024 * 1024
+
+def index_path(path: Path) -> Path:
+    return Path(path).with_suffix(".index.json")
+
+def _stamp(path: Path) -> list:
+    st = Path(path).stat()
+    return [st.st_mtime_ns, st.st_size]
+
+def _scan_headings(data: bytes, base: int = 0) -> List[dict]:
+    headings = []
+    offset = 0
+    for line in data.split(b"\n"):
+        text = line.decode("utf-8", errors="ignore").strip()
+        if text and len(text) <= HEADING_MAX_CHARS and HEADING_PATTERN.match(text):
+            headings.append({"title": text, "start": base + offset})
+        offset += len(line) + 1
+    return headings
+
+def _add_chapters(index: dict, headings: List[dict], has_leading_text: bool):
+    if not headings:
+        return
+    if not index["chapters"] and has_leading_text and headings[0]["start"] > 0:
+        index["chapters"].append({"title": PROLOGUE_TITLE, "start": 0})
+    index["chapters"].extend(headings)
+
+def _save(path: Path, index: dict):
+    index["stamp"] = _stamp(path)
+    index["size"] = fork_store.size(path)
+    codec.write_file(index_path(path), index)
+
+def rebuild(path: Path, history: List[dict]) -> dict:
+    """根据 txt 全文与历史块重建索引"""
+    path = Path(path)
+    data = fork_store.read_bytes(path) if path.exists() else b""
+    index = {"chapters": [], "segments": []}
+
+    headings = _scan_headings(data)
+    _add_chapters(index, headings, bool(headings) and bool(data[:headings[0]["start"]].strip()))
+
+    # 按顺序在 txt 中定位每个有效块；用户 prompt 块不写入 txt，跳过，
+    # 否则 prompt 恰好是后续正文的子串时会错位并漏掉真正的正文块
+    cursor = 0
+    for block in history:
+        if block.get("status") != "active" or block.get("role") == "user":
+            continue
+        content = block.get("content", "").encode("utf-8")
+        pos = data.find(content, cursor)
+        if pos < 0:
+            continue
+        index["segments"].append({"block_id": block["id"], "role": block.get("role"), "start": pos, "end": pos + len(content)})
+        cursor = pos + len(content)
+
+    if path.exists():
+        _save(path, index)
+    return index
+
+def _load(path: Path) -> Optional[dict]:
+    try:
+        return codec.read_file(index_path(path))
+    except Exception:
+        return None
+
+def on_append(path: Path, stamp_before: Optional[list], offset: int, content: str, block_id: str,
+              history_loader):
+    """
+    save 追加后调用。offset 为 content 在 txt 中的起始字节位置。
+    索引与追加前的 txt 不一致（缺失、外部改动）时退化为全量重建。
+    """
+    on_append_blocks(path, stamp_before, [(offset, content, block_id)], history_loader)
+
+def on_append_blocks(path: Path, stamp_before: Optional[list], appended: List[tuple], history_loader):
+    """一次追加了多个块时调用，appended 为 [(offset, content, block_id)]"""
+    index = _load(path)
+    if index is None or stamp_before is None or index.get("stamp") != stamp_before:
+        rebuild(path, history_loader())
+        return
+
+    for offset, content, block_id in appended:
+        data = content.encode("utf-8")
+        _add_chapters(index, _scan_headings(data, offset), offset > 0)
+        index["segments"].append({"block_id": block_id, "role": "assistant", "start": offset, "end": offset + len(data)})
+    _save(path, index)
+
+def get(path: Path, history_loader) -> dict:
+    """读取索引，过期时重建"""
+    path = Path(path)
+    if not path.exists():
+        return {"chapters": [], "segments": [], "size": 0}
+    index = _load(path)
+    if index is None or index.get("stamp") != _stamp(path) or "size" not in index:
+        index = rebuild(path, history_loader())
+    size = index["size"]
+
+    chapters = []
+    for i, chapter in enumerate(index["chapters"]):
+        end = index["chapters"][i + 1]["start"] if i + 1 < len(index["chapters"]) else size
+        chapters.append({"index": i, "title": chapter["title"], "start": chapter["start"], "end": end})
+    return {"chapters": chapters, "segments": index["segments"], "size": size}
+
+def read_range(path: Path, start: int, end: int, max_bytes: Optional[int] = RANGE_MAX_BYTES) -> dict:
+    """读取 [start, end) 字节区间，边界自动对齐到完整字符"""
+    path = Path(path)
+    size = fork_store.size(path)
+    start = max(0, min(start, size))
+    end = max(start, min(end, size))
+    if max_bytes:
+        end = min(end, start + max_bytes)
+    # 多读 3 个字节，用于把结束位置后移到字符边界
+    data = fork_store.read_bytes(path, start, min(size, end + 3))
+    lo, hi = 0, end - start
+    while lo < len(data) and data[lo] & 0xC0 == 0x80:
+        lo += 1
+    while hi < len(data) and data[hi] & 0xC0 == 0x80:
+        hi += 1
+    hi = max(lo, hi)
+    return {"start": start + lo, "end": start + hi, "size": size, "content": data[lo:hi].decode("utf-8", errors="replace")}
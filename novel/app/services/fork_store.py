@@ -0,0 +1,196 @@
+import os
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+from app.core import codec
+from app.services import history_store, stats_service, search_service
+
+# 写时复制的会话分叉。子会话只保存分叉之后新增的内容，外加一个引用文件
+# <child>.fork.json：
+# {
+#     "parent": "20260101_120000.txt",  # 同目录下的父会话
+#     "block_id": "...",                # 从哪个块分叉
+#     "prefix_blocks": 12,              # 共享父会话逻辑历史的前 N 个块
+#     "prefix_bytes": 40960             # 共享父会话逻辑正文的前 N 个字节
+# }
+# 子会话的逻辑正文 = 父会话逻辑正文[:prefix_bytes] + 自身 txt，逻辑历史同理；父会话本身也可以是分叉。
+# 父会话只追加时共享前缀不变；discard 会重写父会话 txt，此时前缀会变化的子会话先物化
+# （把共享部分拷贝进子会话并去掉引用）。子会话 discard 前缀中的块时同样先物化自身。
+
+READ_CHUNK = 1024 * 1024
+
+def fork_path(path: Path) -> Path:
+    return Path(path).with_suffix(".fork.json")
+
+def fork_ref(path: Path) -> Optional[dict]:
+    ref_path = fork_path(path)
+    if not ref_path.exists():
+        return None
+    try:
+        return codec.read_file(ref_path)
+    except Exception as e:
+        print(f"Error reading fork ref {ref_path}: {e}")
+        return None
+
+def parent_path(path: Path, ref: dict) -> Path:
+    return Path(path).parent / ref["parent"]
+
+def list_children(path: Path) -> List[Tuple[Path, dict]]:
+    path = Path(path)
+    children = []
+    for ref_path in path.parent.glob("*.fork.json"):
+        child = ref_path.with_name(ref_path.name[:-len(".fork.json")] + ".txt")
+        ref = fork_ref(child)
+        if ref and ref["parent"] == path.name:
+            children.append((child, ref))
+    return children
+
+# --- Text ---
+
+def _segments(path: Path) -> List[Tuple[Path, int, int]]:
+    """逻辑正文由哪些 (文件, 偏移, 长度) 片段依次拼成"""
+    path = Path(path)
+    own_size = path.stat().st_size if path.exists() else 0
+    ref = fork_ref(path)
+    if not ref:
+        return [(path, 0, own_size)]
+
+    parent = parent_path(path, ref)
+    if not parent.exists():
+        print(f"Fork parent missing: {parent}")
+    segments = []
+    remaining = ref["prefix_bytes"]
+    for file, offset, length in _segments(parent):
+        if remaining <= 0:
+            break
+        take = min(length, remaining)
+        segments.append((file, offset, take))
+        remaining -= take
+    segments.append((path, 0, own_size))
+    return segments
+
+def size(path: Path) -> int:
+    return sum(length for _, _, length in _segments(path))
+
+def prefix_size(path: Path) -> int:
+    """逻辑正文中来自父会话的字节数"""
+    return sum(length for _, _, length in _segments(path)[:-1])
+
+def iter_bytes(path: Path, start: int = 0, end: Optional[int] = None) -> Iterable[bytes]:
+    pos = 0
+    for file, offset, length in _segments(path):
+        seg_start, seg_end = pos, pos + length
+        pos = seg_end
+        lo = max(start, seg_start)
+        hi = seg_end if end is None else min(end, seg_end)
+        if lo >= hi:
+            continue
+        with open(file, "rb") as f:
+            f.seek(offset + lo - seg_start)
+            remaining = hi - lo
+            while remaining > 0:
+                data = f.read(min(READ_CHUNK, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+def read_bytes(path: Path, start: int = 0, end: Optional[int] = None) -> bytes:
+    return b"".join(iter_bytes(path, start, end))
+
+def read_text(path: Path) -> str:
+    return read_bytes(path).decode("utf-8")
+
+# --- History ---
+
+def iter_history_raw(json_path: Path) -> Iterable[bytes]:
+    json_path = Path(json_path)
+    ref = fork_ref(json_path.with_suffix(".txt"))
+    if ref:
+        parent_json = parent_path(json_path, ref).with_suffix(".json")
+        yield from islice(iter_history_raw(parent_json), ref["prefix_blocks"])
+    yield from history_store.iter_raw(json_path)
+
+def load_history(json_path: Path) -> List[dict]:
+    return [codec.loads(line) for line in iter_history_raw(json_path)]
+
+def iter_history_bytes(json_path: Path) -> Iterable[bytes]:
+    """逻辑历史按 history_store 的按行格式输出"""
+    first = True
+    for line in iter_history_raw(json_path):
+        yield (b"[\n" if first else b",\n") + line
+        first = False
+    yield b"[]\n" if first else b"\n]\n"
+
+def last_block(json_path: Path) -> Optional[dict]:
+    json_path = Path(json_path)
+    block = history_store.last_block(json_path)
+    ref = fork_ref(json_path.with_suffix(".txt"))
+    if block or not ref:
+        return block
+    last = None
+    for last in islice(iter_history_raw(parent_path(json_path, ref).with_suffix(".json")), ref["prefix_blocks"]):
+        pass
+    return codec.loads(last) if last else None
+
+# --- Maintenance ---
+
+def materialize(path: Path):
+    """把共享前缀拷贝进子会话，去掉对父会话的引用（逻辑内容不变）"""
+    path = Path(path)
+    ref = fork_ref(path)
+    if not ref:
+        return
+    # 延迟导入，避免 block_store -> fork_store 循环引用
+    from app.services import block_store
+    block_store.ensure_view(path)
+    json_path = path.with_suffix(".json")
+    size_before = path.stat().st_size if path.exists() else 0
+    blocks_before = sum(1 for _ in history_store.iter_raw(json_path))
+
+    tmp_txt = path.with_suffix(".txt.tmp")
+    with open(tmp_txt, "wb") as f:
+        for chunk in iter_bytes(path):
+            f.write(chunk)
+    tmp_json = path.with_suffix(".json.tmp")
+    with open(tmp_json, "wb") as f:
+        for chunk in iter_history_bytes(json_path):
+            f.write(chunk)
+    os.replace(tmp_json, json_path)
+    os.replace(tmp_txt, path)
+    fork_path(path).unlink()
+    block_store.sync(path)
+
+    stats_service.update(
+        path.parent.name,
+        text_bytes=path.stat().st_size - size_before,
+        blocks=sum(1 for _ in history_store.iter_raw(json_path)) - blocks_before
+    )
+    search_service.reindex_session(path.parent.name, path)
+    print(f"Materialized fork {path} (parent {ref['parent']})")
+
+def detach_children(path: Path, changed_index: int, new_own_text: bytes):
+    """
+    path 的 txt 即将被重写（discard）。changed_index 为被修改块在逻辑历史中的序号，
+    new_own_text 为重写后 path 自身 txt 的内容。共享前缀会变化的子会话先物化。
+    """
+    children = list_children(path)
+    if not children:
+        return
+    own_prefix = prefix_size(path)
+    for child, ref in children:
+        unchanged = changed_index >= ref["prefix_blocks"]
+        if unchanged and ref["prefix_bytes"] > own_prefix:
+            old_tail = read_bytes(path, own_prefix, ref["prefix_bytes"])
+            unchanged = new_own_text[:ref["prefix_bytes"] - own_prefix] == old_tail
+        if not unchanged:
+            materialize(child)
+
+def on_renamed(old_path: Path, new_path: Path):
+    """会话改名：移动自身的引用文件，并更新子会话指向父会话的文件名"""
+    old_path, new_path = Path(old_path), Path(new_path)
+    if fork_path(old_path).exists():
+        fork_path(old_path).rename(fork_path(new_path))
+    for child, ref in list_children(old_path):
+        ref["parent"] = new_path.name
+        codec.write_file(fork_path(child), ref)
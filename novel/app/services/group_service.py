@@ -1,24 +1,51 @@
-import json
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from app.core.config import GROUPS_FILE
+from app.core import codec
 from app.models.schemas import Group, GroupCreate
 
+# 生成档位：组内 generation_profile 未设置的项取这里的值（见 get_generation_profile）
+DEFAULT_GENERATION_PROFILE = {
+    "max_tokens": {"continuation": 10000, "outline": 50000},
+    "temperature": 0.9,
+    "top_p": 1.0,
+    "stream": True,
+    "allowed_models": None
+}
+
 # 默认组配置
 DEFAULT_GROUPS = {
     "default": {
         "name": "default",
         "description": "默认用户组",
-        "allow_free_mode": False
+        "allow_free_mode": False,
+        "requests_per_minute": 10,
+        "group_requests_per_minute": None,
+        "max_concurrent_streams": 2,
+        "daily_token_limit": 2000000,
+        "speculative_generation": False,
+        "generation_profile": None
     },
     "vip": {
         "name": "vip",
         "description": "VIP用户组",
-        "allow_free_mode": True
+        "allow_free_mode": True,
+        "requests_per_minute": 30,
+        "group_requests_per_minute": None,
+        "max_concurrent_streams": 4,
+        "daily_token_limit": 10000000,
+        "speculative_generation": False,
+        "generation_profile": None
     },
     "admin": {
         "name": "admin",
         "description": "管理员组",
-        "allow_free_mode": True
+        "allow_free_mode": True,
+        "requests_per_minute": None,
+        "group_requests_per_minute": None,
+        "max_concurrent_streams": None,
+        "daily_token_limit": None,
+        "speculative_generation": False,
+        "generation_profile": None
     }
 }
 
@@ -28,12 +55,12 @@ def get_groups_db() -> dict:
         save_groups_db(DEFAULT_GROUPS)
         return DEFAULT_GROUPS
     try:
-        return json.loads(GROUPS_FILE.read_text(encoding='utf-8'))
+        return codec.read_file(GROUPS_FILE)
     except:
         return {}
 
 def save_groups_db(db: dict):
-    GROUPS_FILE.write_text(json.dumps(db, indent=2, ensure_ascii=False), encoding='utf-8')
+    codec.write_file(GROUPS_FILE, db, atomic=True)
 
 def get_group(group_name: str) -> Optional[dict]:
     groups = get_groups_db()
@@ -49,6 +76,28 @@ def create_group(group: GroupCreate) -> dict:
     save_groups_db(groups)
     return group_data
 
+def create_groups(new_groups: List[GroupCreate], allow_partial: bool = False) -> Tuple[List[dict], int]:
+    """批量创建用户组，只写一次 groups.json；默认有失败项时整体不生效"""
+    groups = get_groups_db()
+    results = []
+    for group in new_groups:
+        if group.name in groups:
+            results.append({"name": group.name, "ok": False, "error": f"Group {group.name} already exists"})
+            continue
+        groups[group.name] = group.dict()
+        results.append({"name": group.name, "ok": True})
+
+    ok_count = sum(1 for item in results if item["ok"])
+    if ok_count < len(results) and not allow_partial:
+        for item in results:
+            if item["ok"]:
+                item["ok"] = False
+                item["error"] = "批量操作中有失败项，已整体回滚"
+        return results, 0
+    if ok_count:
+        save_groups_db(groups)
+    return results, ok_count
+
 def list_groups() -> List[dict]:
     groups = get_groups_db()
     return list(groups.values())
@@ -62,3 +111,11 @@ def can_use_free_mode(group_name: str) -> bool:
         return default_group.get("allow_free_mode", False) if default_group else False
 
     return group.get("allow_free_mode", False)
+
+def get_generation_profile(group_name: str) -> dict:
+    """组的生成档位，未配置的项（包括 max_tokens 中未列出的任务）使用默认值"""
+    group = get_group(group_name) or get_group("default") or {}
+    custom = group.get("generation_profile") or {}
+    profile = {**DEFAULT_GENERATION_PROFILE, **custom}
+    profile["max_tokens"] = {**DEFAULT_GENERATION_PROFILE["max_tokens"], **(custom.get("max_tokens") or {})}
+    return profile
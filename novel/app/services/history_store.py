@@ -0,0 +1,176 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from app.core import codec
+
+TAIL_CHUNK = 64 * 1024
+
+# 会话历史（<session>.json）的统一读写。
+# 文件仍是一个合法的 JSON 数组，但每个块单独占一行：
+#   [
+#   {"id": "...", "role": "assistant", ...},
+#   {"id": "...", "role": "user", ...}
+#   ]
+# 分页读取时只需按行跳过，只解析落在当前页的块，不必解析整个文件。
+# 旧格式（indent=2 或单行）的文件读取时整体解析，下次写入时自动转为按行格式。
+# 因此 save 忽略 JSON_STORAGE_PRETTY：缩进输出会破坏按行分页和 append 的原地追加。
+#
+# 会话锁：save / discard 与后台存储维护（压缩、冷存储，在线程中运行）修改同一会话时互斥，
+# 见 session_lock。锁只在本进程内有效。
+
+_SESSION_LOCKS: Dict[str, threading.RLock] = {}
+_SESSION_LOCKS_GUARD = threading.Lock()
+
+def session_lock(path) -> threading.RLock:
+    """会话（txt 或其历史 json 路径均可）的进程内锁，可重入"""
+    key = str(Path(path).with_suffix(""))
+    with _SESSION_LOCKS_GUARD:
+        lock = _SESSION_LOCKS.get(key)
+        if lock is None:
+            lock = _SESSION_LOCKS[key] = threading.RLock()
+        return lock
+
+def _is_line_format(head: bytes) -> bool:
+    return head.startswith(b"[\n{") or head.startswith(b"[\r\n{")
+
+def load(json_path: Path) -> List[dict]:
+    json_path = Path(json_path)
+    if not json_path.exists():
+        return []
+    return codec.loads(json_path.read_bytes() or b"[]")
+
+def save(json_path: Path, history: List[dict]):
+    lines = [codec.dumpb(block) for block in history]
+    data = b"[\n" + b",\n".join(lines) + b"\n]\n" if lines else b"[]\n"
+    Path(json_path).write_bytes(data)
+
+def append(json_path: Path, blocks: List[dict]):
+    """
+    在末尾追加块。按行格式的文件原地改写结尾的 "\\n]\\n"，写入量只与新块大小有关；
+    文件不存在、为空数组或是旧格式时整体读出再写回（同时转为按行格式）。
+    """
+    if not blocks:
+        return
+    json_path = Path(json_path)
+    data = b",\n".join(codec.dumpb(block) for block in blocks)
+    if json_path.exists():
+        with open(json_path, "r+b") as f:
+            head = f.read(4)
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if _is_line_format(head) and size >= 7:
+                f.seek(size - 3)
+                if f.read(3) == b"\n]\n":
+                    f.seek(size - 3)
+                    f.write(b",\n" + data + b"\n]\n")
+                    return
+    save(json_path, load(json_path) + list(blocks))
+
+def _iter_lines(json_path: Path) -> Optional[Iterable[bytes]]:
+    """按行格式时逐行产出块的原始 JSON；旧格式返回 None"""
+    with open(json_path, "rb") as f:
+        if not _is_line_format(f.read(4)):
+            return None
+    def lines():
+        with open(json_path, "rb") as f:
+            f.readline()  # "["
+            for line in f:
+                line = line.rstrip(b"\r\n").rstrip(b",")
+                if line and line != b"]":
+                    yield line
+    return lines()
+
+def _project(block: dict, fields: Optional[List[str]]) -> dict:
+    if not fields:
+        return block
+    item = {key: block[key] for key in fields if key in block}
+    if "content_length" in fields:
+        item["content_length"] = len(block.get("content", ""))
+    return item
+
+def iter_raw(json_path: Path) -> Iterable[bytes]:
+    """逐个产出块的原始 JSON（旧格式文件整体解析后重新编码）"""
+    json_path = Path(json_path)
+    if not json_path.exists():
+        return
+    lines = _iter_lines(json_path)
+    if lines is None:
+        for block in load(json_path):
+            yield codec.dumpb(block)
+    else:
+        yield from lines
+
+def paginate(lines: Iterable[bytes], cursor: Optional[int] = None, limit: int = 50,
+             include_discarded: bool = True, fields: Optional[List[str]] = None,
+             reverse: bool = False) -> dict:
+    """
+    按块序号分页。lines 为块的原始 JSON 序列，只解析落在当前页的块。
+      cursor   从该序号开始读取（正序默认 0，倒序默认最后一个块）
+      reverse  从新到旧读取
+      fields   只返回指定字段；可包含 content_length（正文字数）
+    返回 {"items", "next_cursor", "total"}，next_cursor 为 None 表示已读完。
+    每个 item 带有 index 字段，即其在完整历史中的序号。
+    """
+    items = []
+    next_cursor = None
+
+    def take(i: int, line: bytes):
+        block = codec.loads(line)
+        if include_discarded or block.get("status") != "discarded":
+            items.append({"index": i, **_project(block, fields)})
+
+    if reverse:
+        # 倒序需要知道总数才能定位，读出全部行（仍然不解析）
+        raw = list(lines)
+        total = len(raw)
+        start = total - 1 if cursor is None else min(cursor, total - 1)
+        for i in range(start, -1, -1):
+            if len(items) >= limit:
+                next_cursor = i
+                break
+            take(i, raw[i])
+        return {"items": items, "next_cursor": next_cursor, "total": total}
+
+    # 正序：页外的行只计数不解析
+    start = cursor or 0
+    total = 0
+    for i, line in enumerate(lines):
+        total = i + 1
+        if i < start or next_cursor is not None:
+            continue
+        if len(items) >= limit:
+            next_cursor = i
+            continue
+        take(i, line)
+    return {"items": items, "next_cursor": next_cursor, "total": total}
+
+def read_page(json_path: Path, cursor: Optional[int] = None, limit: int = 50,
+              include_discarded: bool = True, fields: Optional[List[str]] = None,
+              reverse: bool = False) -> dict:
+    return paginate(iter_raw(json_path), cursor, limit, include_discarded, fields, reverse)
+
+def last_block(json_path: Path) -> Optional[dict]:
+    """只读取文件末尾的最后一个块（会话列表的预览用）"""
+    json_path = Path(json_path)
+    if not json_path.exists():
+        return None
+    with open(json_path, "rb") as f:
+        line_format = _is_line_format(f.read(4))
+        if line_format:
+            f.seek(0, 2)
+            pos = f.tell()
+            tail = b""
+            # 从末尾向前读，直到拿到完整的最后一行
+            while pos > 0:
+                step = min(TAIL_CHUNK, pos)
+                pos -= step
+                f.seek(pos)
+                tail = f.read(step) + tail
+                lines = tail.rstrip().split(b"\n")
+                if len(lines) >= 3:
+                    break
+            last = lines[-2].rstrip(b"\r").rstrip(b",") if len(lines) >= 2 else b""
+            return codec.loads(last) if last.startswith(b"{") else None
+    history = load(json_path)
+    return history[-1] if history else None
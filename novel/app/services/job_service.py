@@ -0,0 +1,316 @@
+import time
+import uuid
+import asyncio
+import datetime
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+from app.core.config import (
+    JOBS_ROOT, JOB_WORKERS, MAX_PENDING_JOBS_PER_USER, MAX_RUNNING_JOBS_PER_USER,
+    JOB_DEFER_SECONDS, JOB_RETENTION_DAYS
+)
+from app.core import codec
+from app.models.schemas import OutlineRequest
+from app.services import novel_service, usage_service, rate_limit_service, metrics
+from app.services.rate_limit_service import RateLimitExceeded
+from app.services.user_manager import get_user_config
+
+# 后台任务：生成/大纲在独立的 worker 中执行，不依赖发起请求的 HTTP 连接。
+# 每个任务持久化为 JOBS_ROOT/<job_id>.json，服务重启后：
+#   queued  -> 重新入队
+#   running -> 标记为 failed（保留已生成的部分内容）
+#   已结束   -> 保留 JOB_RETENTION_DAYS 天，作为只读记录载入，任务列表中仍可查看
+# worker 是所有用户共享的：每个用户同时执行的任务不超过 MAX_RUNNING_JOBS_PER_USER，
+# 执行中的任务占用该用户的一个并发名额（与 /generate 共用 max_concurrent_streams）。
+# 超出时任务延后 JOB_DEFER_SECONDS 秒重新排到队尾，worker 先处理其他用户的任务。
+
+JOB_TYPES = ("generate", "outline")
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINAL_STATUSES = (STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED)
+
+CHECKPOINT_INTERVAL = 5.0  # 秒，运行中任务落盘部分输出的间隔
+
+class Job:
+    def __init__(self, record: dict):
+        self.record = record
+        self.chunks: List[str] = [record["output"]] if record.get("output") else []
+        self.output_len = len(record.get("output", ""))
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_requested = False
+
+    @property
+    def output(self) -> str:
+        if len(self.chunks) > 1:
+            self.chunks = ["".join(self.chunks)]
+        return self.chunks[0] if self.chunks else ""
+
+    async def append(self, text: str):
+        self.chunks.append(text)
+        self.output_len += len(text)
+        self.record["progress_chars"] = self.output_len
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    def public(self, include_output: bool = False) -> dict:
+        data = {k: v for k, v in self.record.items() if k != "output"}
+        if include_output:
+            data["output"] = self.output
+        return data
+
+JOBS: Dict[str, Job] = {}
+_QUEUE: Optional[asyncio.Queue] = None
+_WORKERS: List[asyncio.Task] = []
+_RUNNING: Dict[str, int] = defaultdict(int)     # 用户名 -> 正在执行的任务数
+_DEFERRED: Set[asyncio.TimerHandle] = set()
+
+# --- Persistence ---
+
+def _job_path(job_id: str):
+    return JOBS_ROOT / f"{job_id}.json"
+
+def _persist(job: Job):
+    data = dict(job.record)
+    data["output"] = job.output
+    codec.write_file(_job_path(data["id"]), data)
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat()
+
+def recover_jobs():
+    """启动时恢复任务状态，并清理过期的已结束任务"""
+    expire_before = time.time() - JOB_RETENTION_DAYS * 86400
+    for path in JOBS_ROOT.glob("*.json"):
+        try:
+            record = codec.read_file(path)
+        except Exception as e:
+            print(f"Error reading job {path}: {e}")
+            continue
+
+        if record["status"] in FINAL_STATUSES and path.stat().st_mtime < expire_before:
+            path.unlink()
+            continue
+
+        job = Job(record)
+        JOBS[record["id"]] = job
+        if record["status"] == STATUS_RUNNING:
+            record["status"] = STATUS_FAILED
+            record["error"] = "服务重启，任务中断"
+            record["finished_at"] = _now()
+            _persist(job)
+            metrics.inc("jobs_total", type=record["type"], status=STATUS_FAILED)
+
+# --- Workers ---
+
+def start_workers():
+    global _QUEUE
+    _QUEUE = asyncio.Queue()
+    # 恢复的排队任务按创建时间重新入队
+    queued = [job for job in JOBS.values() if job.record["status"] == STATUS_QUEUED]
+    for job in sorted(queued, key=lambda j: j.record["created_at"]):
+        _QUEUE.put_nowait(job.record["id"])
+    for _ in range(JOB_WORKERS):
+        _WORKERS.append(asyncio.create_task(_worker()))
+
+async def stop_workers():
+    for handle in _DEFERRED:
+        handle.cancel()
+    _DEFERRED.clear()
+    for worker in _WORKERS:
+        worker.cancel()
+    await asyncio.gather(*_WORKERS, return_exceptions=True)
+    _WORKERS.clear()
+
+def _defer(job_id: str):
+    def requeue():
+        _DEFERRED.discard(handle)
+        _QUEUE.put_nowait(job_id)
+    handle = asyncio.get_running_loop().call_later(JOB_DEFER_SECONDS, requeue)
+    _DEFERRED.add(handle)
+
+def _admit(username: str) -> bool:
+    """用户未达运行上限且有空闲并发名额时占用一个名额，返回是否可以执行"""
+    if _RUNNING[username] >= MAX_RUNNING_JOBS_PER_USER:
+        return False
+    try:
+        rate_limit_service.acquire_stream(username)
+    except RateLimitExceeded:
+        return False
+    _RUNNING[username] += 1
+    return True
+
+def _release(username: str):
+    _RUNNING[username] = max(0, _RUNNING[username] - 1)
+    rate_limit_service.release_stream(username)
+
+async def _worker():
+    while True:
+        job_id = await _QUEUE.get()
+        job = JOBS.get(job_id)
+        if not job or job.record["status"] != STATUS_QUEUED:
+            continue
+        username = job.record["username"]
+        if not _admit(username):
+            metrics.inc("jobs_deferred_total", type=job.record["type"])
+            _defer(job_id)
+            continue
+        job.task = asyncio.current_task()
+        try:
+            await _run_job(job)
+        except Exception as e:
+            _finish(job, STATUS_FAILED, str(e))
+            await job.notify()
+        except asyncio.CancelledError:
+            if not job.cancel_requested:
+                # 服务关闭：保持与重启恢复一致，标记为失败后退出
+                _finish(job, STATUS_FAILED, "服务关闭，任务中断")
+                await job.notify()
+                raise
+            # 用户取消只结束当前任务，worker 继续服务
+            _finish(job, STATUS_CANCELLED)
+            await job.notify()
+            asyncio.current_task().uncancel()
+        finally:
+            job.task = None
+            _release(username)
+
+def _finish(job: Job, status: str, error: str = ""):
+    job.record["status"] = status
+    job.record["finished_at"] = _now()
+    if error:
+        job.record["error"] = error
+    _persist(job)
+    metrics.inc("jobs_total", type=job.record["type"], status=status)
+
+async def _run_job(job: Job):
+    record = job.record
+    username = record["username"]
+    params = record["params"]
+
+    record["status"] = STATUS_RUNNING
+    record["started_at"] = _now()
+
+    if record["type"] == "outline":
+        req = OutlineRequest(**params["outline"])
+        config, messages, target_path = novel_service.prepare_outline(username, req)
+        record["target_path"] = str(target_path)
+        prompt = f"[大纲] 主角:{req.protagonist} 风格:{req.style}"
+        stream = novel_service.stream_outline(config, messages, usage_service.usage_recorder(username))
+    else:
+        config, messages = novel_service.prepare_generate(username, params.get("user_prompt"), record["target_path"])
+        prompt = params.get("user_prompt") or ""
+        stream = novel_service.stream_continuation(config, messages, usage_service.usage_recorder(username))
+
+    _persist(job)
+    await job.notify()
+
+    last_checkpoint = time.monotonic()
+    try:
+        async for text in stream:
+            await job.append(text)
+            if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                _persist(job)
+                last_checkpoint = time.monotonic()
+    except Exception as e:
+        _finish(job, STATUS_FAILED, str(e))
+        await job.notify()
+        return
+
+    # 结果写入会话（与前端“采纳”等价）
+    try:
+        if job.output:
+            record["block_id"] = novel_service.save_novel_content(username, job.output, prompt, record["target_path"])
+        _finish(job, STATUS_COMPLETED)
+    except Exception as e:
+        _finish(job, STATUS_FAILED, f"保存失败: {e}")
+    await job.notify()
+
+# --- Public API ---
+
+def submit_job(username: str, job_type: str, user_prompt: str = None, outline: dict = None) -> dict:
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type: {job_type}")
+    if job_type == "outline" and not outline:
+        raise ValueError("Missing outline parameters")
+
+    pending = [j for j in JOBS.values()
+               if j.record["username"] == username and j.record["status"] not in FINAL_STATUSES]
+    if len(pending) >= MAX_PENDING_JOBS_PER_USER:
+        raise ValueError(f"未完成的任务过多（上限 {MAX_PENDING_JOBS_PER_USER}）")
+
+    # 续写任务绑定提交时的会话，之后切换会话不影响结果写入位置
+    target_path = ""
+    if job_type == "generate":
+        target_path = get_user_config(username)["file_path"]
+
+    record = {
+        "id": uuid.uuid4().hex,
+        "username": username,
+        "type": job_type,
+        "status": STATUS_QUEUED,
+        "params": {"user_prompt": user_prompt, "outline": outline},
+        "target_path": target_path,
+        "progress_chars": 0,
+        "block_id": "",
+        "error": "",
+        "created_at": _now(),
+        "started_at": "",
+        "finished_at": "",
+    }
+    job = Job(record)
+    JOBS[record["id"]] = job
+    _persist(job)
+    _QUEUE.put_nowait(record["id"])
+    metrics.inc("jobs_submitted_total", type=job_type)
+    return job.public()
+
+def get_job(username: str, job_id: str) -> Job:
+    job = JOBS.get(job_id)
+    if not job:
+        path = _job_path(job_id)
+        if path.exists():
+            job = Job(codec.read_file(path))
+    if not job or job.record["username"] != username:
+        raise FileNotFoundError("Job not found")
+    return job
+
+def list_jobs(username: str) -> List[dict]:
+    jobs = [j.public() for j in JOBS.values() if j.record["username"] == username]
+    jobs.sort(key=lambda x: x["created_at"], reverse=True)
+    return jobs
+
+def cancel_job(username: str, job_id: str) -> dict:
+    job = get_job(username, job_id)
+    if job.record["status"] == STATUS_QUEUED:
+        _finish(job, STATUS_CANCELLED)
+    elif job.record["status"] == STATUS_RUNNING and job.task:
+        job.cancel_requested = True
+        job.task.cancel()
+    return job.public()
+
+async def stream_job(job: Job, offset: int = 0):
+    """从 offset（字符）开始输出任务内容，直到任务结束；可断线后带 offset 续传"""
+    while True:
+        async with job.changed:
+            output = job.output
+            if offset < len(output):
+                chunk = output[offset:]
+                offset = len(output)
+            else:
+                chunk = ""
+                if job.record["status"] not in FINAL_STATUSES:
+                    await job.changed.wait()
+                    continue
+        if chunk:
+            yield chunk
+            continue
+        if job.record["status"] == STATUS_FAILED:
+            yield f"\n[ERROR: {job.record.get('error', '')}]"
+        return
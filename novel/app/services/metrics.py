@@ -0,0 +1,28 @@
+import threading
+from collections import defaultdict
+from typing import Dict
+
+# 进程内的简单指标：计数器与瞬时值，通过 /api/admin/metrics 查看
+# 指标键形如 name{label=value,...}
+
+_LOCK = threading.Lock()
+COUNTERS: Dict[str, float] = defaultdict(float)
+GAUGES: Dict[str, float] = {}
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+def inc(name: str, value: float = 1, **labels):
+    with _LOCK:
+        COUNTERS[_key(name, labels)] += value
+
+def set_gauge(name: str, value: float, **labels):
+    with _LOCK:
+        GAUGES[_key(name, labels)] = value
+
+def snapshot() -> dict:
+    with _LOCK:
+        return {"counters": dict(COUNTERS), "gauges": dict(GAUGES)}
@@ -0,0 +1,262 @@
+import os
+import re
+import time
+import uuid
+import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Optional
+from app.core.config import DEFAULT_API_CONFIG
+from app.core import codec
+from app.services import history_store
+from app.services.user_manager import normalize_prompts
+
+# 旧版 web_app/server.py 数据目录迁移到新版布局（见 `python manage.py migrate`）。
+# 两者目录结构相同：users.json、configs/、prompt_data/、data/<username>/*.txt + *.json，
+# 迁移时逐项校验并整理：
+#   users.json    合并到目标，缺少 group 的补为 default；目标中已有的用户（账号或数据目录，
+#                 且不是本迁移此前加入的）整个跳过，不写入其配置、prompts 与会话，记入问题列表
+#   configs/      只保留 base_url / api_key / model / file_path，file_path 改写到目标根目录
+#   prompt_data/  按 user_manager.normalize_prompts 整理（hidden_freecreate_prompt 迁移等）
+#   data/         txt 校验 UTF-8；历史 json 校验后补齐缺失字段，转为按行格式（history_store）
+# 按用户分配到进程池并行处理，每个文件先写临时文件再替换，保留原修改时间（会话列表按其排序）。
+# 每完成一个用户记录到目标根目录的 migration_state.json，中断后重新执行会跳过已完成的用户；
+# 未完成的用户整体重做（写入是幂等的）。本迁移加入的用户记在 state["added"] 中，
+# 重新执行（包括 --restart）时不会被当作目标中已有的用户。问题文件与吞吐量写入 migration_report.json。
+
+STATE_FILE = "migration_state.json"
+REPORT_FILE = "migration_report.json"
+BASE_CONFIG_KEYS = ["base_url", "api_key", "model", "file_path"]
+
+def _write_bytes(path: Path, data: bytes, mtime_ns: Optional[int] = None):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def _normalize_history(history, problems: list, name: str) -> Optional[list]:
+    """校验历史块并补齐字段；整体格式不对返回 None"""
+    if not isinstance(history, list):
+        problems.append({"file": name, "problem": "history is not a list"})
+        return None
+    blocks = []
+    for i, block in enumerate(history):
+        if not isinstance(block, dict) or not isinstance(block.get("content"), str):
+            problems.append({"file": name, "problem": f"block {i} dropped: missing content"})
+            continue
+        block.setdefault("id", str(uuid.uuid4()))
+        block.setdefault("role", "assistant")
+        block.setdefault("status", "active")
+        block.setdefault("timestamp", "")
+        block.setdefault("prompt", "")
+        blocks.append(block)
+    return blocks
+
+def _migrate_session(txt: Path, target_dir: Path, problems: list) -> int:
+    """迁移一个会话（txt 与同名 json），返回写入的字节数"""
+    st = txt.stat()
+    raw = txt.read_bytes()
+    try:
+        raw.decode("utf-8")
+    except UnicodeDecodeError:
+        problems.append({"file": txt.name, "problem": "txt is not valid UTF-8, invalid bytes replaced"})
+        raw = raw.decode("utf-8", errors="replace").encode("utf-8")
+    _write_bytes(target_dir / txt.name, raw, st.st_mtime_ns)
+    written = len(raw)
+
+    json_path = txt.with_suffix(".json")
+    if not json_path.exists():
+        return written
+    json_st = json_path.stat()
+    try:
+        history = codec.loads(json_path.read_bytes() or b"[]")
+    except Exception as e:
+        problems.append({"file": json_path.name, "problem": f"invalid JSON, history not migrated: {e}"})
+        return written
+    blocks = _normalize_history(history, problems, json_path.name)
+    if blocks is None:
+        return written
+    target_json = target_dir / json_path.name
+    tmp = target_json.with_name(target_json.name + ".tmp")
+    history_store.save(tmp, blocks)
+    os.replace(tmp, target_json)
+    os.utime(target_json, ns=(json_st.st_mtime_ns, json_st.st_mtime_ns))
+    return written + target_json.stat().st_size
+
+def _migrate_config(source_root: Path, target_root: Path, username: str, problems: list):
+    source = source_root / "configs" / f"{username}.json"
+    if not source.exists():
+        return
+    try:
+        saved = codec.read_file(source)
+    except Exception as e:
+        problems.append({"file": source.name, "problem": f"invalid config, skipped: {e}"})
+        return
+    config = {key: saved.get(key) or DEFAULT_API_CONFIG[key] for key in BASE_CONFIG_KEYS}
+    # 旧路径可能是另一个系统的格式，只取文件名，指向目标根目录下同名会话
+    name = re.split(r"[\\/]", config["file_path"])[-1] if config["file_path"] else ""
+    if name and (source_root / "data" / username / name).exists():
+        config["file_path"] = str(target_root / "data" / username / name)
+    else:
+        if name:
+            problems.append({"file": source.name, "problem": f"file_path points to missing session {name}, reset"})
+        config["file_path"] = ""
+    codec.write_file(target_root / "configs" / f"{username}.json", config, atomic=True)
+
+def _migrate_prompts(source_root: Path, target_root: Path, username: str, problems: list):
+    source = source_root / "prompt_data" / f"{username}.json"
+    if not source.exists():
+        return
+    try:
+        prompts = normalize_prompts(codec.read_file(source))
+    except Exception as e:
+        problems.append({"file": source.name, "problem": f"invalid prompts, skipped: {e}"})
+        return
+    codec.write_file(target_root / "prompt_data" / f"{username}.json", prompts, atomic=True)
+
+def migrate_user(source_root: str, target_root: str, username: str) -> dict:
+    """在子进程中迁移一个用户的全部数据，返回统计与问题列表"""
+    source_root, target_root = Path(source_root), Path(target_root)
+    problems = []
+    sessions = written = 0
+    for sub in ("configs", "prompt_data", "search"):
+        (target_root / sub).mkdir(parents=True, exist_ok=True)
+    _migrate_config(source_root, target_root, username, problems)
+    _migrate_prompts(source_root, target_root, username, problems)
+
+    source_dir = source_root / "data" / username
+    target_dir = target_root / "data" / username
+    target_dir.mkdir(parents=True, exist_ok=True)
+    if source_dir.is_dir():
+        for txt in sorted(source_dir.glob("*.txt")):
+            try:
+                written += _migrate_session(txt, target_dir, problems)
+                sessions += 1
+            except Exception as e:
+                problems.append({"file": txt.name, "problem": f"failed: {e}"})
+        for json_path in source_dir.glob("*.json"):
+            if not json_path.with_suffix(".txt").exists():
+                problems.append({"file": json_path.name, "problem": "history without txt, skipped"})
+    # 搜索索引在首次访问时按迁移后的数据重建
+    (target_root / "search" / f"{username}.db").unlink(missing_ok=True)
+    for problem in problems:
+        problem["username"] = username
+    return {"username": username, "sessions": sessions, "bytes": written, "problems": problems}
+
+def _existing_users(target_root: Path, target_users: dict, added: set) -> set:
+    """目标中原有的用户：有账号或数据目录，且不是本迁移加入的"""
+    existing = set(target_users)
+    data_root = target_root / "data"
+    if data_root.is_dir():
+        existing |= {d.name for d in data_root.iterdir() if d.is_dir()}
+    return existing - added
+
+def _merge_users(source_root: Path, target_root: Path, state: dict, problems: list) -> List[str]:
+    """
+    合并 users.json，返回需要迁移的用户名（含只有数据目录、不在 users.json 中的用户）。
+    目标中原有的用户跳过；需要迁移的用户记入 state["added"]。
+    """
+    source_file = source_root / "users.json"
+    target_file = target_root / "users.json"
+    source_users = codec.read_file(source_file) if source_file.exists() else {}
+    target_users = codec.read_file(target_file) if target_file.exists() else {}
+    added = set(state["added"])
+    existing = _existing_users(target_root, target_users, added)
+
+    usernames = set()
+    for username, record in source_users.items():
+        if not isinstance(record, dict) or not record.get("hash") or not record.get("salt"):
+            problems.append({"username": username, "file": "users.json", "problem": "missing hash/salt, user skipped"})
+            continue
+        if username in existing:
+            problems.append({"username": username, "file": "users.json", "problem": "user already exists in target, skipped"})
+            continue
+        target_users[username] = {**record, "group": record.get("group", "default")}
+        usernames.add(username)
+
+    data_root = source_root / "data"
+    if data_root.is_dir():
+        for user_dir in data_root.iterdir():
+            if not user_dir.is_dir() or user_dir.name in usernames:
+                continue
+            if user_dir.name in existing:
+                if user_dir.name not in source_users:
+                    problems.append({"username": user_dir.name, "file": "", "problem": "data directory already exists in target, skipped"})
+                continue
+            problems.append({"username": user_dir.name, "file": "", "problem": "data directory without account, migrated anyway"})
+            usernames.add(user_dir.name)
+
+    target_root.mkdir(parents=True, exist_ok=True)
+    codec.write_file(target_file, target_users, atomic=True)
+    state["added"] = sorted(added | usernames)
+    return sorted(usernames)
+
+def migrate(source_root: Path, target_root: Path, workers: int = None, usernames: List[str] = None,
+            restart: bool = False) -> dict:
+    start = time.perf_counter()
+    source_root, target_root = Path(source_root).resolve(), Path(target_root).resolve()
+    if source_root == target_root:
+        raise ValueError("源目录与目标目录相同")
+    state_path = target_root / STATE_FILE
+    previous = codec.read_file(state_path) if state_path.exists() else {}
+    if not restart and previous.get("source") not in (None, str(source_root)):
+        raise ValueError(f"目标目录已有来自 {previous['source']} 的迁移记录，使用 --restart 重新开始")
+    # --restart 只重做已完成的用户；同一来源此前加入的用户仍属于本迁移，不当作目标中已有的用户
+    same_source = previous.get("source") == str(source_root)
+    state = {
+        "source": str(source_root),
+        "done": {} if restart else previous.get("done", {}),
+        "added": previous.get("added", []) if same_source else [],
+    }
+
+    problems = []
+    all_users = _merge_users(source_root, target_root, state, problems)
+    codec.write_file(state_path, state, atomic=True)
+    for username in usernames or []:
+        if username not in all_users:
+            problems.append({"username": username, "file": "", "problem": "not migratable (missing or already in target), skipped"})
+    selected = [u for u in (usernames or all_users) if u in all_users]
+    todo = [u for u in selected if u not in state["done"]]
+    skipped = len(selected) - len(todo)
+    print(f"迁移 {source_root} -> {target_root}: {len(todo)} 个用户（跳过已完成 {skipped} 个）")
+
+    sessions = written = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(migrate_user, str(source_root), str(target_root), u): u for u in todo}
+        for future in as_completed(futures):
+            username = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                problems.append({"username": username, "file": "", "problem": f"user failed: {e}"})
+                failed += 1
+                continue
+            problems.extend(result["problems"])
+            sessions += result["sessions"]
+            written += result["bytes"]
+            state["done"][username] = {
+                "sessions": result["sessions"], "bytes": result["bytes"],
+                "finished_at": datetime.datetime.now().isoformat()
+            }
+            # 每个用户完成后立即落盘，中断后可从这里继续
+            codec.write_file(state_path, state, atomic=True)
+            print(f"  {username}: {result['sessions']} 个会话, {len(result['problems'])} 个问题")
+
+    elapsed = time.perf_counter() - start
+    report = {
+        "source": str(source_root),
+        "target": str(target_root),
+        "finished_at": datetime.datetime.now().isoformat(),
+        "users": len(todo) - failed,
+        "users_failed": failed,
+        "users_skipped": skipped,
+        "sessions": sessions,
+        "bytes": written,
+        "elapsed_seconds": round(elapsed, 2),
+        "sessions_per_second": round(sessions / elapsed, 1) if elapsed else None,
+        "mb_per_second": round(written / 1024 / 1024 / elapsed, 2) if elapsed else None,
+        "problems": problems,
+    }
+    codec.write_file(target_root / REPORT_FILE, report, pretty=True)
+    return report
@@ -1,38 +1,72 @@
-import json
+import asyncio
 import uuid
 import datetime
 import re
 from pathlib import Path
-from openai import AsyncOpenAI
-from app.core.config import DATA_ROOT
-from app.services.user_manager import get_user_config, save_base_config_only
+from app.core.config import DATA_ROOT, MAX_CANDIDATES, BLOCK_STORE
+from app.core import codec, etag
+from app.services.user_manager import get_user_config, save_base_config_only, get_user_group
 from app.services.prompt_builder import build_generate_messages, build_outline_messages
+from app.services import group_service, upstream_service, usage_service, rate_limit_service, speculative_service, stats_service, text_cache, history_store, fork_store, chapter_index, storage_service, search_service, block_store, singleflight, metrics
 
-# --- Helper ---
-def get_openai_client(config):
-    return AsyncOpenAI(base_url=config["base_url"], api_key=config["api_key"])
+DISCONNECT_POLL_INTERVAL = 0.5  # 秒，检测客户端断开的间隔
 
 # --- File Operations ---
 
 def get_novel_content(username: str, full: bool = False):
     config = get_user_config(username)
     path = Path(config["file_path"])
+    block_store.ensure_view(path)
 
     if not path.exists():
         return {"content": "", "path": str(path), "full_length": 0}
 
-    content = path.read_text(encoding="utf-8")
+    content = text_cache.read_text(username, path)
     if full:
         return {"content": content}
 
     preview = content[-2000:] if len(content) > 2000 else content
     return {"content": preview, "full_length": len(content), "path": str(path)}
 
-def save_novel_content(username: str, content: str, prompt: str = ""):
+def novel_version(username: str) -> str:
+    config = get_user_config(username)
+    block_store.ensure_view(config["file_path"])
+    return etag.file_stamp(config["file_path"])
+
+def get_chapters(username: str) -> dict:
+    config = get_user_config(username)
+    path = Path(config["file_path"])
+    block_store.ensure_view(path)
+    return {"path": str(path), **chapter_index.get(path, lambda: fork_store.load_history(path.with_suffix(".json")))}
+
+def read_chapter(username: str, index: int) -> dict:
+    config = get_user_config(username)
+    path = Path(config["file_path"])
+    block_store.ensure_view(path)
+    chapters = chapter_index.get(path, lambda: fork_store.load_history(path.with_suffix(".json")))["chapters"]
+    if not 0 <= index < len(chapters):
+        raise ValueError("Chapter not found")
+    chapter = chapters[index]
+    return {**chapter, **chapter_index.read_range(path, chapter["start"], chapter["end"], max_bytes=None)}
+
+def read_novel_range(username: str, start: int, end: int) -> dict:
     config = get_user_config(username)
     path = Path(config["file_path"])
+    block_store.ensure_view(path)
+    if not path.exists():
+        raise FileNotFoundError("Files not found")
+    return chapter_index.read_range(path, start, end)
+
+def save_novel_content(username: str, content: str, prompt: str = "", file_path: str = None):
+    path = Path(file_path or get_user_config(username)["file_path"])
+    # 与后台压缩、冷存储互斥，见 history_store.session_lock
+    with history_store.session_lock(path):
+        return _save_novel_content(username, content, prompt, path)
+
+def _save_novel_content(username: str, content: str, prompt: str, path: Path):
     json_path = path.with_suffix(".json")
     user_data_dir = DATA_ROOT / username
+    storage_service.ensure_warm(path)
 
     # Security check
     try:
@@ -44,36 +78,33 @@ def save_novel_content(username: str, content: str, prompt: str = ""):
              raise ValueError("Illegal file path access")
 
     path.parent.mkdir(parents=True, exist_ok=True)
-
-    # 1. Write TXT
-    mode = "a" if path.exists() else "w"
-    separator = "\n\n" if path.exists() else ""
-    text_to_write = separator + content + "\n"
-    with open(path, mode, encoding="utf-8") as f:
-        f.write(text_to_write)
-
-    # 2. Write JSON history
-    history = []
-    if json_path.exists():
+    is_new_session = not path.exists()
+    if is_new_session and BLOCK_STORE:
+        path.touch()
+        history_store.save(json_path, [])
+        block_store.create(path)
+    # 块存储会话只写历史，txt 在读取时由 block_store 补齐
+    block_mode = block_store.is_block_mode(path)
+    size_before = 0 if is_new_session else path.stat().st_size
+    stamp_before = None if is_new_session else [path.stat().st_mtime_ns, size_before]
+
+    # 1. New history blocks
+    new_blocks = []
+    if not json_path.exists() and path.exists():
+        # Initialize base block if needed（只包含本次追加之前的内容）
         try:
-            history = json.loads(json_path.read_text(encoding="utf-8"))
+            existing_text = path.read_text(encoding="utf-8").strip()
+            if existing_text:
+                base_block = {
+                    "id": str(uuid.uuid4()),
+                    "timestamp": datetime.datetime.now().isoformat(),
+                    "role": "system",
+                    "content": existing_text,
+                    "prompt": "Original File Content (Base)",
+                    "status": "active"
+                }
+                new_blocks.append(base_block)
         except: pass
-    else:
-        # Initialize base block if needed
-        if path.exists() and path.stat().st_size > 0:
-            try:
-                existing_text = path.read_text(encoding="utf-8").strip()
-                if existing_text:
-                    base_block = {
-                        "id": str(uuid.uuid4()),
-                        "timestamp": datetime.datetime.now().isoformat(),
-                        "role": "system",
-                        "content": existing_text,
-                        "prompt": "Original File Content (Base)",
-                        "status": "active"
-                    }
-                    history.append(base_block)
-            except: pass
 
     if prompt:
         user_block = {
@@ -83,7 +114,7 @@ def save_novel_content(username: str, content: str, prompt: str = ""):
             "content": prompt,
             "status": "active"
         }
-        history.append(user_block)
+        new_blocks.append(user_block)
 
     block_id = str(uuid.uuid4())
     assistant_block = {
@@ -94,71 +125,135 @@ def save_novel_content(username: str, content: str, prompt: str = ""):
         "prompt": prompt or "",
         "status": "active"
     }
-    history.append(assistant_block)
+    new_blocks.append(assistant_block)
+
+    # 2. Write TXT
+    if not block_mode:
+        mode = "a" if path.exists() else "w"
+        separator = "\n\n" if path.exists() else ""
+        text_to_write = separator + content + "\n"
+        with open(path, mode, encoding="utf-8") as f:
+            f.write(text_to_write)
+        text_cache.append(username, path, text_to_write)
+
+    # 3. Append JSON history（原地追加，不重写整个文件）
+    try:
+        history_store.append(json_path, new_blocks)
+    except Exception as e:
+        print(f"Error appending history {json_path}: {e}")
+        history_store.save(json_path, new_blocks)
 
-    json_path.write_text(json.dumps(history, indent=2, ensure_ascii=False), encoding="utf-8")
+    if not block_mode:
+        chapter_index.on_append(
+            path, stamp_before, fork_store.prefix_size(path) + size_before + len(separator.encode("utf-8")), content, block_id,
+            history_loader=lambda: fork_store.load_history(json_path)
+        )
+    search_service.add_blocks(username, path.name, new_blocks)
+
+    stats_service.update(
+        username,
+        sessions=1 if is_new_session else 0,
+        text_bytes=path.stat().st_size - size_before,
+        blocks=len(new_blocks)
+    )
     return block_id
 
 def discard_novel_block(username: str, block_id: str):
-    config = get_user_config(username)
-    path = Path(config["file_path"])
+    path = Path(get_user_config(username)["file_path"])
+    with history_store.session_lock(path):
+        return _discard_novel_block(username, block_id, path)
+
+def _discard_novel_block(username: str, block_id: str, path: Path):
     json_path = path.with_suffix(".json")
 
     if not path.exists() or not json_path.exists():
         raise FileNotFoundError("Files not found")
 
     # Update JSON
-    history = json.loads(json_path.read_text(encoding="utf-8"))
+    history = history_store.load(json_path)
+    # 分叉会话要丢弃的块在共享前缀中：先物化（拷贝前缀）再修改
+    if fork_store.fork_ref(path) and not any(item["id"] == block_id for item in history):
+        fork_store.materialize(path)
+        history = history_store.load(json_path)
+    prefix_blocks = (fork_store.fork_ref(path) or {}).get("prefix_blocks", 0)
+
     target_block = None
-    for item in history:
+    target_index = None
+    newly_discarded = False
+    for index, item in enumerate(history):
         if item["id"] == block_id:
+            newly_discarded = item.get("status") != "discarded"
             item["status"] = "discarded"
             target_block = item
+            target_index = prefix_blocks + index
             break
 
     if not target_block:
         raise ValueError("Block not found")
+    speculative_service.cancel(username, "discard")
 
-    json_path.write_text(json.dumps(history, indent=2, ensure_ascii=False), encoding="utf-8")
-
-    # Reconstruct TXT
+    # Reconstruct TXT（用户 prompt 块不属于正文，save 时也不写入 txt）
     new_content_list = []
     for item in history:
-        if item.get("status") == "active":
+        if block_store.is_text_block(item):
             new_content_list.append(item["content"])
 
     new_full_text = "\n\n".join(new_content_list)
     if new_full_text: new_full_text += "\n"
 
+    # 重写之前，共享前缀会因此变化的子会话先物化
+    fork_store.detach_children(path, target_index, new_full_text.encode("utf-8"))
+    history_store.save(json_path, history)
+
+    size_before = path.stat().st_size
     path.write_text(new_full_text, encoding="utf-8")
+    text_cache.invalidate(username)
+    chapter_index.rebuild(path, fork_store.load_history(json_path))
+    block_store.sync(path)
+    search_service.remove_block(username, path.name, block_id)
+
+    stats_service.update(
+        username,
+        text_bytes=path.stat().st_size - size_before,
+        discarded_blocks=1 if newly_discarded else 0
+    )
     return block_id
 
 async def auto_rename_novel(username: str):
+    # 重复的改名请求（双击/重试）复用进行中的结果
+    config = get_user_config(username)
+    key = singleflight.make_key(username, "auto_rename", config["file_path"])
+    return await singleflight.do(key, "auto_rename", lambda: _auto_rename_novel(username))
+
+async def _auto_rename_novel(username: str):
     config = get_user_config(username)
     path = Path(config["file_path"])
 
     if not path.exists():
         return {"status": "skipped", "reason": "file not found"}
 
+    block_store.ensure_view(path)
     filename = path.stem
-    if not re.match(r"^\d{8}_\d{6}$", filename):
+    # 时间戳文件名，同一秒内创建的会话带序号后缀（见 session_service._new_session_path）
+    if not re.match(r"^\d{8}_\d{6}(_\d+)?$", filename):
          return {"status": "skipped", "reason": "not a timestamp file"}
 
-    content = path.read_text(encoding="utf-8")[:3000]
+    content = text_cache.read_text(username, path)[:3000]
     if len(content) < 1000:
          return {"status": "skipped", "reason": "content too short"}
 
-    client = get_openai_client(config)
-    resp = await client.chat.completions.create(
-        model=config["model"],
+    title = await upstream_service.complete_chat(
+        config,
         messages=[
             {"role": "system", "content": "你是一个编辑。请根据小说内容，取一个吸引人的书名，严格限制在15字以内。只返回书名，不要包含引号或其他文字。"},
             {"role": "user", "content": content}
         ],
         temperature=0.7,
-        max_tokens=50
+        max_tokens=50,
+        on_usage=usage_service.usage_recorder(username),
+        task=upstream_service.TASK_TITLE
     )
-    new_title = resp.choices[0].message.content.strip().replace('"', '').replace("'", "")
+    new_title = title.strip().replace('"', '').replace("'", "")
     new_title = re.sub(r'[\\/*?:"<>|]', "", new_title)
 
     if not new_title:
@@ -169,11 +264,20 @@ async def auto_rename_novel(username: str):
          new_path = path.parent / f"{new_title}_{filename[-6:]}.txt"
 
     path.rename(new_path)
+    text_cache.invalidate(username)
+    speculative_service.cancel(username, "rename")
 
     old_json_path = path.with_suffix(".json")
     if old_json_path.exists():
         new_json_path = new_path.with_suffix(".json")
         old_json_path.rename(new_json_path)
+    old_index_path = chapter_index.index_path(path)
+    if old_index_path.exists():
+        old_index_path.rename(chapter_index.index_path(new_path))
+    if block_store.is_block_mode(path):
+        block_store.marker_path(path).rename(block_store.marker_path(new_path))
+    fork_store.on_renamed(path, new_path)
+    search_service.on_renamed(username, path.name, new_path.name)
 
     config["file_path"] = str(new_path)
     save_base_config_only(username, config)
@@ -182,12 +286,109 @@ async def auto_rename_novel(username: str):
 
 # --- Generation ---
 
-async def generate_novel_stream(username: str, req_user_prompt: str = None):
+class GenerationNotAllowed(Exception):
+    """用户组的生成档位不允许该任务或当前模型"""
+    pass
+
+_TASK_NAMES = {upstream_service.TASK_CONTINUATION: "续写", upstream_service.TASK_OUTLINE: "大纲生成"}
+
+def resolve_profile(username: str, task: str, config: dict = None) -> dict:
+    """
+    按用户组解析本次请求的生成档位，每个请求只解析一次并随 config["profile"] 传递。
+    返回 {"task", "max_tokens", "temperature", "top_p", "stream"}；不允许时抛出 GenerationNotAllowed。
+    """
+    config = config or get_user_config(username)
+    profile = group_service.get_generation_profile(get_user_group(username))
+    max_tokens = profile["max_tokens"].get(task)
+    if not max_tokens:
+        raise GenerationNotAllowed(f"当前用户组无权使用{_TASK_NAMES.get(task, task)}")
+    allowed = profile["allowed_models"]
+    if allowed is not None and config["model"] not in allowed:
+        raise GenerationNotAllowed(f"当前用户组不能使用模型 {config['model']}，可用模型：{', '.join(allowed)}")
+    return {
+        "task": task,
+        "max_tokens": max_tokens,
+        "temperature": profile["temperature"],
+        "top_p": profile["top_p"],
+        "stream": profile["stream"],
+    }
+
+def _profile_params(config: dict) -> dict:
+    profile = config["profile"]
+    return {"temperature": profile["temperature"], "top_p": profile["top_p"], "max_tokens": profile["max_tokens"]}
+
+def _buffered(config: dict) -> bool:
+    # 自由创作模式，或档位关闭了流式输出时，整段生成后一次性返回
+    return bool(config.get("free_create_mode")) or not config["profile"]["stream"]
+
+async def cancel_on_disconnect(stream, is_disconnected, task: str, token_budget: int):
+    """
+    转发生成内容，同时轮询客户端是否断开。
+    断开后立即取消正在等待的上游请求（流式则关闭到上游的 HTTP 流），
+    并按剩余 max_tokens 估算节省的 token 数记入指标。
+    框架自身检测到断开而取消本生成器时，同样走这里的清理逻辑。
+    """
+    async def wait_disconnect():
+        while not await is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    watcher = asyncio.create_task(wait_disconnect())
+    next_item = None
+    produced = 0
+    finished = False
+    try:
+        while True:
+            next_item = asyncio.ensure_future(stream.__anext__())
+            done, _ = await asyncio.wait({next_item, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if next_item not in done:
+                return
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                finished = True
+                return
+            next_item = None
+            produced += len(item)
+            yield item
+    except Exception:
+        finished = True
+        raise
+    finally:
+        watcher.cancel()
+        if next_item is not None and not next_item.done():
+            next_item.cancel()
+            try:
+                await next_item
+            except BaseException:
+                pass
+        if not finished:
+            saved = max(0, token_budget - upstream_service.estimate_tokens(produced))
+            metrics.inc("generation_cancelled_total", task=task)
+            metrics.inc("upstream_tokens_saved_estimate_total", saved, task=task)
+            print(f"[{task}] 客户端已断开，取消上游请求（估算节省 {saved} tokens）")
+        await stream.aclose()
+
+def generate_novel_stream(username: str, req_user_prompt: str = None, candidates: int = 1, is_disconnected=None,
+                          profile: dict = None):
+    profile = profile or resolve_profile(username, upstream_service.TASK_CONTINUATION)
+    stream = _generate_novel_stream(username, req_user_prompt, candidates, profile)
+    if is_disconnected is None:
+        return stream
+    budget = profile["max_tokens"] * max(1, min(candidates or 1, MAX_CANDIDATES))
+    return cancel_on_disconnect(stream, is_disconnected, "generate", budget)
+
+def prepare_generate(username: str, req_user_prompt: str = None, file_path: str = None, profile: dict = None):
+    """
+    组装续写请求，返回 (config, messages)。file_path 为空时使用当前会话。
+    profile 为空时按用户组解析，结果放在 config["profile"] 中。
+    """
     config = get_user_config(username)
-    path = Path(config["file_path"])
+    config["profile"] = profile or resolve_profile(username, upstream_service.TASK_CONTINUATION, config)
+    path = Path(file_path or config["file_path"])
+    block_store.ensure_view(path)
 
     try:
-        context = path.read_text(encoding="utf-8") if path.exists() else ""
+        context = text_cache.read_text(username, path)
     except:
         context = ""
 
@@ -209,42 +410,130 @@ async def generate_novel_stream(username: str, req_user_prompt: str = None):
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
+    return config, messages
+
+async def _generate_novel_stream(username: str, req_user_prompt: str = None, candidates: int = 1, profile: dict = None):
+    config, messages = prepare_generate(username, req_user_prompt, profile=profile)
+    candidates = max(1, min(candidates or 1, MAX_CANDIDATES))
+
+    # 同一会话、相同 prompt 的重复请求挂到进行中的生成上，不再重复调用上游；
+    # 与预生成的 key 相同时直接接管预生成的结果
+    key = singleflight.make_key(username, "generate", config["file_path"], messages, candidates)
+    source = lambda: (
+        speculative_service.claim(username, key)
+        or _produce_generation(config, messages, candidates, usage_service.usage_recorder(username))
+    )
+    try:
+        async for item in singleflight.stream(key, "generate", source):
+            yield item
+    except Exception as e:
+        # 接管的预生成在输出中途出错（正常生成的错误已由 _produce_generation 转为文本）
+        yield f"\n[ERROR: {str(e)}]"
 
-    client = get_openai_client(config)
+def start_speculation(username: str):
+    """save 之后调用：用户组开启了预生成且余量充足时，按默认 prompt 在后台先行续写"""
+    limits = rate_limit_service.get_limits(username)
+    if not limits["speculative_generation"]:
+        return
+    try:
+        profile = resolve_profile(username, upstream_service.TASK_CONTINUATION)
+    except GenerationNotAllowed:
+        return
+    if not rate_limit_service.has_headroom(username, profile["max_tokens"], limits):
+        speculative_service.cancel(username, "no_headroom")
+        metrics.inc("speculative_skipped_total")
+        return
+    config, messages = prepare_generate(username, profile=profile)
+    key = singleflight.make_key(username, "generate", config["file_path"], messages, 1)
+    rate_limit_service.acquire_stream(username, limits)
+    speculative_service.start(
+        username, key,
+        lambda: stream_continuation(config, messages, usage_service.usage_recorder(username)),
+        on_finish=lambda: rate_limit_service.release_stream(username)
+    )
 
-    # Logic from previous successful edit:
-    # Free Mode -> Non-Stream (Wait & Yield All)
-    # Normal Mode -> Stream
+async def _produce_generation(config, messages, candidates: int, on_usage):
+    # 多候选：并发生成，按行输出 JSON 帧
+    if candidates > 1:
+        async for frame in _multiplex_candidates(config, messages, candidates, on_usage):
+            yield frame
+        return
 
     try:
-        if config.get("free_create_mode"):
-            resp = await client.chat.completions.create(
-                model=config["model"],
-                messages=messages,
-                temperature=0.9,
-                top_p=1,
-                max_tokens=10000,
-                stream=False
-            )
-            full_content = resp.choices[0].message.content
-            yield full_content
-        else:
-            stream = await client.chat.completions.create(
-                model=config["model"],
-                messages=messages,
-                temperature=0.9,
-                top_p=1,
-                max_tokens=10000,
-                stream=True
-            )
-            async for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+        async for text in stream_continuation(config, messages, on_usage):
+            yield text
     except Exception as e:
         yield f"\n[ERROR: {str(e)}]"
 
-async def generate_outline_stream(username: str, req):
+async def stream_continuation(config, messages, on_usage=None):
+    """续写的上游调用，出错直接抛出。采样参数与输出方式来自 config["profile"]"""
+    if _buffered(config):
+        full_content = await upstream_service.complete_chat(
+            config,
+            messages=messages,
+            on_usage=on_usage,
+            task=upstream_service.TASK_CONTINUATION,
+            **_profile_params(config)
+        )
+        yield full_content
+    else:
+        async for text in upstream_service.stream_chat(
+            config,
+            messages=messages,
+            on_usage=on_usage,
+            task=upstream_service.TASK_CONTINUATION,
+            **_profile_params(config)
+        ):
+            yield text
+
+async def _multiplex_candidates(config, messages, candidates: int, on_usage=None):
+    """
+    并发生成多个候选续写，复用同一条响应流。
+    帧格式（每行一个 JSON）：
+    1. {"candidates": n}                 首帧，告知候选数量
+    2. {"candidate": i, "delta": "..."}  第 i 个候选的增量文本
+    3. {"candidate": i, "error": "..."}  第 i 个候选出错
+    4. {"candidate": i, "done": true}    第 i 个候选结束
+    用户选定其中一个调用 /api/save 保存，其余直接丢弃即可。
+    """
+    queue = asyncio.Queue()
+
+    async def run(index: int):
+        try:
+            async for text in stream_continuation(config, messages, on_usage):
+                await queue.put({"candidate": index, "delta": text})
+        except Exception as e:
+            await queue.put({"candidate": index, "error": str(e)})
+        finally:
+            await queue.put({"candidate": index, "done": True})
+
+    yield codec.dumps({"candidates": candidates}) + "\n"
+
+    tasks = [asyncio.create_task(run(i)) for i in range(candidates)]
+    remaining = candidates
+    try:
+        while remaining:
+            frame = await queue.get()
+            if frame.get("done"):
+                remaining -= 1
+            yield codec.dumps(frame) + "\n"
+    finally:
+        # 客户端断开或提前结束时，取消仍在进行的候选，并等待其关闭上游连接
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def generate_outline_stream(username: str, req, is_disconnected=None, profile: dict = None):
+    profile = profile or resolve_profile(username, upstream_service.TASK_OUTLINE)
+    stream = _generate_outline_stream(username, req, profile)
+    if is_disconnected is None:
+        return stream
+    return cancel_on_disconnect(stream, is_disconnected, "outline", profile["max_tokens"])
+
+def prepare_outline(username: str, req, profile: dict = None):
+    """组装大纲请求，返回 (config, messages, 新会话文件路径)。档位同 prepare_generate"""
     config = get_user_config(username)
+    config["profile"] = profile or resolve_profile(username, upstream_service.TASK_OUTLINE, config)
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     user_data_dir = DATA_ROOT / username
     user_data_dir.mkdir(parents=True, exist_ok=True)
@@ -285,23 +574,36 @@ async def generate_outline_stream(username: str, req):
             {"role": "system", "content": final_system_prompt},
             {"role": "user", "content": user_content}
         ]
+    return config, messages, new_file_path
 
-    client = get_openai_client(config)
+async def _generate_outline_stream(username: str, req, profile: dict = None):
+    config, messages, new_file_path = prepare_outline(username, req, profile)
 
-    yield json.dumps({"target_path": str(new_file_path)}) + "\n"
+    yield codec.dumps({"target_path": str(new_file_path)}) + "\n"
 
     try:
-        # Outline usually needs stream too
-        stream = await client.chat.completions.create(
-            model=config["model"],
-            messages=messages,
-            temperature=0.9,
-            top_p=1,
-            max_tokens=50000,
-            stream=True
-        )
-        async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+        async for text in stream_outline(config, messages, usage_service.usage_recorder(username)):
+            yield text
     except Exception as e:
         yield f"\n[ERROR: {str(e)}]"
+
+async def stream_outline(config, messages, on_usage=None):
+    """大纲的上游调用，出错直接抛出。采样参数与输出方式来自 config["profile"]"""
+    # 大纲在自由创作模式下同样流式输出，只按档位决定
+    if not config["profile"]["stream"]:
+        yield await upstream_service.complete_chat(
+            config,
+            messages=messages,
+            on_usage=on_usage,
+            task=upstream_service.TASK_OUTLINE,
+            **_profile_params(config)
+        )
+        return
+    async for text in upstream_service.stream_chat(
+        config,
+        messages=messages,
+        on_usage=on_usage,
+        task=upstream_service.TASK_OUTLINE,
+        **_profile_params(config)
+    ):
+        yield text
@@ -0,0 +1,121 @@
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+from app.services import group_service, usage_service, metrics
+from app.services.user_manager import get_user_group
+
+# 基于用户组的限流，限制项来自 groups.json（None 表示不限制）：
+#   requests_per_minute        每个用户每分钟请求数（令牌桶）
+#   group_requests_per_minute  同组所有用户共享的每分钟请求数（令牌桶）
+#   max_concurrent_streams     每个用户同时进行的上游生成数（多候选按候选数计）
+#   daily_token_limit          每个用户每天的 prompt + completion token 数（来自用量账本）
+# 另外 speculative_generation 表示该组是否开启预生成（见 speculative_service）。
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def available(self) -> float:
+        """当前可用的令牌数（不消耗）"""
+        return min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate)
+
+    def try_acquire(self) -> float:
+        """成功返回 0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+BUCKETS: Dict[str, TokenBucket] = {}
+ACTIVE_STREAMS: Dict[str, int] = defaultdict(int)
+
+def _bucket(key: str, per_minute: int) -> TokenBucket:
+    bucket = BUCKETS.get(key)
+    # 限额被管理员修改后重建令牌桶
+    if not bucket or bucket.capacity != per_minute:
+        bucket = BUCKETS[key] = TokenBucket(per_minute)
+    return bucket
+
+def get_limits(username: str) -> dict:
+    group_name = get_user_group(username)
+    group = group_service.get_group(group_name) or group_service.get_group("default") or {}
+    return {
+        "group": group_name,
+        "requests_per_minute": group.get("requests_per_minute"),
+        "group_requests_per_minute": group.get("group_requests_per_minute"),
+        "max_concurrent_streams": group.get("max_concurrent_streams"),
+        "daily_token_limit": group.get("daily_token_limit"),
+        "speculative_generation": group.get("speculative_generation", False),
+    }
+
+def check_request(username: str, limits: dict = None):
+    """在调用上游之前检查频率与每日 token 配额，超限抛出 RateLimitExceeded"""
+    limits = limits or get_limits(username)
+
+    daily = limits["daily_token_limit"]
+    if daily is not None and usage_service.tokens_used_today(username) >= daily:
+        metrics.inc("rate_limited_total", reason="daily_tokens", group=limits["group"])
+        raise RateLimitExceeded("今日 token 用量已达上限")
+
+    checks = [
+        (f"user:{username}", limits["requests_per_minute"], "请求过于频繁，请稍后再试"),
+        (f"group:{limits['group']}", limits["group_requests_per_minute"], "当前用户组请求过多，请稍后再试"),
+    ]
+    for key, per_minute, message in checks:
+        if per_minute is None:
+            continue
+        wait = _bucket(key, per_minute).try_acquire()
+        if wait:
+            metrics.inc("rate_limited_total", reason=key.split(":")[0] + "_rpm", group=limits["group"])
+            raise RateLimitExceeded(message, retry_after=int(wait) + 1)
+
+def has_headroom(username: str, reserve_tokens: int, limits: dict = None) -> bool:
+    """
+    后台预生成启动前检查：在不影响用户下一次真实请求的前提下是否还有余量，不消耗任何额度。
+    并发需多留一个名额，频率需至少剩两个令牌，每日 token 需留出 reserve_tokens。
+    """
+    limits = limits or get_limits(username)
+    daily = limits["daily_token_limit"]
+    if daily is not None and usage_service.tokens_used_today(username) + reserve_tokens > daily:
+        return False
+    max_streams = limits["max_concurrent_streams"]
+    if max_streams is not None and ACTIVE_STREAMS[username] + 2 > max_streams:
+        return False
+    for key, per_minute in ((f"user:{username}", limits["requests_per_minute"]),
+                            (f"group:{limits['group']}", limits["group_requests_per_minute"])):
+        if per_minute is not None and _bucket(key, per_minute).available() < 2:
+            return False
+    return True
+
+def acquire_stream(username: str, limits: dict = None, count: int = 1):
+    """占用 count 个并发名额（多候选续写每个候选各占一个），不足时抛出 RateLimitExceeded"""
+    limits = limits or get_limits(username)
+    max_streams = limits["max_concurrent_streams"]
+    if max_streams is not None and ACTIVE_STREAMS[username] + count > max_streams:
+        metrics.inc("rate_limited_total", reason="concurrent_streams", group=limits["group"])
+        raise RateLimitExceeded(f"同时进行的生成数已达上限（{max_streams}）")
+    ACTIVE_STREAMS[username] += count
+
+def release_stream(username: str, count: int = 1):
+    ACTIVE_STREAMS[username] = max(0, ACTIVE_STREAMS[username] - count)
+
+def admit_stream(username: str, count: int = 1):
+    """生成类接口的统一入口：占用 count 个并发名额并检查频率、配额"""
+    limits = get_limits(username)
+    acquire_stream(username, limits, count)
+    try:
+        check_request(username, limits)
+    except RateLimitExceeded:
+        release_stream(username, count)
+        raise
@@ -0,0 +1,218 @@
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, List, Optional
+from app.core.config import DATA_ROOT, SEARCH_ROOT, SEARCH_MAX_RESULTS
+from app.core import codec
+from app.services import history_store
+
+# 全文搜索：每个用户一个 SQLite 库 SEARCH_ROOT/<username>.db，
+# FTS5 表 blocks 保存该用户所有会话中状态为 active 的历史块。
+# trigram 分词按字符三元组建索引，不依赖分词词典，中文任意子串都能命中；
+# 不足 3 个字的关键词（如两个字的人名）无法走三元组索引，改用 LIKE 在库内扫描。
+# 索引按会话文件实际保存的块建立：分叉会话共享的前缀块只记在父会话下。
+# save/discard/改名/物化时增量更新；库不存在时在首次访问时整体建立，
+# 文件被手工改动后可用 `python manage.py search-rebuild` 重建。
+
+SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS blocks USING fts5("
+    "content, session UNINDEXED, block_id UNINDEXED, role UNINDEXED, timestamp UNINDEXED, "
+    "tokenize='trigram')"
+)
+TRIGRAM_MIN_CHARS = 3
+SNIPPET_CHARS = 40          # 片段中命中位置前后各保留的字数
+
+_LOCK = threading.Lock()    # 串行化建库，避免并发请求重复全量索引
+
+def db_path(username: str) -> Path:
+    return SEARCH_ROOT / f"{username}.db"
+
+def _open(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path), timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SCHEMA)
+    return conn
+
+def _ensure(username: str) -> bool:
+    """库不存在时全量建立，返回是否刚刚建立"""
+    path = db_path(username)
+    if path.exists():
+        return False
+    with _LOCK:
+        if path.exists():
+            return False
+        _build(username)
+        return True
+
+def _connect(username: str) -> sqlite3.Connection:
+    _ensure(username)
+    return _open(db_path(username))
+
+def _session_files(username: str) -> List[Path]:
+    # 延迟导入，避免 storage_service -> fork_store -> search_service 循环引用
+    from app.services import storage_service
+    user_dir = DATA_ROOT / username
+    if not user_dir.exists():
+        return []
+    files = list(user_dir.glob("*.txt"))
+    files.extend(file for file, _ in storage_service.list_cold_sessions(user_dir))
+    return files
+
+def _own_blocks(path: Path) -> Iterable[dict]:
+    """会话文件自身保存的历史块（冷存储会话直接从 .json.gz 读取）"""
+    from app.services import storage_service
+    json_path = Path(path).with_suffix(".json")
+    if json_path.exists():
+        return (codec.loads(line) for line in history_store.iter_raw(json_path))
+    if storage_service.is_cold(path) and Path(str(json_path) + ".gz").exists():
+        return codec.loads(b"".join(storage_service.iter_cold_bytes(json_path)) or b"[]")
+    return []
+
+def _rows(session: str, blocks: Iterable[dict]) -> Iterable[tuple]:
+    for block in blocks:
+        if block.get("status") == "active" and block.get("content"):
+            yield (block["content"], session, block["id"], block.get("role"), block.get("timestamp"))
+
+def _insert(conn: sqlite3.Connection, session: str, blocks: Iterable[dict]) -> int:
+    cursor = conn.executemany(
+        "INSERT INTO blocks (content, session, block_id, role, timestamp) VALUES (?, ?, ?, ?, ?)",
+        _rows(session, blocks)
+    )
+    return cursor.rowcount
+
+def _build(username: str) -> dict:
+    """在临时库中索引全部会话，完成后替换正式库"""
+    start = time.perf_counter()
+    path = db_path(username)
+    tmp_path = path.with_suffix(".db.tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path.unlink(missing_ok=True)
+    sessions = blocks = 0
+    with closing(_open(tmp_path)) as conn:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        for file in _session_files(username):
+            try:
+                blocks += _insert(conn, file.name, _own_blocks(file))
+                sessions += 1
+            except Exception as e:
+                print(f"Error indexing session {file}: {e}")
+        conn.execute("INSERT INTO blocks(blocks) VALUES ('optimize')")
+        conn.commit()
+    for suffix in ("-wal", "-shm"):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+    tmp_path.replace(path)
+    took_ms = round((time.perf_counter() - start) * 1000, 2)
+    print(f"Search index built for {username}: {sessions} sessions, {blocks} blocks in {took_ms} ms")
+    return {"username": username, "sessions": sessions, "blocks": blocks, "took_ms": took_ms}
+
+def rebuild(username: str) -> dict:
+    with _LOCK:
+        return _build(username)
+
+# --- 增量更新（失败只记录日志，不影响写操作本身；索引不一致时可重建） ---
+# 均在文件写入之后调用：库若是此时才全量建立的，已包含本次改动，直接返回。
+
+def add_blocks(username: str, session: str, blocks: List[dict]):
+    try:
+        if _ensure(username):
+            return
+        with closing(_open(db_path(username))) as conn:
+            _insert(conn, session, blocks)
+            conn.commit()
+    except Exception as e:
+        print(f"Error updating search index for {username}/{session}: {e}")
+
+def remove_block(username: str, session: str, block_id: str):
+    try:
+        if _ensure(username):
+            return
+        with closing(_open(db_path(username))) as conn:
+            conn.execute("DELETE FROM blocks WHERE session = ? AND block_id = ?", (session, block_id))
+            conn.commit()
+    except Exception as e:
+        print(f"Error updating search index for {username}/{session}: {e}")
+
+def reindex_session(username: str, path: Path):
+    path = Path(path)
+    try:
+        if _ensure(username):
+            return
+        with closing(_open(db_path(username))) as conn:
+            conn.execute("DELETE FROM blocks WHERE session = ?", (path.name,))
+            _insert(conn, path.name, _own_blocks(path))
+            conn.commit()
+    except Exception as e:
+        print(f"Error updating search index for {username}/{path.name}: {e}")
+
+def on_renamed(username: str, old_session: str, new_session: str):
+    try:
+        if _ensure(username):
+            return
+        with closing(_open(db_path(username))) as conn:
+            conn.execute("UPDATE blocks SET session = ? WHERE session = ?", (new_session, old_session))
+            conn.commit()
+    except Exception as e:
+        print(f"Error updating search index for {username}/{old_session}: {e}")
+
+# --- Search ---
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _snippet(content: str, terms: List[str]) -> str:
+    lowered = content.lower()
+    positions = [p for p in (lowered.find(t.lower()) for t in terms) if p >= 0]
+    pos = min(positions) if positions else 0
+    start = max(0, pos - SNIPPET_CHARS)
+    end = min(len(content), pos + SNIPPET_CHARS + max(len(t) for t in terms))
+    snippet = content[start:end].replace("\n", " ")
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(content) else "")
+
+def search(username: str, query: str, limit: int = 20, session: Optional[str] = None) -> dict:
+    """
+    多个关键词以空格分隔，需同时命中。
+    含 3 字及以上关键词时按 bm25 相关度排序，否则按写入时间倒序。
+    """
+    start = time.perf_counter()
+    terms = [t for t in query.split() if t]
+    if not terms:
+        return {"query": query, "hits": [], "took_ms": 0.0}
+    limit = max(1, min(limit, SEARCH_MAX_RESULTS))
+    long_terms = [t for t in terms if len(t) >= TRIGRAM_MIN_CHARS]
+    short_terms = [t for t in terms if len(t) < TRIGRAM_MIN_CHARS]
+
+    where, params = [], []
+    if long_terms:
+        where.append("blocks MATCH ?")
+        params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+    for term in short_terms:
+        where.append("content LIKE ? ESCAPE '\\'")
+        params.append(f"%{_escape_like(term)}%")
+    if session:
+        where.append("session = ?")
+        params.append(session)
+    score = "-bm25(blocks)" if long_terms else "NULL"
+    order = "rank" if long_terms else "rowid DESC"
+    sql = (
+        f"SELECT session, block_id, role, timestamp, content, {score} FROM blocks "
+        f"WHERE {' AND '.join(where)} ORDER BY {order} LIMIT ?"
+    )
+    params.append(limit)
+
+    with closing(_connect(username)) as conn:
+        rows = conn.execute(sql, params).fetchall()
+
+    hits = [
+        {
+            "session": row[0],
+            "block_id": row[1],
+            "role": row[2],
+            "timestamp": row[3],
+            "snippet": _snippet(row[4], terms),
+            "score": round(row[5], 4) if row[5] is not None else None,
+        }
+        for row in rows
+    ]
+    return {"query": query, "hits": hits, "took_ms": round((time.perf_counter() - start) * 1000, 2)}
@@ -1,8 +1,11 @@
-import json
+import os
 import datetime
+import zipfile
 from pathlib import Path
-from app.core.config import DATA_ROOT
+from app.core.config import DATA_ROOT, BLOCK_STORE
+from app.core import codec, etag
 from app.services.user_manager import get_user_config, save_base_config_only
+from app.services import stats_service, text_cache, history_store, fork_store, chapter_index, storage_service, block_store, speculative_service
 
 def list_user_sessions(username: str):
     user_data_dir = DATA_ROOT / username
@@ -19,25 +22,59 @@ def list_user_sessions(username: str):
             last_msg = ""
             if json_path.exists():
                 try:
-                    history = json.loads(json_path.read_text(encoding="utf-8"))
-                    if history:
-                        last_msg = history[-1].get("content", "")[:50] + "..."
+                    last_block = fork_store.last_block(json_path)
+                    if last_block:
+                        last_msg = last_block.get("content", "")[:50] + "..."
                 except: pass
 
+            fork = fork_store.fork_ref(file)
+            # 块存储会话保存时只写 json，修改时间取两者较新的
+            updated_at = max(stat.st_mtime, json_path.stat().st_mtime if json_path.exists() else 0)
             sessions.append({
                 "filename": file.name,
                 "path": str(file),
-                "updated_at": stat.st_mtime,
+                "updated_at": updated_at,
                 "preview": last_msg or "(无历史记录)",
-                "size": stat.st_size
+                "size": stat.st_size or block_store.dropped_size(file),
+                "forked_from": fork["parent"] if fork else None
             })
         except Exception as e:
             print(f"Error reading session {file}: {e}")
 
+    # 冷存储的会话：信息取自 .cold.json，切换时自动解压
+    for file, manifest in storage_service.list_cold_sessions(user_data_dir):
+        sessions.append({
+            "filename": file.name,
+            "path": str(file),
+            "updated_at": manifest["txt_mtime_ns"] / 1e9,
+            "preview": manifest.get("preview") or "(无历史记录)",
+            "size": manifest["txt_size"],
+            "forked_from": None,
+            "cold": True
+        })
+
     # 按时间倒序排序
     sessions.sort(key=lambda x: x["updated_at"], reverse=True)
     return sessions
 
+def sessions_version(username: str) -> str:
+    """会话列表的版本戳：用户目录下所有 txt/json 的 (mtime, size)"""
+    user_data_dir = DATA_ROOT / username
+    if not user_data_dir.exists():
+        return "-"
+    stamps = []
+    with os.scandir(user_data_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith((".txt", ".json")):
+                st = entry.stat()
+                stamps.append(f"{entry.name}:{st.st_mtime_ns}:{st.st_size}")
+    stamps.sort()
+    return ",".join(stamps)
+
+def history_version(username: str) -> str:
+    config = get_user_config(username)
+    return etag.file_stamp(Path(config["file_path"]).with_suffix(".json"))
+
 def get_session_history(username: str):
     config = get_user_config(username)
     path = Path(config["file_path"])
@@ -47,15 +84,29 @@ def get_session_history(username: str):
         return []
 
     try:
-        history = json.loads(json_path.read_text(encoding="utf-8"))
-        return history
+        return fork_store.load_history(json_path)
     except Exception as e:
         print(f"Error reading history {json_path}: {e}")
         return []
 
+def get_session_history_page(username: str, cursor: int = None, limit: int = 50,
+                             include_discarded: bool = True, fields: list = None, reverse: bool = False):
+    config = get_user_config(username)
+    json_path = Path(config["file_path"]).with_suffix(".json")
+    try:
+        return history_store.paginate(fork_store.iter_history_raw(json_path), cursor, limit, include_discarded, fields, reverse)
+    except Exception as e:
+        print(f"Error reading history {json_path}: {e}")
+        return {"items": [], "next_cursor": None, "total": 0}
+
+def get_archived_block(username: str, block_id: str):
+    config = get_user_config(username)
+    return storage_service.find_archived_block(Path(config["file_path"]), block_id)
+
 def switch_user_session(username: str, filename: str):
     user_data_dir = DATA_ROOT / username
     target_path = user_data_dir / filename
+    storage_service.ensure_warm(target_path)
 
     if not target_path.exists():
         raise FileNotFoundError("Session file not found")
@@ -64,30 +115,103 @@ def switch_user_session(username: str, filename: str):
     config = get_user_config(username)
     config["file_path"] = str(target_path)
     save_base_config_only(username, config)
+    text_cache.invalidate(username)
+    speculative_service.cancel(username, "switch")
 
     return str(target_path)
 
+def _new_session_path(directory: Path) -> Path:
+    """按当前时间生成会话文件名；同一秒内已有同名会话（txt、历史、分叉记录或冷存储）时追加序号 _2、_3…"""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = directory / f"{timestamp}.txt"
+    n = 1
+    while (path.exists() or path.with_suffix(".json").exists() or fork_store.fork_path(path).exists()
+           or storage_service.is_cold(path)):
+        n += 1
+        path = directory / f"{timestamp}_{n}.txt"
+    return path
+
 def create_new_session(username: str):
     config = get_user_config(username)
 
     # 1. 生成新文件名
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     user_data_dir = DATA_ROOT / username
     user_data_dir.mkdir(parents=True, exist_ok=True)
 
-    new_txt_path = user_data_dir / f"{timestamp}.txt"
-    new_json_path = user_data_dir / f"{timestamp}.json"
+    new_txt_path = _new_session_path(user_data_dir)
+    new_json_path = new_txt_path.with_suffix(".json")
 
     # 2. 创建空文件
     new_txt_path.touch()
-    new_json_path.write_text("[]", encoding="utf-8")
+    history_store.save(new_json_path, [])
+    if BLOCK_STORE:
+        block_store.create(new_txt_path)
+    stats_service.update(username, sessions=1)
 
     # 3. 切换上下文
     config["file_path"] = str(new_txt_path)
     save_base_config_only(username, config)
+    text_cache.invalidate(username)
+    speculative_service.cancel(username, "switch")
 
     return {"filename": new_txt_path.name, "path": str(new_txt_path)}
 
+def fork_session(username: str, block_id: str, switch: bool = True):
+    """
+    从当前会话的某个正文块分叉出新会话（写时复制，见 fork_store）。
+    新会话只记录对父会话前缀的引用，创建开销与小说长度无关。
+    """
+    config = get_user_config(username)
+    parent = Path(config["file_path"])
+    parent_json = parent.with_suffix(".json")
+    if not parent.exists():
+        raise FileNotFoundError("Session file not found")
+    block_store.ensure_view(parent)
+
+    # 块在逻辑正文中的结束位置来自章节索引
+    segments = chapter_index.get(parent, lambda: fork_store.load_history(parent_json))["segments"]
+    segment = next((s for s in segments if s["block_id"] == block_id), None)
+    if not segment:
+        raise ValueError("Block not found in novel text")
+
+    # 块在逻辑历史中的序号：按行查找，不解析其他块
+    needle = block_id.encode("utf-8")
+    prefix_blocks = None
+    for index, line in enumerate(fork_store.iter_history_raw(parent_json)):
+        if needle in line and codec.loads(line)["id"] == block_id:
+            prefix_blocks = index + 1
+            break
+    if prefix_blocks is None:
+        raise ValueError("Block not found")
+
+    # 前缀包含块末尾的换行
+    prefix_bytes = segment["end"]
+    if fork_store.read_bytes(parent, prefix_bytes, prefix_bytes + 1) == b"\n":
+        prefix_bytes += 1
+
+    new_txt_path = _new_session_path(parent.parent)
+    new_txt_path.touch()
+    history_store.save(new_txt_path.with_suffix(".json"), [])
+    ref = {
+        "parent": parent.name,
+        "block_id": block_id,
+        "prefix_blocks": prefix_blocks,
+        "prefix_bytes": prefix_bytes,
+        "created_at": datetime.datetime.now().isoformat()
+    }
+    codec.write_file(fork_store.fork_path(new_txt_path), ref)
+    if BLOCK_STORE:
+        block_store.create(new_txt_path)
+    stats_service.update(username, sessions=1)
+
+    if switch:
+        config["file_path"] = str(new_txt_path)
+        save_base_config_only(username, config)
+        text_cache.invalidate(username)
+        speculative_service.cancel(username, "switch")
+
+    return {"filename": new_txt_path.name, "path": str(new_txt_path), **ref}
+
 def switch_file_path(username: str, target_path: str):
     config = get_user_config(username)
     user_data_dir = DATA_ROOT / username
@@ -98,7 +222,81 @@ def switch_file_path(username: str, target_path: str):
     # 这里的逻辑参考原 server.py
     # if ".." in str(safe_path) or not str(safe_path).startswith(str(user_data_dir)):
     #      pass
+    storage_service.ensure_warm(safe_path)
 
     config["file_path"] = str(safe_path)
     save_base_config_only(username, config)
+    text_cache.invalidate(username)
+    speculative_service.cancel(username, "switch")
     return str(safe_path)
+
+def resolve_session_file(username: str, filename: str = None) -> Path:
+    """返回会话 txt 路径；未指定 filename 时为当前会话。只允许访问自己目录下的 txt"""
+    if not filename:
+        path = Path(get_user_config(username)["file_path"])
+    else:
+        path = DATA_ROOT / username / Path(filename).name
+    storage_service.ensure_warm(path)
+    if path.suffix != ".txt" or not path.exists():
+        raise FileNotFoundError("Session file not found")
+    block_store.ensure_view(path)
+    return path
+
+# --- Export ---
+
+class _ZipSink:
+    """zipfile 的只写输出目标：不支持 seek，zipfile 会改用数据描述符，可边写边取走数据"""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_sessions_zip(username: str):
+    """
+    逐块生成包含用户全部会话（txt + 历史 json）的 zip 数据，
+    每次只在内存中保留一个读取块及其压缩结果，与小说大小无关。
+    """
+    user_data_dir = DATA_ROOT / username
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for txt in sorted(user_data_dir.glob("*.txt")):
+            for source in (txt, txt.with_suffix(".json")):
+                if not source.exists():
+                    continue
+                info = zipfile.ZipInfo.from_file(source, arcname=source.name)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                # 分叉会话导出完整的逻辑内容（含父会话共享前缀），块存储会话的视图落后时由历史生成
+                chunks = block_store.iter_bytes(txt) if source == txt else fork_store.iter_history_bytes(source)
+                with zf.open(info, "w", force_zip64=True) as dest:
+                    for chunk in chunks:
+                        dest.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                data = sink.drain()
+                if data:
+                    yield data
+        # 冷存储的会话直接从 .gz 解压写入，不落盘
+        for txt, manifest in storage_service.list_cold_sessions(user_data_dir):
+            sources = [txt] + ([txt.with_suffix(".json")] if manifest.get("json_mtime_ns") is not None else [])
+            for source in sources:
+                mtime = (manifest["txt_mtime_ns"] if source == txt else manifest["json_mtime_ns"]) / 1e9
+                info = zipfile.ZipInfo(source.name, datetime.datetime.fromtimestamp(mtime).timetuple()[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with zf.open(info, "w", force_zip64=True) as dest:
+                    for chunk in storage_service.iter_cold_bytes(source):
+                        dest.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+    yield sink.drain()
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import json
+from typing import Awaitable, Callable, Dict, List, Optional
+from app.services import metrics
+
+# 合并重复请求（双击、前端重试）：相同 key 的请求在进行中时，
+# 后到的请求直接复用进行中的结果/流，不再发起新的上游调用。
+#   do()     普通协程，后到者等待同一个结果（auto_rename）
+#   stream() 流式生成，后到者先回放已生成的内容，再跟随后续输出（generate）
+# 已结束的请求立即移除，不做结果缓存。
+
+def make_key(username: str, op: str, session: str, *parts) -> str:
+    fingerprint = hashlib.sha1(
+        json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return f"{username}:{op}:{session}:{fingerprint}"
+
+# --- Coroutine ---
+
+_CALLS: Dict[str, asyncio.Future] = {}
+
+async def do(key: str, op: str, factory: Callable[[], Awaitable]):
+    future = _CALLS.get(key)
+    if future is not None:
+        metrics.inc("singleflight_coalesced_total", op=op)
+        return await asyncio.shield(future)
+
+    metrics.inc("singleflight_leaders_total", op=op)
+    future = asyncio.ensure_future(factory())
+    _CALLS[key] = future
+    future.add_done_callback(lambda _: _CALLS.pop(key, None))
+    return await asyncio.shield(future)
+
+# --- Stream ---
+
+class _Flight:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self, source):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                async with self.changed:
+                    self.changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            await source.aclose()
+            self.done = True
+            async with self.changed:
+                self.changed.notify_all()
+
+_FLIGHTS: Dict[str, _Flight] = {}
+
+def start_flight(source) -> _Flight:
+    """在独立任务中开始消费 source，返回尚未登记到任何 key 的 flight（预生成先行启动时使用）"""
+    flight = _Flight()
+    flight.task = asyncio.create_task(flight.run(source))
+    return flight
+
+async def stream(key: str, op: str, factory: Callable[[], object]):
+    """
+    订阅 key 对应的生成流。生产者在独立任务中运行，所有订阅者都断开后才取消，
+    因此单个订阅者断开不会影响其他订阅者，全部断开时仍会及时取消上游。
+    factory 返回异步生成器，或返回 start_flight 已启动的 flight（直接接管，已生成的内容照常回放）。
+    """
+    flight = _FLIGHTS.get(key)
+    if flight is None or flight.done:
+        metrics.inc("singleflight_leaders_total", op=op)
+        source = factory()
+        flight = _FLIGHTS[key] = source if isinstance(source, _Flight) else start_flight(source)
+        flight.task.add_done_callback(lambda _: _FLIGHTS.pop(key, None) if _FLIGHTS.get(key) is flight else None)
+    else:
+        metrics.inc("singleflight_coalesced_total", op=op)
+
+    flight.subscribers += 1
+    index = 0
+    try:
+        while True:
+            async with flight.changed:
+                while index >= len(flight.chunks) and not flight.done:
+                    await flight.changed.wait()
+            while index < len(flight.chunks):
+                chunk = flight.chunks[index]
+                index += 1
+                yield chunk
+            if flight.done and index >= len(flight.chunks):
+                break
+        if flight.error is not None:
+            raise flight.error
+    finally:
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            flight.task.cancel()
+            try:
+                await flight.task
+            except BaseException:
+                pass
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Callable, Dict, Optional
+from app.core.config import SPECULATIVE_TTL_SECONDS
+from app.services import singleflight, metrics
+
+# 预生成：用户保存一段正文后，几乎总会用默认 prompt 再次续写。
+# 用户组开启 speculative_generation 时，save 之后在后台按默认 prompt 先行生成，
+# 结果最多保留 SPECULATIVE_TTL_SECONDS 秒。下一次 /generate 的请求 key（会话、消息、候选数，
+# 见 singleflight.make_key）相同时直接接管预生成的 flight：已生成的内容回放，仍在生成则继续跟随输出。
+# 每个用户最多一个预生成：新的 save 会替换它，discard、切换会话、key 不同的生成请求
+# （自定义 prompt、多候选）会取消它。是否有余量启动由 rate_limit_service.has_headroom 判断，
+# 运行期间占用该用户的一个并发名额（on_finish 中释放）。
+
+class _Speculation:
+    def __init__(self, key: str, flight):
+        self.key = key
+        self.flight = flight  # singleflight.start_flight 启动，被接管后由 singleflight.stream 继续管理
+        self.expire: Optional[asyncio.TimerHandle] = None
+
+_SPECULATIONS: Dict[str, _Speculation] = {}
+
+def start(username: str, key: str, factory: Callable[[], object], on_finish: Callable[[], None]):
+    """开始（或替换）该用户的预生成；须在事件循环中调用"""
+    cancel(username, "replaced")
+    spec = _SPECULATIONS[username] = _Speculation(key, singleflight.start_flight(factory()))
+    # 任务在开始运行前就被取消时 run() 不会执行，名额在完成回调中释放
+    spec.flight.task.add_done_callback(lambda _: on_finish())
+    spec.expire = asyncio.get_running_loop().call_later(
+        SPECULATIVE_TTL_SECONDS, lambda: _SPECULATIONS.get(username) is spec and cancel(username, "expired")
+    )
+    metrics.inc("speculative_started_total")
+    print(f"[{username}] 预生成已启动")
+
+def cancel(username: str, reason: str):
+    spec = _SPECULATIONS.pop(username, None)
+    if spec is None:
+        return
+    spec.expire.cancel()
+    if not spec.flight.task.done():
+        spec.flight.task.cancel()
+    metrics.inc("speculative_wasted_total", reason=reason)
+    print(f"[{username}] 预生成已丢弃（{reason}）")
+
+def claim(username: str, key: str):
+    """
+    请求 key 与预生成一致时接管它，返回交给 singleflight.stream 的 flight，否则返回 None。
+    key 不一致或预生成出错时将其丢弃，由调用方正常请求上游。
+    接管后客户端全部断开时，由 singleflight.stream 取消剩余的生成。
+    """
+    spec = _SPECULATIONS.get(username)
+    if spec is None:
+        return None
+    if spec.key != key:
+        cancel(username, "mismatch")
+        return None
+    if spec.flight.error is not None:
+        cancel(username, "error")
+        return None
+    _SPECULATIONS.pop(username)
+    spec.expire.cancel()
+    metrics.inc("speculative_hits_total")
+    print(f"[{username}] 命中预生成（已生成 {sum(len(c) for c in spec.flight.chunks)} 字）")
+    return spec.flight
@@ -0,0 +1,162 @@
+import time
+import threading
+from typing import Dict
+from app.core.config import DATA_ROOT, STATS_FILE
+from app.core import codec
+from app.services import history_store
+
+# 存储统计：按用户、按用户组维护的计数器，作为写操作的副作用增量更新，
+# 管理接口直接读内存中的汇总值，不需要遍历 DATA_ROOT。
+#   sessions          会话数（.txt 文件数）
+#   text_bytes        小说正文字节数（.txt 总大小，冷存储会话按 .txt.gz 大小计，块存储会话按当前视图大小计）
+#   blocks            历史块数
+#   discarded_blocks  被丢弃的历史块数
+# 计数可能因手工改动文件而漂移，由 reconcile() 全量扫描修正。
+
+FIELDS = ("sessions", "text_bytes", "blocks", "discarded_blocks")
+FLUSH_INTERVAL = 5.0  # 秒，计数落盘的最小间隔
+
+_LOCK = threading.RLock()
+_STATE = {"users": {}, "groups": {}, "reconciled_at": 0}
+_last_flush = 0.0
+_dirty = False
+
+def _empty() -> dict:
+    return {field: 0 for field in FIELDS}
+
+def _with_ratio(counters: dict) -> dict:
+    data = dict(counters)
+    blocks = data.get("blocks", 0)
+    data["discarded_ratio"] = round(data.get("discarded_blocks", 0) / blocks, 4) if blocks else 0.0
+    return data
+
+def load():
+    global _STATE
+    with _LOCK:
+        if STATS_FILE.exists():
+            try:
+                _STATE = codec.read_file(STATS_FILE)
+            except Exception as e:
+                print(f"Error reading stats {STATS_FILE}: {e}")
+
+def flush(force: bool = False):
+    global _last_flush, _dirty
+    with _LOCK:
+        if not _dirty or (not force and time.monotonic() - _last_flush < FLUSH_INTERVAL):
+            return
+        codec.write_file(STATS_FILE, _STATE, atomic=True)
+        _last_flush = time.monotonic()
+        _dirty = False
+
+def _user_group(username: str) -> str:
+    # 延迟导入，避免与 user_manager 循环引用
+    from app.services.user_manager import get_user_group
+    return get_user_group(username)
+
+def update(username: str, **deltas):
+    """对某用户的计数做增量修改，并同步到其所在组的汇总"""
+    global _dirty
+    with _LOCK:
+        user = _STATE["users"].get(username)
+        if user is None:
+            user = _STATE["users"][username] = {"group": _user_group(username), **_empty()}
+        group = _STATE["groups"].setdefault(user["group"], _empty())
+        for field, delta in deltas.items():
+            user[field] = user.get(field, 0) + delta
+            group[field] = group.get(field, 0) + delta
+        _dirty = True
+    flush()
+
+def on_user_group_changed(username: str, new_group: str):
+    """用户换组时，把其计数从旧组汇总移到新组"""
+    global _dirty
+    with _LOCK:
+        user = _STATE["users"].get(username)
+        if not user or user["group"] == new_group:
+            return
+        old = _STATE["groups"].setdefault(user["group"], _empty())
+        new = _STATE["groups"].setdefault(new_group, _empty())
+        for field in FIELDS:
+            old[field] -= user.get(field, 0)
+            new[field] += user.get(field, 0)
+        user["group"] = new_group
+        _dirty = True
+    flush()
+
+def get_summary(include_users: bool = False) -> dict:
+    with _LOCK:
+        totals = _empty()
+        for counters in _STATE["groups"].values():
+            for field in FIELDS:
+                totals[field] += counters.get(field, 0)
+        result = {
+            "totals": _with_ratio(totals),
+            "groups": {name: _with_ratio(c) for name, c in _STATE["groups"].items()},
+            "reconciled_at": _STATE.get("reconciled_at", 0),
+        }
+        if include_users:
+            result["users"] = {name: _with_ratio(c) for name, c in _STATE["users"].items()}
+        return result
+
+def get_user_stats(username: str) -> dict:
+    with _LOCK:
+        return _with_ratio(_STATE["users"].get(username) or {"group": _user_group(username), **_empty()})
+
+# --- Reconcile ---
+
+def _scan_user(user_dir) -> dict:
+    counters = _empty()
+    for txt in user_dir.glob("*.txt"):
+        counters["sessions"] += 1
+        counters["text_bytes"] += txt.stat().st_size
+        json_path = txt.with_suffix(".json")
+        if not json_path.exists():
+            continue
+        try:
+            history = history_store.load(json_path)
+        except Exception:
+            continue
+        counters["blocks"] += len(history)
+        counters["discarded_blocks"] += sum(1 for item in history if item.get("status") == "discarded")
+    # 冷存储的会话（见 storage_service）：计数取自 .cold.json，正文按压缩后大小计
+    for manifest_path in user_dir.glob("*.cold.json"):
+        try:
+            manifest = codec.read_file(manifest_path)
+        except Exception:
+            continue
+        counters["sessions"] += 1
+        counters["text_bytes"] += manifest.get("txt_gz_size", 0)
+        counters["blocks"] += manifest.get("blocks", 0)
+        counters["discarded_blocks"] += manifest.get("discarded_blocks", 0)
+    return counters
+
+def reconcile() -> dict:
+    """全量扫描 DATA_ROOT 重建计数，返回与扫描前的差异"""
+    from app.services.user_manager import get_users_db
+    users_db = get_users_db()
+
+    scanned: Dict[str, dict] = {}
+    for user_dir in DATA_ROOT.iterdir():
+        if user_dir.is_dir():
+            scanned[user_dir.name] = _scan_user(user_dir)
+
+    global _STATE, _dirty
+    with _LOCK:
+        drift = {}
+        for username, counters in scanned.items():
+            old = _STATE["users"].get(username) or _empty()
+            diff = {f: counters[f] - old.get(f, 0) for f in FIELDS if counters[f] != old.get(f, 0)}
+            if diff:
+                drift[username] = diff
+
+        new_state = {"users": {}, "groups": {}, "reconciled_at": time.time()}
+        for username, counters in scanned.items():
+            group_name = users_db.get(username, {}).get("group", "default")
+            new_state["users"][username] = {"group": group_name, **counters}
+            group = new_state["groups"].setdefault(group_name, _empty())
+            for field in FIELDS:
+                group[field] += counters[field]
+        _STATE = new_state
+        _dirty = True
+    flush(force=True)
+    return {"users_scanned": len(scanned), "drift": drift}
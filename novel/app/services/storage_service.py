@@ -0,0 +1,376 @@
+import os
+import gzip
+import time
+import shutil
+import asyncio
+import datetime
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional
+from app.core.config import (
+    DATA_ROOT, CONFIG_ROOT, STORAGE_REPORT_FILE, MAINTENANCE_INTERVAL_HOURS,
+    COMPACT_IDLE_MINUTES, COLD_AFTER_DAYS, VIEW_DROP_AFTER_DAYS
+)
+from app.core import codec
+from app.services import history_store, fork_store, block_store, stats_service, metrics
+
+# 存储维护，由后台任务定期执行，也可通过 manage.py 或管理接口手动触发。
+#
+# 1. 历史压缩：已丢弃块的正文移到 <session>.archive.jsonl.gz（每次追加一个 gzip 成员，
+#    每行一个完整块），历史中只保留去掉正文的占位块（"archived": true），块序号不变。
+#    被分叉子会话共享的前缀块不压缩。
+# 2. 冷存储：超过 COLD_AFTER_DAYS 未修改的会话，txt/json 压缩为 .txt.gz/.json.gz，
+#    并写入 <session>.cold.json 记录原始大小、修改时间等。切换到该会话（或保存、下载）
+#    时透明解压。当前会话、参与分叉的会话不会被冷存储。
+# 3. 视图清空：块存储会话（见 block_store）超过 VIEW_DROP_AFTER_DAYS 未修改时清空其 txt 视图，
+#    正文只保留历史中的一份，下次读取时重建。同样跳过当前会话与参与分叉的会话。
+
+ARCHIVE_SUFFIX = ".archive.jsonl.gz"
+COLD_SUFFIX = ".cold.json"
+GZIP_LEVEL = 6
+COPY_CHUNK = 1024 * 1024
+
+_LOCK = threading.Lock()
+
+def archive_path(path: Path) -> Path:
+    return Path(path).with_suffix(ARCHIVE_SUFFIX)
+
+def cold_manifest_path(path: Path) -> Path:
+    return Path(path).with_suffix(COLD_SUFFIX)
+
+def _stamp(path: Path) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _current_sessions() -> set:
+    """所有用户当前打开的会话，不参与冷存储"""
+    current = set()
+    for config_path in CONFIG_ROOT.glob("*.json"):
+        try:
+            file_path = codec.read_file(config_path).get("file_path")
+            if file_path:
+                current.add(str(Path(file_path)))
+        except Exception:
+            pass
+    return current
+
+def _in_fork(path: Path) -> bool:
+    return bool(fork_store.fork_ref(path) or fork_store.list_children(path))
+
+# --- Compaction ---
+
+def compact_session(path: Path, dry_run: bool = False) -> Optional[dict]:
+    """把已丢弃块的正文移入归档，返回本次压缩的统计；没有可压缩的块时返回 None"""
+    path = Path(path)
+    json_path = path.with_suffix(".json")
+    stamp = _stamp(json_path)
+    if stamp is None:
+        return None
+
+    history = history_store.load(json_path)
+    protected = max((ref["prefix_blocks"] for _, ref in fork_store.list_children(path)), default=0)
+    moved = [
+        block for index, block in enumerate(history)
+        if index >= protected and block.get("status") == "discarded" and not block.get("archived")
+    ]
+    if not moved:
+        return None
+
+    content_bytes = sum(len(block.get("content", "").encode("utf-8")) for block in moved)
+    if dry_run:
+        return {"blocks": len(moved), "bytes_before": stamp[1], "bytes_after": stamp[1] - content_bytes}
+
+    with gzip.open(archive_path(path), "ab", compresslevel=GZIP_LEVEL) as f:
+        for block in moved:
+            f.write(codec.dumpb(block) + b"\n")
+    for block in moved:
+        block["content"] = ""
+        block["archived"] = True
+
+    tmp_path = json_path.with_suffix(".json.tmp")
+    history_store.save(tmp_path, history)
+    # 压缩期间历史被修改则放弃本次结果（已写入归档的块下次会再次归档，读取时取最后一条）；
+    # 检查与替换在会话锁内完成，期间不会有 save / discard 写入
+    with history_store.session_lock(path):
+        if _stamp(json_path) != stamp:
+            tmp_path.unlink()
+            return None
+        os.replace(tmp_path, json_path)
+        return {"blocks": len(moved), "bytes_before": stamp[1], "bytes_after": json_path.stat().st_size}
+
+def find_archived_block(path: Path, block_id: str) -> Optional[dict]:
+    archive = archive_path(path)
+    if not archive.exists():
+        return None
+    needle = block_id.encode("utf-8")
+    found = None
+    with gzip.open(archive, "rb") as f:
+        for line in f:
+            if needle in line:
+                block = codec.loads(line)
+                if block["id"] == block_id:
+                    found = block
+    return found
+
+# --- Cold storage ---
+
+def is_cold(path: Path) -> bool:
+    path = Path(path)
+    return not path.exists() and cold_manifest_path(path).exists()
+
+def _gzip_file(source: Path, target: Path):
+    with open(source, "rb") as src, gzip.open(target, "wb", compresslevel=GZIP_LEVEL) as dest:
+        shutil.copyfileobj(src, dest, COPY_CHUNK)
+
+def _gunzip_file(source: Path, target: Path):
+    with gzip.open(source, "rb") as src, open(target, "wb") as dest:
+        shutil.copyfileobj(src, dest, COPY_CHUNK)
+
+def _gunzip_size(source: Path) -> int:
+    total = 0
+    with gzip.open(source, "rb") as src:
+        while True:
+            data = src.read(COPY_CHUNK)
+            if not data:
+                return total
+            total += len(data)
+
+def freeze_session(path: Path, dry_run: bool = False) -> Optional[dict]:
+    """把会话压缩为冷存储，返回统计；期间会话被修改则放弃"""
+    path = Path(path)
+    json_path = path.with_suffix(".json")
+    txt_stamp, json_stamp = _stamp(path), _stamp(json_path)
+    if txt_stamp is None:
+        return None
+    bytes_before = txt_stamp[1] + (json_stamp[1] if json_stamp else 0)
+    if dry_run:
+        return {"bytes_before": bytes_before}
+
+    targets = [(path, path.with_suffix(".txt.gz"))]
+    if json_stamp:
+        targets.append((json_path, json_path.with_suffix(".json.gz")))
+    for source, target in targets:
+        _gzip_file(source, target)
+
+    # 校验压缩结果，同时测出首次访问需要的解压时间
+    start = time.perf_counter()
+    sizes_ok = all(_gunzip_size(target) == source.stat().st_size for source, target in targets)
+    thaw_ms = (time.perf_counter() - start) * 1000
+
+    # 从检查修改时间到删除原文件都在会话锁内，期间不会有 save / discard 写入
+    with history_store.session_lock(path):
+        if not sizes_ok or _stamp(path) != txt_stamp or _stamp(json_path) != json_stamp:
+            for _, target in targets:
+                target.unlink(missing_ok=True)
+            return None
+
+        blocks = history_store.load(json_path) if json_stamp else []
+        bytes_after = sum(target.stat().st_size for _, target in targets)
+        manifest = {
+            "frozen_at": datetime.datetime.now().isoformat(),
+            "txt_mtime_ns": txt_stamp[0],
+            "txt_size": txt_stamp[1],
+            "json_mtime_ns": json_stamp[0] if json_stamp else None,
+            "json_size": json_stamp[1] if json_stamp else None,
+            "gz_size": bytes_after,
+            "txt_gz_size": targets[0][1].stat().st_size,
+            "blocks": len(blocks),
+            "discarded_blocks": sum(1 for b in blocks if b.get("status") == "discarded"),
+            "preview": (blocks[-1].get("content", "")[:50] + "...") if blocks else "",
+            "estimated_thaw_ms": round(thaw_ms, 2),
+        }
+        codec.write_file(cold_manifest_path(path), manifest)
+        for source, _ in targets:
+            source.unlink()
+
+    # 冷存储会话的正文字节数按压缩后大小计
+    stats_service.update(path.parent.name, text_bytes=manifest["txt_gz_size"] - txt_stamp[1])
+    return {"bytes_before": bytes_before, "bytes_after": bytes_after, "estimated_thaw_ms": manifest["estimated_thaw_ms"]}
+
+def thaw_session(path: Path) -> bool:
+    """解压冷存储的会话，恢复原修改时间；会话不是冷存储时返回 False"""
+    path = Path(path)
+    with history_store.session_lock(path):
+        return _thaw_session(path)
+
+def _thaw_session(path: Path) -> bool:
+    if not is_cold(path):
+        return False
+
+    start = time.perf_counter()
+    manifest = codec.read_file(cold_manifest_path(path))
+    json_path = path.with_suffix(".json")
+    # 先恢复 json，txt 出现即视为已解压
+    restores = []
+    if manifest.get("json_mtime_ns") is not None:
+        restores.append((json_path.with_suffix(".json.gz"), json_path, manifest["json_mtime_ns"]))
+    restores.append((path.with_suffix(".txt.gz"), path, manifest["txt_mtime_ns"]))
+    for source, target, mtime_ns in restores:
+        tmp = target.with_name(target.name + ".tmp")
+        _gunzip_file(source, tmp)
+        os.utime(tmp, ns=(mtime_ns, mtime_ns))
+        os.replace(tmp, target)
+    for source, _, _ in restores:
+        source.unlink()
+    cold_manifest_path(path).unlink()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    stats_service.update(path.parent.name, text_bytes=manifest["txt_size"] - manifest["txt_gz_size"])
+    metrics.inc("cold_storage_thaws_total")
+    metrics.inc("cold_storage_thaw_seconds_total", elapsed_ms / 1000)
+    _record_thaw(elapsed_ms)
+    print(f"Thawed cold session {path} in {elapsed_ms:.1f} ms")
+    return True
+
+def ensure_warm(path: Path):
+    if is_cold(path):
+        thaw_session(path)
+
+def list_cold_sessions(user_dir: Path) -> List[tuple]:
+    """返回 [(txt 路径, manifest)]"""
+    result = []
+    for manifest_path in Path(user_dir).glob("*" + COLD_SUFFIX):
+        try:
+            manifest = codec.read_file(manifest_path)
+        except Exception as e:
+            print(f"Error reading cold manifest {manifest_path}: {e}")
+            continue
+        result.append((manifest_path.with_name(manifest_path.name[:-len(COLD_SUFFIX)] + ".txt"), manifest))
+    return result
+
+def iter_cold_bytes(path: Path) -> Iterable[bytes]:
+    """不解压到磁盘，直接读出冷存储文件（.txt 或 .json）的原始内容"""
+    with gzip.open(Path(str(path) + ".gz"), "rb") as f:
+        while True:
+            data = f.read(COPY_CHUNK)
+            if not data:
+                return
+            yield data
+
+# --- Report ---
+
+def _load_report() -> dict:
+    if not STORAGE_REPORT_FILE.exists():
+        return {}
+    try:
+        return codec.read_file(STORAGE_REPORT_FILE)
+    except Exception:
+        return {}
+
+def _record_thaw(elapsed_ms: float):
+    with _LOCK:
+        report = _load_report()
+        thaws = report.setdefault("thaws", {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        thaws["count"] += 1
+        thaws["total_ms"] = round(thaws["total_ms"] + elapsed_ms, 2)
+        thaws["max_ms"] = round(max(thaws["max_ms"], elapsed_ms), 2)
+        codec.write_file(STORAGE_REPORT_FILE, report, atomic=True)
+
+def get_report() -> dict:
+    report = _load_report()
+    thaws = report.get("thaws")
+    if thaws and thaws["count"]:
+        thaws["avg_ms"] = round(thaws["total_ms"] / thaws["count"], 2)
+    return report
+
+# --- Maintenance ---
+
+def run_maintenance(compact: bool = True, freeze: bool = True, cold_after_days: int = COLD_AFTER_DAYS,
+                    dry_run: bool = False, drop_views: bool = True) -> dict:
+    """扫描所有用户目录执行压缩、视图清空与冷存储，返回本次报告（非 dry_run 时写入 STORAGE_REPORT_FILE）"""
+    started = time.time()
+    compact_before = time.time() - COMPACT_IDLE_MINUTES * 60
+    drop_before = time.time() - VIEW_DROP_AFTER_DAYS * 86400
+    freeze_before = time.time() - cold_after_days * 86400
+    current = _current_sessions()
+
+    compaction = {"sessions": 0, "blocks_archived": 0, "bytes_before": 0, "bytes_after": 0}
+    views = {"sessions": 0, "bytes_before": 0, "bytes_after": 0}
+    cold = {"sessions": 0, "bytes_before": 0, "bytes_after": 0, "thaw_ms": []}
+    skipped = {"active": 0, "fork": 0, "changed": 0}
+
+    for user_dir in sorted(DATA_ROOT.iterdir()):
+        if not user_dir.is_dir():
+            continue
+        for txt in sorted(user_dir.glob("*.txt")):
+            json_path = txt.with_suffix(".json")
+            json_stamp = _stamp(json_path)
+            try:
+                if compact and json_stamp and json_stamp[0] / 1e9 < compact_before:
+                    result = compact_session(txt, dry_run)
+                    if result:
+                        compaction["sessions"] += 1
+                        compaction["blocks_archived"] += result["blocks"]
+                        compaction["bytes_before"] += result["bytes_before"]
+                        compaction["bytes_after"] += result["bytes_after"]
+
+                last_modified = max(txt.stat().st_mtime, json_stamp[0] / 1e9 if json_stamp else 0)
+                drop = drop_views and last_modified < drop_before and block_store.is_block_mode(txt)
+                if not drop and (not freeze or last_modified >= freeze_before):
+                    continue
+                if str(txt) in current:
+                    skipped["active"] += 1
+                    continue
+                if _in_fork(txt):
+                    skipped["fork"] += 1
+                    continue
+                if drop:
+                    result = block_store.drop_view(txt, dry_run)
+                    if result:
+                        views["sessions"] += 1
+                        views["bytes_before"] += result["bytes_before"]
+                        views["bytes_after"] += result["bytes_after"]
+                if not freeze or last_modified >= freeze_before:
+                    continue
+                result = freeze_session(txt, dry_run)
+                if not result:
+                    skipped["changed"] += 1
+                    continue
+                cold["sessions"] += 1
+                cold["bytes_before"] += result["bytes_before"]
+                cold["bytes_after"] += result.get("bytes_after", result["bytes_before"])
+                if "estimated_thaw_ms" in result:
+                    cold["thaw_ms"].append(result["estimated_thaw_ms"])
+            except Exception as e:
+                print(f"Storage maintenance failed for {txt}: {e}")
+
+    thaw_ms = cold.pop("thaw_ms")
+    cold["estimated_first_access_ms"] = {
+        "avg": round(sum(thaw_ms) / len(thaw_ms), 2) if thaw_ms else 0.0,
+        "max": round(max(thaw_ms), 2) if thaw_ms else 0.0,
+    }
+    for section in (compaction, views, cold):
+        section["bytes_reclaimed"] = section["bytes_before"] - section["bytes_after"]
+
+    run = {
+        "started_at": datetime.datetime.fromtimestamp(started).isoformat(),
+        "duration_ms": round((time.time() - started) * 1000, 2),
+        "dry_run": dry_run,
+        "compaction": compaction,
+        "views": views,
+        "cold_storage": cold,
+        "skipped": skipped,
+    }
+    if not dry_run:
+        with _LOCK:
+            report = _load_report()
+            report["last_run"] = run
+            codec.write_file(STORAGE_REPORT_FILE, report, atomic=True)
+        metrics.inc("storage_bytes_reclaimed_total", compaction["bytes_reclaimed"], kind="compaction")
+        metrics.inc("storage_bytes_reclaimed_total", views["bytes_reclaimed"], kind="views")
+        metrics.inc("storage_bytes_reclaimed_total", cold["bytes_reclaimed"], kind="cold_storage")
+    return run
+
+async def maintenance_loop():
+    """后台定期执行存储维护（在线程中运行，不阻塞事件循环）"""
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL_HOURS * 3600)
+        try:
+            report = await asyncio.to_thread(run_maintenance)
+            print(f"Storage maintenance done: {report['compaction']['bytes_reclaimed']} + "
+                  f"{report['views']['bytes_reclaimed']} + {report['cold_storage']['bytes_reclaimed']} bytes reclaimed")
+        except Exception as e:
+            print(f"Storage maintenance failed: {e}")
@@ -0,0 +1,108 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from app.core.config import TEXT_CACHE_MAX_BYTES
+from app.services import fork_store, metrics
+
+# 每个用户当前会话正文的内存 LRU 缓存，按总字节数淘汰。
+# 正文只会经由 save（追加）/ discard / switch / rename 改变：
+#   save    -> append() 原地追加
+#   其他    -> invalidate()
+# 另外每次命中都会比对文件的 (mtime, size)，被外部程序改动时自动失效。
+
+class _Entry:
+    __slots__ = ("path", "text", "stamp", "size")
+
+    def __init__(self, path: str, text: str, stamp: tuple):
+        self.path = path
+        self.text = text
+        self.stamp = stamp
+        self.size = sys.getsizeof(text)
+
+_LOCK = threading.Lock()
+_ENTRIES: "OrderedDict[str, _Entry]" = OrderedDict()
+_resident_bytes = 0
+_hits = 0
+_misses = 0
+
+def _stamp(path: Path) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _remove(username: str):
+    global _resident_bytes
+    entry = _ENTRIES.pop(username, None)
+    if entry:
+        _resident_bytes -= entry.size
+
+def _store(username: str, entry: _Entry):
+    global _resident_bytes
+    _remove(username)
+    if entry.size > TEXT_CACHE_MAX_BYTES:
+        return
+    _ENTRIES[username] = entry
+    _resident_bytes += entry.size
+    while _resident_bytes > TEXT_CACHE_MAX_BYTES:
+        oldest = next(iter(_ENTRIES))
+        _remove(oldest)
+        metrics.inc("text_cache_evictions_total")
+    metrics.set_gauge("text_cache_resident_bytes", _resident_bytes)
+
+def read_text(username: str, path: Path) -> str:
+    """读取会话正文，优先走缓存；文件不存在时返回空字符串"""
+    global _hits, _misses
+    path = Path(path)
+    stamp = _stamp(path)
+    if stamp is None:
+        return ""
+
+    with _LOCK:
+        entry = _ENTRIES.get(username)
+        if entry and entry.path == str(path) and entry.stamp == stamp:
+            _ENTRIES.move_to_end(username)
+            _hits += 1
+            metrics.inc("text_cache_hits_total")
+            return entry.text
+        _misses += 1
+        metrics.inc("text_cache_misses_total")
+
+    # 分叉会话的正文包含父会话的共享前缀
+    text = fork_store.read_text(path)
+    with _LOCK:
+        # 读取期间文件未变化才放入缓存
+        if _stamp(path) == stamp:
+            _store(username, _Entry(str(path), text, stamp))
+    return text
+
+def append(username: str, path: Path, appended: str):
+    """save 追加写入后调用：缓存中是同一文件时原地追加，否则丢弃缓存"""
+    path = Path(path)
+    with _LOCK:
+        entry = _ENTRIES.get(username)
+        if not entry or entry.path != str(path):
+            _remove(username)
+            return
+        _store(username, _Entry(entry.path, entry.text + appended, _stamp(path)))
+
+def invalidate(username: str):
+    with _LOCK:
+        _remove(username)
+        metrics.set_gauge("text_cache_resident_bytes", _resident_bytes)
+
+def stats() -> dict:
+    with _LOCK:
+        total = _hits + _misses
+        return {
+            "entries": len(_ENTRIES),
+            "resident_bytes": _resident_bytes,
+            "max_bytes": TEXT_CACHE_MAX_BYTES,
+            "hits": _hits,
+            "misses": _misses,
+            "hit_rate": round(_hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,541 @@
+import time
+import random
+import asyncio
+from collections import deque
+from typing import TYPE_CHECKING, Dict, List, Optional
+from app.core.config import UPSTREAMS_FILE, MODEL_ROUTES_FILE, settings
+from app.core import codec
+from app.services import metrics
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# openai SDK 在第一次调用上游时才导入（约占服务启动耗时的一半以上），
+# 见 get_client 与 is_retryable。
+
+# upstreams.json 结构示例：
+# {
+#     "gemini-3-flash": {
+#         "hedge": true,              # 是否启用对冲请求
+#         "hedge_delay": 8.0,         # 样本不足时的对冲等待秒数
+#         "policy": {"first_token_timeout": 30, "max_retries": 1},   # 覆盖 DEFAULT_POLICY
+#         "endpoints": [
+#             {"name": "gw-a", "base_url": "http://a/v1", "api_key": "sk-..."},
+#             {"name": "gw-b", "base_url": "http://b/v1", "api_key": "sk-..."}
+#         ]
+#     }
+# }
+# 未配置 endpoints 的模型，沿用用户配置里的单个 base_url（policy 仍然生效）。
+#
+# model_routes.json 按任务类型选择模型（见 route_config），未配置的任务使用用户自己选择的模型：
+# {
+#     "title":   {"model": "gemini-2.5-flash-lite"},   # 走 upstreams.json 中该模型的上游池
+#     "summary": {"model": "qwen-turbo", "base_url": "http://c/v1", "api_key": "sk-..."}
+# }
+# 任务类型：continuation（续写）、outline（大纲）、title（书名）、summary（摘要）。
+# 续写和大纲一般不配置，由用户选择的模型负责；书名、摘要等辅助任务交给便宜、快速的模型。
+
+DEFAULT_HEDGE_DELAY = 8.0   # 秒
+MIN_HEDGE_DELAY = 0.5       # 秒，p95 过小时的下限
+MIN_HEDGE_SAMPLES = 5       # 计算 p95 所需的最少样本数
+TTFT_WINDOW = 50            # 每个上游保留的最近首字延迟样本数
+
+DEFAULT_POLICY = {
+    "connect_timeout": 10.0,        # 建立连接超时
+    "first_token_timeout": 90.0,    # 流式：等待首个 token 的超时
+    "idle_timeout": 60.0,           # 流式：两个 chunk 之间的最长间隔
+    "request_timeout": 600.0,       # 非流式：整个请求的超时
+    "max_retries": 2,               # 首 token 之前出错时，同一上游的最大重试次数
+    "backoff_base": 0.5,            # 重试退避基数（秒），指数增长 + 全抖动
+    "backoff_max": 8.0,
+    "breaker_threshold": 5,         # 连续失败多少次后熔断
+    "breaker_cooldown": 30.0,       # 熔断持续时间（秒），之后放行一次探测请求
+    "include_usage": True,          # 流式请求附带 stream_options.include_usage，网关不支持时关闭
+}
+
+def is_retryable(error: Exception) -> bool:
+    # 可重试的错误：网络、超时、限流、上游 5xx；4xx（鉴权、参数错误）直接失败
+    import openai
+    return isinstance(error, (
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+        asyncio.TimeoutError,
+    ))
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+_BREAKER_GAUGE = {BREAKER_CLOSED: 0, BREAKER_HALF_OPEN: 1, BREAKER_OPEN: 2}
+
+TASK_CONTINUATION = "continuation"
+TASK_OUTLINE = "outline"
+TASK_TITLE = "title"
+TASK_SUMMARY = "summary"
+TASKS = (TASK_CONTINUATION, TASK_OUTLINE, TASK_TITLE, TASK_SUMMARY)
+
+class UpstreamUnavailable(Exception):
+    """池内所有上游都处于熔断状态，直接失败而不是排队等待"""
+    pass
+
+# --- Health ---
+
+class UpstreamHealth:
+    """
+    单个上游的健康状态：最近首字延迟样本、失败记录与熔断器。
+    首字延迟只取自流式请求；非流式请求的耗时是整段生成的时间，单独记录，不参与排序与对冲。
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.ttft_samples = deque(maxlen=TTFT_WINDOW)
+        self.latency_samples = deque(maxlen=TTFT_WINDOW)  # 非流式请求的完整耗时
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error = ""
+        self.last_failure_at = 0.0
+        self.breaker_state = BREAKER_CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def _set_breaker(self, state: str):
+        if state == BREAKER_OPEN and self.breaker_state != BREAKER_OPEN:
+            self.opened_at = time.monotonic()
+            metrics.inc("upstream_breaker_opened_total", upstream=self.base_url)
+            print(f"[upstream] {self.base_url} 熔断")
+        self.breaker_state = state
+        metrics.set_gauge("upstream_breaker_state", _BREAKER_GAUGE[state], upstream=self.base_url)
+
+    def allow_request(self, policy: dict) -> bool:
+        if self.breaker_state == BREAKER_CLOSED:
+            return True
+        if self.breaker_state == BREAKER_OPEN:
+            if time.monotonic() - self.opened_at < policy["breaker_cooldown"]:
+                return False
+            self._set_breaker(BREAKER_HALF_OPEN)
+        # 半开状态只放行一个探测请求
+        if self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return True
+
+    def record_success(self, ttft: Optional[float] = None, latency: Optional[float] = None):
+        if ttft is not None:
+            self.ttft_samples.append(ttft)
+        if latency is not None:
+            self.latency_samples.append(latency)
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+        if self.breaker_state != BREAKER_CLOSED:
+            self._set_breaker(BREAKER_CLOSED)
+
+    def record_failure(self, error: Exception, policy: dict):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = str(error)[:200] or type(error).__name__
+        self.last_failure_at = time.time()
+        self.probe_in_flight = False
+        if self.breaker_state == BREAKER_HALF_OPEN or self.consecutive_failures >= policy["breaker_threshold"]:
+            self._set_breaker(BREAKER_OPEN)
+
+    def release_probe(self):
+        # 探测请求被取消（未得出结论）时释放名额
+        self.probe_in_flight = False
+
+    def recent_ttft(self) -> float:
+        # 没有样本时返回 0，让新上游优先被探测
+        if not self.ttft_samples:
+            return 0.0
+        return sum(self.ttft_samples) / len(self.ttft_samples)
+
+    def p95_ttft(self) -> Optional[float]:
+        if len(self.ttft_samples) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(self.ttft_samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def snapshot(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "recent_ttft": round(self.recent_ttft(), 3),
+            "p95_ttft": self.p95_ttft(),
+            "samples": len(self.ttft_samples),
+            "recent_latency": round(sum(self.latency_samples) / len(self.latency_samples), 3) if self.latency_samples else None,
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_failure_at": self.last_failure_at,
+            "breaker_state": self.breaker_state,
+        }
+
+HEALTH: Dict[str, UpstreamHealth] = {}
+_CLIENTS: Dict[tuple, "AsyncOpenAI"] = {}
+
+def get_health(base_url: str) -> UpstreamHealth:
+    if base_url not in HEALTH:
+        HEALTH[base_url] = UpstreamHealth(base_url)
+    return HEALTH[base_url]
+
+def health_snapshot() -> List[dict]:
+    return [h.snapshot() for h in HEALTH.values()]
+
+# --- Pool & Policy ---
+
+def get_upstreams_db() -> dict:
+    if not UPSTREAMS_FILE.exists():
+        return {}
+    try:
+        return codec.read_file(UPSTREAMS_FILE)
+    except:
+        return {}
+
+def get_model_routes() -> dict:
+    if not MODEL_ROUTES_FILE.exists():
+        return {}
+    try:
+        return codec.read_file(MODEL_ROUTES_FILE)
+    except:
+        return {}
+
+def route_config(config: dict, task: str) -> dict:
+    """按任务类型替换模型（以及可选的 base_url / api_key），返回新的配置，不修改原配置"""
+    route = get_model_routes().get(task)
+    if not route or not route.get("model"):
+        return config
+    routed = dict(config)
+    routed["model"] = route["model"]
+    if route.get("base_url"):
+        routed["base_url"] = route["base_url"]
+        routed["api_key"] = route.get("api_key", config["api_key"])
+    return routed
+
+def get_pool_spec(config: dict) -> dict:
+    """返回模型对应的上游池配置；未配置 endpoints 时退化为用户自己的 base_url"""
+    spec = dict(get_upstreams_db().get(config["model"]) or {})
+    if not spec.get("endpoints"):
+        spec["hedge"] = False
+        spec["endpoints"] = [{"base_url": config["base_url"], "api_key": config["api_key"]}]
+    return spec
+
+def get_policy(spec: dict) -> dict:
+    policy = DEFAULT_POLICY.copy()
+    policy.update(spec.get("policy") or {})
+    return policy
+
+def rank_endpoints(endpoints: List[dict]) -> List[dict]:
+    # 连续失败的排到最后，其余按最近首字延迟升序
+    def key(endpoint):
+        health = get_health(endpoint["base_url"])
+        return (health.consecutive_failures > 0, health.recent_ttft())
+    return sorted(endpoints, key=key)
+
+def warm_up():
+    """在后台线程中预先导入 openai，服务启动不等待它，首个请求也不必承担导入耗时"""
+    import openai  # noqa: F401
+
+def get_client(endpoint: dict, policy: dict) -> "AsyncOpenAI":
+    # 按 (base_url, api_key, 连接超时) 复用客户端，保持连接池（大小见 settings.upstream_max_*）
+    # SDK 自带的重试关闭，由本模块统一控制；读超时交给首 token / 空闲超时处理
+    cache_key = (endpoint["base_url"], endpoint["api_key"], policy["connect_timeout"])
+    if cache_key not in _CLIENTS:
+        import openai
+        try:
+            import httpx
+        except ImportError:  # 较新的 openai SDK 改为依赖 httpx2
+            import httpx2 as httpx
+        _CLIENTS[cache_key] = openai.AsyncOpenAI(
+            base_url=endpoint["base_url"],
+            api_key=endpoint["api_key"],
+            timeout=openai.Timeout(None, connect=policy["connect_timeout"]),
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(limits=httpx.Limits(
+                max_connections=settings.upstream_max_connections,
+                max_keepalive_connections=settings.upstream_max_keepalive
+            ))
+        )
+    return _CLIENTS[cache_key]
+
+def hedge_delay(spec: dict, endpoint: dict) -> float:
+    p95 = get_health(endpoint["base_url"]).p95_ttft()
+    if p95 is None:
+        return spec.get("hedge_delay", DEFAULT_HEDGE_DELAY)
+    return max(MIN_HEDGE_DELAY, p95)
+
+def backoff_delay(policy: dict, retry: int) -> float:
+    # 指数退避 + 全抖动，避免大量请求同时重试
+    ceiling = min(policy["backoff_max"], policy["backoff_base"] * (2 ** retry))
+    return random.uniform(0, ceiling)
+
+# --- Attempts ---
+
+class _Attempt:
+    """一次已拿到首个 token（或完整响应）的上游请求"""
+
+    def __init__(self, endpoint: dict, policy: dict, first_text: str, stream=None, iterator=None, usage=None):
+        self.endpoint = endpoint
+        self.policy = policy
+        self.first_text = first_text
+        self.stream = stream
+        self.iterator = iterator
+        self.usage = usage
+
+    async def next_text(self) -> Optional[str]:
+        """读取下一段文本，超过空闲超时视为上游故障；流结束返回 None"""
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self.iterator.__anext__(), self.policy["idle_timeout"])
+            except StopAsyncIteration:
+                return None
+            except asyncio.TimeoutError as e:
+                base_url = self.endpoint["base_url"]
+                metrics.inc("upstream_timeouts_total", upstream=base_url, phase="idle")
+                get_health(base_url).record_failure(e, self.policy)
+                raise asyncio.TimeoutError("上游流式输出空闲超时") from e
+            if chunk.usage:
+                self.usage = chunk.usage.model_dump()
+            if chunk.choices and chunk.choices[0].delta.content:
+                return chunk.choices[0].delta.content
+
+    async def close(self):
+        if self.stream is not None:
+            try:
+                await self.stream.close()
+            except Exception:
+                pass
+
+async def _open_once(endpoint: dict, policy: dict, model: str, messages: list, stream: bool, params: dict) -> _Attempt:
+    client = get_client(endpoint, policy)
+    holder = {}
+
+    async def first_chunk():
+        if not stream:
+            resp = await client.chat.completions.create(
+                model=model, messages=messages, stream=False, **params
+            )
+            usage = resp.usage.model_dump() if resp.usage else None
+            return _Attempt(endpoint, policy, resp.choices[0].message.content or "", usage=usage)
+
+        stream_params = dict(params)
+        if policy["include_usage"]:
+            stream_params.setdefault("stream_options", {"include_usage": True})
+        upstream = await client.chat.completions.create(
+            model=model, messages=messages, stream=True, **stream_params
+        )
+        holder["stream"] = upstream
+        iterator = upstream.__aiter__()
+        # 读到第一个有内容的 chunk 才算成功，之前的失败都可以重试或切换上游
+        async for chunk in iterator:
+            if chunk.choices and chunk.choices[0].delta.content:
+                return _Attempt(endpoint, policy, chunk.choices[0].delta.content, upstream, iterator)
+        return _Attempt(endpoint, policy, "", upstream, iterator)
+
+    timeout = policy["first_token_timeout"] if stream else policy["request_timeout"]
+    try:
+        return await asyncio.wait_for(first_chunk(), timeout)
+    except asyncio.TimeoutError as e:
+        # 关闭失败不能掩盖超时本身
+        if "stream" in holder:
+            try:
+                await holder["stream"].close()
+            except Exception:
+                pass
+        raise asyncio.TimeoutError("等待上游首个 token 超时" if stream else "上游请求超时") from e
+    except BaseException:
+        if "stream" in holder:
+            try:
+                await holder["stream"].close()
+            except Exception:
+                pass
+        raise
+
+async def _open_attempt(endpoint: dict, policy: dict, model: str, messages: list, stream: bool, params: dict) -> _Attempt:
+    """对单个上游发起请求，首 token 之前的可重试错误按退避策略重试"""
+    base_url = endpoint["base_url"]
+    health = get_health(base_url)
+    retry = 0
+    while True:
+        started = time.monotonic()
+        metrics.inc("upstream_requests_total", upstream=base_url)
+        try:
+            attempt = await _open_once(endpoint, policy, model, messages, stream, params)
+            elapsed = time.monotonic() - started
+            if stream:
+                health.record_success(ttft=elapsed)
+            else:
+                health.record_success(latency=elapsed)
+            return attempt
+        except asyncio.CancelledError:
+            health.release_probe()
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.inc("upstream_timeouts_total", upstream=base_url, phase="first_token" if stream else "request")
+            metrics.inc("upstream_failures_total", upstream=base_url, error=type(e).__name__)
+            health.record_failure(e, policy)
+            if not is_retryable(e) or retry >= policy["max_retries"]:
+                raise
+            if not health.allow_request(policy):
+                raise
+            delay = backoff_delay(policy, retry)
+            retry += 1
+            metrics.inc("upstream_retries_total", upstream=base_url)
+            print(f"[upstream] {base_url} 出错，{delay:.2f}s 后第 {retry} 次重试: {e}")
+            await asyncio.sleep(delay)
+
+async def _discard_task(task: asyncio.Task):
+    if not task.done():
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+        return
+    if not task.cancelled() and task.exception() is None:
+        await task.result().close()
+
+async def _acquire(config: dict, messages: list, stream: bool, params: dict) -> _Attempt:
+    """
+    按首字延迟挑选上游并拿到首个 token：
+    1. 熔断中的上游直接跳过；全部熔断时立即失败
+    2. 首 token 之前失败 -> 重试耗尽后自动切换到下一个上游
+    3. 开启 hedge 时，超过 p95 截止时间仍无首 token -> 并行发起第二个请求，先到先得
+    """
+    spec = get_pool_spec(config)
+    policy = get_policy(spec)
+    queue = rank_endpoints(spec["endpoints"])
+    pending: Dict[asyncio.Task, dict] = {}
+    last_error: Optional[Exception] = None
+
+    def launch() -> bool:
+        while queue:
+            endpoint = queue.pop(0)
+            if not get_health(endpoint["base_url"]).allow_request(policy):
+                metrics.inc("upstream_breaker_rejected_total", upstream=endpoint["base_url"])
+                continue
+            task = asyncio.create_task(_open_attempt(endpoint, policy, config["model"], messages, stream, params))
+            pending[task] = endpoint
+            return True
+        return False
+
+    if not launch():
+        metrics.inc("upstream_fail_fast_total", model=config["model"])
+        raise UpstreamUnavailable("上游暂不可用（熔断中），请稍后重试")
+
+    try:
+        while pending:
+            timeout = None
+            if spec.get("hedge") and queue:
+                latest = list(pending.values())[-1]
+                timeout = hedge_delay(spec, latest)
+
+            done, _ = await asyncio.wait(pending.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if launch():
+                    metrics.inc("upstream_hedges_total", model=config["model"])
+                    print(f"[upstream] 首 token 超时，发起对冲请求 -> {list(pending.values())[-1]['base_url']}")
+                continue
+
+            winner = None
+            for task in done:
+                endpoint = pending.pop(task)
+                if task.exception() is None:
+                    if winner is None:
+                        winner = task.result()
+                    else:
+                        await task.result().close()
+                    continue
+                last_error = task.exception()
+                print(f"[upstream] {endpoint['base_url']} 失败: {last_error}")
+            if winner is not None:
+                return winner
+
+            if not pending and launch():
+                metrics.inc("upstream_failovers_total", model=config["model"])
+    finally:
+        for task in list(pending.keys()):
+            await _discard_task(task)
+
+    raise last_error or UpstreamUnavailable("No upstream available")
+
+# --- Public API ---
+
+def estimate_tokens(chars: int) -> int:
+    # 粗略估算：中文约 1 字 1 token，用于上游未返回 usage 时的统计
+    return chars
+
+def _report_usage(on_usage, usage: Optional[dict], messages: list, completion_chars: int,
+                  task: str, model: str):
+    if not usage:
+        prompt_chars = sum(len(m.get("content") or "") for m in messages)
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt_chars),
+            "completion_tokens": estimate_tokens(completion_chars),
+            "estimated": True,
+        }
+    metrics.inc("task_prompt_tokens_total", usage.get("prompt_tokens") or 0, task=task, model=model)
+    metrics.inc("task_completion_tokens_total", usage.get("completion_tokens") or 0, task=task, model=model)
+    if not on_usage:
+        return
+    try:
+        on_usage({**usage, "task": task, "model": model})
+    except Exception as e:
+        print(f"[upstream] 记录用量失败: {e}")
+
+def _record_task(task: str, model: str, started: float, ttft: Optional[float], error: Optional[Exception]):
+    # 按任务类型与模型统计：次数、失败数、总耗时与首字耗时（秒，除以次数即平均值）
+    metrics.inc("task_requests_total", task=task, model=model)
+    if error is not None:
+        metrics.inc("task_failures_total", task=task, model=model, error=type(error).__name__)
+    metrics.inc("task_latency_seconds_sum", time.monotonic() - started, task=task, model=model)
+    if ttft is not None:
+        metrics.inc("task_ttft_seconds_sum", ttft, task=task, model=model)
+
+async def stream_chat(config: dict, messages: list, on_usage=None, task: str = TASK_CONTINUATION, **params):
+    """
+    流式调用，逐段 yield 文本。首 token 之后的错误直接抛出（内容已下发，无法切换）。
+    on_usage(usage) 在结束时（包括被取消）回调一次，上游未返回 usage 时给出估算值。
+    task 为任务类型，按 model_routes.json 选择模型，并分任务统计耗时与用量。
+    """
+    config = route_config(config, task)
+    started = time.monotonic()
+    ttft, error = None, None
+    try:
+        attempt = await _acquire(config, messages, True, params)
+    except Exception as e:
+        _record_task(task, config["model"], started, None, e)
+        raise
+    ttft = time.monotonic() - started
+    produced = 0
+    try:
+        if attempt.first_text:
+            produced += len(attempt.first_text)
+            yield attempt.first_text
+        while True:
+            text = await attempt.next_text()
+            if text is None:
+                break
+            produced += len(text)
+            yield text
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        await attempt.close()
+        _record_task(task, config["model"], started, ttft, error)
+        _report_usage(on_usage, attempt.usage, messages, produced, task, config["model"])
+
+async def complete_chat(config: dict, messages: list, on_usage=None, task: str = TASK_CONTINUATION, **params) -> str:
+    """非流式调用，返回完整文本"""
+    config = route_config(config, task)
+    started = time.monotonic()
+    try:
+        attempt = await _acquire(config, messages, False, params)
+    except Exception as e:
+        _record_task(task, config["model"], started, None, e)
+        raise
+    _record_task(task, config["model"], started, None, None)
+    _report_usage(on_usage, attempt.usage, messages, len(attempt.first_text), task, config["model"])
+    return attempt.first_text
@@ -0,0 +1,75 @@
+import datetime
+import threading
+from typing import List
+from app.core.config import USAGE_ROOT
+from app.core import codec
+
+# 用户用量账本：USAGE_ROOT/<username>.json
+# {
+#     "2026-01-01": {
+#         "requests": 3, "prompt_tokens": 1200, "completion_tokens": 8000, "estimated_requests": 0,
+#         "tasks": {"continuation": {"requests": 2, "prompt_tokens": 1000, "completion_tokens": 7980}, ...}
+#     }
+# }
+# tasks 按任务类型（见 upstream_service.TASKS）细分，便于区分创作与书名等辅助调用的成本。
+# 数据来自上游返回的 usage 字段；上游未返回（或请求被取消）时按字数估算并计入 estimated_requests。
+
+_LOCK = threading.Lock()
+
+def _today() -> str:
+    return datetime.date.today().isoformat()
+
+def _ledger_path(username: str):
+    return USAGE_ROOT / f"{username}.json"
+
+def get_ledger(username: str) -> dict:
+    path = _ledger_path(username)
+    if not path.exists():
+        return {}
+    try:
+        return codec.read_file(path)
+    except:
+        return {}
+
+def record_usage(username: str, usage: dict):
+    with _LOCK:
+        ledger = get_ledger(username)
+        day = ledger.setdefault(_today(), {
+            "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "estimated_requests": 0
+        })
+        day["requests"] += 1
+        day["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        day["completion_tokens"] += usage.get("completion_tokens") or 0
+        if usage.get("estimated"):
+            day["estimated_requests"] += 1
+        if usage.get("task"):
+            task = day.setdefault("tasks", {}).setdefault(usage["task"], {
+                "requests": 0, "prompt_tokens": 0, "completion_tokens": 0
+            })
+            task["requests"] += 1
+            task["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            task["completion_tokens"] += usage.get("completion_tokens") or 0
+        codec.write_file(_ledger_path(username), ledger)
+
+def usage_recorder(username: str):
+    """返回传给 upstream_service 的 on_usage 回调"""
+    return lambda usage: record_usage(username, usage)
+
+def tokens_used_today(username: str) -> int:
+    day = get_ledger(username).get(_today(), {})
+    return day.get("prompt_tokens", 0) + day.get("completion_tokens", 0)
+
+def get_user_usage(username: str, days: int = 30) -> List[dict]:
+    ledger = get_ledger(username)
+    dates = sorted(ledger.keys(), reverse=True)[:days]
+    return [{"date": d, **ledger[d]} for d in dates]
+
+def list_usage_today() -> List[dict]:
+    today = _today()
+    result = []
+    for path in USAGE_ROOT.glob("*.json"):
+        day = get_ledger(path.stem).get(today)
+        if day:
+            result.append({"username": path.stem, **day})
+    result.sort(key=lambda x: x["prompt_tokens"] + x["completion_tokens"], reverse=True)
+    return result
@@ -1,21 +1,24 @@
-import json
 import datetime
 from pathlib import Path
+from typing import Iterable, List, Tuple
 from app.core.config import (
     USERS_FILE, PROMPT_DATA_ROOT, CONFIG_ROOT, DATA_ROOT,
     DEFAULT_API_CONFIG, DEFAULT_PROMPTS
 )
+from app.core import codec, etag
+from app.services import stats_service
 
 def get_users_db():
     if not USERS_FILE.exists():
         return {}
     try:
-        return json.loads(USERS_FILE.read_text(encoding='utf-8'))
+        return codec.read_file(USERS_FILE)
     except:
         return {}
 
 def save_users_db(db):
-    USERS_FILE.write_text(json.dumps(db, indent=2), encoding='utf-8')
+    # 先写临时文件再替换，避免写到一半崩溃导致 users.json 损坏
+    codec.write_file(USERS_FILE, db, atomic=True)
 
 def get_user_group(username: str) -> str:
     users = get_users_db()
@@ -31,6 +34,103 @@ def update_user_group(username: str, group_name: str):
 
     users[username]["group"] = group_name
     save_users_db(users)
+    stats_service.on_user_group_changed(username, group_name)
+
+# --- Bulk ---
+# 批量操作：先逐项校验，全部通过（或 allow_partial）后只写一次 users.json
+
+def bulk_update_user_groups(assignments: Iterable[Tuple[str, str]], valid_groups: set, allow_partial: bool = False) -> Tuple[List[dict], int]:
+    users = get_users_db()
+    results = []
+    for username, group_name in assignments:
+        if username not in users:
+            results.append({"username": username, "ok": False, "error": "User not found"})
+        elif group_name not in valid_groups:
+            results.append({"username": username, "ok": False, "error": "目标用户组不存在"})
+        else:
+            users[username]["group"] = group_name
+            results.append({"username": username, "ok": True, "group": group_name})
+
+    applied = _commit_bulk(users, results, allow_partial)
+    if applied:
+        for item in results:
+            if item["ok"]:
+                stats_service.on_user_group_changed(item["username"], item["group"])
+    return results, applied
+
+def stage_import(users: dict, seen: set, record: dict, valid_groups: set, overwrite: bool = False) -> dict:
+    """校验一条导入记录，通过则写入内存中的 users（尚未落盘），返回该项结果"""
+    username = record.get("username", "")
+    if not username or len(username) < 3:
+        result = {"username": username, "ok": False, "error": "用户名太短"}
+    elif username in seen:
+        result = {"username": username, "ok": False, "error": "重复的用户名"}
+    elif username in users and not overwrite:
+        result = {"username": username, "ok": False, "error": "用户名已存在"}
+    elif not record.get("hash") or not record.get("salt"):
+        result = {"username": username, "ok": False, "error": "缺少 hash/salt"}
+    elif record.get("group", "default") not in valid_groups:
+        result = {"username": username, "ok": False, "error": "目标用户组不存在"}
+    else:
+        users[username] = {
+            "hash": record["hash"],
+            "salt": record["salt"],
+            "group": record.get("group", "default")
+        }
+        result = {"username": username, "ok": True}
+    seen.add(username)
+    return result
+
+def commit_import(users: dict, results: List[dict], allow_partial: bool = False) -> int:
+    applied = _commit_bulk(users, results, allow_partial)
+    if applied:
+        for item in results:
+            if item["ok"]:
+                (DATA_ROOT / item["username"]).mkdir(parents=True, exist_ok=True)
+    return applied
+
+def import_users(records: Iterable[dict], valid_groups: set, overwrite: bool = False, allow_partial: bool = False) -> Tuple[List[dict], int]:
+    # 流式导入（NDJSON）由调用方逐条调用 stage_import，最后 commit_import
+    users = get_users_db()
+    seen = set()
+    results = [stage_import(users, seen, record, valid_groups, overwrite) for record in records]
+    return results, commit_import(users, results, allow_partial)
+
+def export_users():
+    """逐个产出用户记录（含 hash/salt，便于迁移后直接登录）"""
+    for username, data in get_users_db().items():
+        yield {"username": username, **data}
+
+def _commit_bulk(users: dict, results: List[dict], allow_partial: bool) -> int:
+    ok_count = sum(1 for item in results if item["ok"])
+    failed = len(results) - ok_count
+    if failed and not allow_partial:
+        # 原子语义：有失败项则全部不生效
+        for item in results:
+            if item["ok"]:
+                item["ok"] = False
+                item["error"] = "批量操作中有失败项，已整体回滚"
+        return 0
+    if ok_count:
+        save_users_db(users)
+    return ok_count
+
+def normalize_prompts(saved_prompts: dict) -> dict:
+    """整理存档中的 prompt（读取时与迁移旧数据时共用）"""
+    saved_prompts = dict(saved_prompts)
+
+    # 兼容性迁移逻辑
+    if "hidden_freecreate_prompt" in saved_prompts:
+        if saved_prompts["hidden_freecreate_prompt"]:
+            saved_prompts["pre_hidden_freecreate_prompt"] = saved_prompts["hidden_freecreate_prompt"]
+        del saved_prompts["hidden_freecreate_prompt"]
+
+    # 修复空值覆盖默认值问题
+    if "pre_hidden_freecreate_prompt" in saved_prompts and not saved_prompts["pre_hidden_freecreate_prompt"]:
+        del saved_prompts["pre_hidden_freecreate_prompt"]
+    if "post_hidden_freecreate_prompt" in saved_prompts and not saved_prompts["post_hidden_freecreate_prompt"]:
+        del saved_prompts["post_hidden_freecreate_prompt"]
+    return saved_prompts
 
 def get_user_prompts(username: str):
     prompt_path = PROMPT_DATA_ROOT / f"{username}.json"
@@ -38,33 +138,23 @@ def get_user_prompts(username: str):
 
     if prompt_path.exists():
         try:
-            saved_prompts = json.loads(prompt_path.read_text(encoding='utf-8'))
-
-            # 兼容性迁移逻辑
-            if "hidden_freecreate_prompt" in saved_prompts:
-                if saved_prompts["hidden_freecreate_prompt"]:
-                    saved_prompts["pre_hidden_freecreate_prompt"] = saved_prompts["hidden_freecreate_prompt"]
-                del saved_prompts["hidden_freecreate_prompt"]
-
-            # 修复空值覆盖默认值问题
-            if "pre_hidden_freecreate_prompt" in saved_prompts and not saved_prompts["pre_hidden_freecreate_prompt"]:
-                del saved_prompts["pre_hidden_freecreate_prompt"]
-            if "post_hidden_freecreate_prompt" in saved_prompts and not saved_prompts["post_hidden_freecreate_prompt"]:
-                del saved_prompts["post_hidden_freecreate_prompt"]
-
-            prompts.update(saved_prompts)
+            prompts.update(normalize_prompts(codec.read_file(prompt_path)))
         except: pass
     return prompts
 
 def save_user_prompts(username: str, prompts: dict):
     prompt_path = PROMPT_DATA_ROOT / f"{username}.json"
-    prompt_path.write_text(json.dumps(prompts, indent=2), encoding='utf-8')
+    codec.write_file(prompt_path, prompts)
 
 def save_base_config_only(username: str, full_config: dict):
     base_keys = ["base_url", "api_key", "model", "file_path"]
     base_config = {k: full_config.get(k) for k in base_keys}
     config_path = CONFIG_ROOT / f"{username}.json"
-    config_path.write_text(json.dumps(base_config, indent=2), encoding='utf-8')
+    codec.write_file(config_path, base_config)
+
+def config_version(username: str) -> str:
+    """配置的版本戳，用于 ETag（配置 + prompts 两个文件）"""
+    return etag.file_stamp(CONFIG_ROOT / f"{username}.json") + etag.file_stamp(PROMPT_DATA_ROOT / f"{username}.json")
 
 def get_user_config(username: str):
     config_path = CONFIG_ROOT / f"{username}.json"
@@ -73,7 +163,7 @@ def get_user_config(username: str):
 
     if config_path.exists():
         try:
-            saved_config = json.loads(config_path.read_text(encoding='utf-8'))
+            saved_config = codec.read_file(config_path)
             # 过滤旧字段
             if "system_prompt_prefix" in saved_config: del saved_config["system_prompt_prefix"]
             if "user_prompt" in saved_config: del saved_config["user_prompt"]
@@ -86,7 +176,7 @@ def get_user_config(username: str):
 
     # 路径初始化检查
     user_data_dir = DATA_ROOT / username
-    user_data_dir.mkdir(exist_ok=True)
+    user_data_dir.mkdir(parents=True, exist_ok=True)
     current_path = Path(full_config["file_path"]) if full_config["file_path"] else None
 
     if not current_path or not str(current_path).startswith(str(user_data_dir)):
@@ -0,0 +1,98 @@
+"""
+JSON 编解码基准：在模拟的会话历史上比较各编码方式的写入/读取耗时与文件大小。
+
+    python benchmarks/bench_codec.py [--blocks 300] [--base-chars 500000] [--repeat 5]
+
+历史结构与 novel_service 写入的一致：一个包含原文的 base 块，之后每轮续写
+为 user + assistant 两个块，其中约 1/5 被丢弃。
+"""
+import argparse
+import datetime
+import json
+import random
+import time
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CJK = "的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会家可下而过天去能对小多然于心学么之都好看起发当没成只如事把还用第样道想作种开美总从无情己面最女但现前些所同日手又行意动方期它头经长儿回位分爱老因很给名法间斯知世什两次使身者被高已亲其进此话常与活正感"
+
+def fake_text(n: int) -> str:
+    return "".join(random.choice(CJK) for _ in range(n))
+
+def make_history(blocks: int, base_chars: int) -> list:
+    now = datetime.datetime.now()
+    history = [{
+        "id": str(uuid.uuid4()),
+        "timestamp": now.isoformat(),
+        "role": "system",
+        "content": fake_text(base_chars),
+        "prompt": "Original File Content (Base)",
+        "status": "active",
+    }]
+    for i in range(blocks):
+        prompt = fake_text(40)
+        history.append({
+            "id": str(uuid.uuid4()),
+            "timestamp": (now + datetime.timedelta(minutes=i)).isoformat(),
+            "role": "user",
+            "content": prompt,
+            "status": "active",
+        })
+        history.append({
+            "id": str(uuid.uuid4()),
+            "timestamp": (now + datetime.timedelta(minutes=i, seconds=30)).isoformat(),
+            "role": "assistant",
+            "content": fake_text(3000),
+            "prompt": prompt,
+            "status": "discarded" if random.random() < 0.2 else "active",
+        })
+    return history
+
+def codecs() -> dict:
+    result = {
+        "json indent=2 (旧格式)": (
+            lambda o: json.dumps(o, indent=2, ensure_ascii=False).encode("utf-8"),
+            lambda b: json.loads(b.decode("utf-8")),
+        ),
+        "json compact": (
+            lambda o: json.dumps(o, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+            lambda b: json.loads(b.decode("utf-8")),
+        ),
+    }
+    if orjson:
+        result["orjson compact"] = (lambda o: orjson.dumps(o), orjson.loads)
+        result["orjson indent=2"] = (lambda o: orjson.dumps(o, option=orjson.OPT_INDENT_2), orjson.loads)
+    return result
+
+def best_of(repeat: int, fn, arg) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, default=300, help="续写轮数")
+    parser.add_argument("--base-chars", type=int, default=500_000, help="base 块原文字数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    history = make_history(args.blocks, args.base_chars)
+    print(f"历史块数: {len(history)}  orjson: {'已安装' if orjson else '未安装'}")
+    print(f"{'codec':<24}{'size(KB)':>10}{'dump(ms)':>10}{'load(ms)':>10}")
+    for name, (dump, load) in codecs().items():
+        data = dump(history)
+        assert load(data) == history
+        dump_ms = best_of(args.repeat, dump, history) * 1000
+        load_ms = best_of(args.repeat, load, data) * 1000
+        print(f"{name:<24}{len(data) / 1024:>10.0f}{dump_ms:>10.1f}{load_ms:>10.1f}")
+
+if __name__ == "__main__":
+    main()
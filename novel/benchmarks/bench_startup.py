@@ -0,0 +1,70 @@
+"""
+启动耗时基准：在全新的解释器中导入服务入口，统计导入耗时与是否加载了 openai。
+
+    python benchmarks/bench_startup.py [--repeat 10] [--root /tmp/novel_bench]
+
+每次在子进程中执行，避免模块缓存影响结果；NOVEL_PROJECT_ROOT 指向临时目录，
+同时检查导入过程没有在数据目录下创建任何文件（目录由 init_dirs 在启动时创建）。
+最后一行是首次创建上游客户端的耗时，即 openai 延迟导入后挪到第一次请求上的开销。
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, "openai" in sys.modules)
+"""
+
+CLIENT_PROBE = """
+import time
+from app.services import upstream_service
+start = time.perf_counter()
+upstream_service.get_client({"base_url": "http://127.0.0.1:1/v1", "api_key": "k"}, upstream_service.DEFAULT_POLICY)
+print(time.perf_counter() - start, True)
+"""
+
+def run(code: str, env: dict) -> tuple:
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=APP_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(out[-2]), out[-1] == "True"
+
+def measure(code: str, repeat: int, env: dict) -> tuple:
+    samples, loaded = [], False
+    for _ in range(repeat):
+        seconds, loaded = run(code, env)
+        samples.append(seconds * 1000)
+    return min(samples), statistics.median(samples), loaded
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--root", default=None, help="NOVEL_PROJECT_ROOT，默认新建临时目录")
+    args = parser.parse_args()
+
+    root = Path(args.root or tempfile.mkdtemp(prefix="novel_bench_"))
+    env = {**os.environ, "NOVEL_PROJECT_ROOT": str(root)}
+
+    print(f"{'target':<28}{'min(ms)':>10}{'median(ms)':>12}{'openai':>8}")
+    for module in ("main", "manage"):
+        best, median, loaded = measure(PROBE.format(module=module), args.repeat, env)
+        print(f"{'import ' + module:<28}{best:>10.1f}{median:>12.1f}{'yes' if loaded else 'no':>8}")
+    best, median, loaded = measure(CLIENT_PROBE, args.repeat, env)
+    print(f"{'first upstream client':<28}{best:>10.1f}{median:>12.1f}{'yes' if loaded else 'no':>8}")
+
+    created = [str(p.relative_to(root)) for p in root.rglob("*")] if root.exists() else []
+    print(f"导入后数据目录下的文件: {created or '无'}")
+
+if __name__ == "__main__":
+    main()
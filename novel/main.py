@@ -1,17 +1,43 @@
-import uvicorn
+import asyncio
 from pathlib import Path
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
 
-from app.api.endpoints import auth, config, novel, sessions, admin
+# 路由模块保持在导入时加载：FastAPI 需要在创建 app 时注册全部路由，延迟导入只会把同样的开销
+# 挪到第一次请求之前。较重的依赖（openai）已在 upstream_service 中延迟导入并在 lifespan 中预热。
+from app.api.endpoints import auth, config, novel, sessions, admin, jobs
+from app.services import job_service, stats_service, storage_service, upstream_service
+from app.core.config import STATS_FILE, settings, init_dirs
+from app.core.static_assets import PrecompressedStaticFiles
 
 # 定义项目根目录
 BASE_DIR = Path(__file__).parent
 STATIC_DIR = BASE_DIR / "static"
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_dirs()
+    # openai 延迟导入：在后台线程预热，不阻塞启动
+    asyncio.get_running_loop().run_in_executor(None, upstream_service.warm_up)
+    # 静态资源预压缩放在启动时而不是导入时，在线程中执行
+    await asyncio.get_running_loop().run_in_executor(None, static_files.precompress)
+    # 存储统计：首次启动时全量扫描建立基线
+    stats_service.load()
+    if not STATS_FILE.exists():
+        stats_service.reconcile()
+    # 恢复重启前的后台任务，并启动 worker
+    job_service.recover_jobs()
+    job_service.start_workers()
+    # 定期压缩历史、冷存储闲置会话
+    maintenance = asyncio.create_task(storage_service.maintenance_loop())
+    yield
+    maintenance.cancel()
+    await job_service.stop_workers()
+    stats_service.flush(force=True)
+
+app = FastAPI(lifespan=lifespan)
 
 # 允许跨域
 app.add_middleware(
@@ -27,19 +53,24 @@ app.include_router(auth.router, prefix="/api", tags=["auth"])
 app.include_router(config.router, prefix="/api", tags=["config"])
 app.include_router(novel.router, prefix="/api", tags=["novel"])
 app.include_router(sessions.router, prefix="/api", tags=["sessions"])
+app.include_router(jobs.router, prefix="/api", tags=["jobs"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
 # 挂载静态文件
 if not STATIC_DIR.exists():
     STATIC_DIR.mkdir(parents=True, exist_ok=True)
 
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR), html=True), name="static")
+# 预压缩（gzip / br）并按文件名指纹设置缓存头，见 core.static_assets
+static_files = PrecompressedStaticFiles(directory=str(STATIC_DIR), html=True)
+app.mount("/static", static_files, name="static")
 
 @app.get("/")
 async def read_root():
     return RedirectResponse(url="/static/index.html")
 
 if __name__ == "__main__":
-    # 端口保持用户要求的 19000
-    print(f"启动服务: http://localhost:19000/static/login.html")
-    uvicorn.run(app, host="0.0.0.0", port=19000)
+    # 只在直接运行时需要；用 uvicorn 命令启动时由其自身加载
+    import uvicorn
+    # 默认端口 19000，可用 NOVEL_PORT 修改
+    print(f"启动服务: http://localhost:{settings.port}/static/login.html")
+    uvicorn.run(app, host=settings.host, port=settings.port)
@@ -0,0 +1,111 @@
+"""
+运维命令行：
+
+    python manage.py maintenance [--dry-run] [--no-compact] [--no-freeze] [--no-drop-views] [--days 90]
+    python manage.py report
+    python manage.py thaw <username> <filename>
+    python manage.py search-rebuild [username ...]
+    python manage.py block-store on|off [username ...]
+    python manage.py migrate <旧版数据根目录> [--target DIR] [--workers N] [--restart] [--users u1 u2]
+
+与服务同时运行时，命令对存储统计的改动会在服务下次落盘时被覆盖，
+可在之后调用 /api/admin/stats/reconcile 修正。
+"""
+import argparse
+from pathlib import Path
+from app.core import codec
+from app.core.config import PROJECT_ROOT, DATA_ROOT, COLD_AFTER_DAYS, init_dirs
+from app.services import storage_service, stats_service, search_service, block_store, migration_service
+
+def cmd_maintenance(args):
+    report = storage_service.run_maintenance(
+        compact=not args.no_compact, freeze=not args.no_freeze,
+        cold_after_days=args.days, dry_run=args.dry_run, drop_views=not args.no_drop_views
+    )
+    print(codec.dumps(report, pretty=True))
+
+def cmd_report(args):
+    print(codec.dumps(storage_service.get_report(), pretty=True))
+
+def cmd_thaw(args):
+    path = DATA_ROOT / args.username / args.filename
+    if storage_service.thaw_session(path):
+        print(f"已解压: {path}")
+    else:
+        print(f"不是冷存储会话: {path}")
+
+def cmd_search_rebuild(args):
+    usernames = args.usernames or sorted(d.name for d in DATA_ROOT.iterdir() if d.is_dir())
+    for username in usernames:
+        print(codec.dumps(search_service.rebuild(username)))
+
+def cmd_block_store(args):
+    usernames = args.usernames or sorted(d.name for d in DATA_ROOT.iterdir() if d.is_dir())
+    convert = block_store.enable if args.mode == "on" else block_store.disable
+    summary = {}
+    for username in usernames:
+        for txt in sorted((DATA_ROOT / username).glob("*.txt")):
+            result = convert(txt)
+            key = result.get("reason", result["status"])
+            summary[key] = summary.get(key, 0) + 1
+            if result["status"] == "skipped" and result["reason"] == "txt does not match history":
+                print(f"跳过（txt 与历史不一致）: {txt}")
+    print(codec.dumps(summary, pretty=True))
+
+def cmd_migrate(args):
+    target = Path(args.target) if args.target else PROJECT_ROOT
+    report = migration_service.migrate(Path(args.source), target, args.workers, args.users, args.restart)
+    for problem in report["problems"]:
+        print(f"  [{problem['username']}] {problem['file']}: {problem['problem']}")
+    summary = {k: v for k, v in report.items() if k != "problems"}
+    summary["problems"] = len(report["problems"])
+    print(codec.dumps(summary, pretty=True))
+    if target.resolve() == PROJECT_ROOT.resolve():
+        # 迁移到本服务的数据目录时顺便重算存储统计
+        print(codec.dumps(stats_service.reconcile()))
+
+def main():
+    parser = argparse.ArgumentParser(description="小说服务运维命令")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("maintenance", help="压缩已丢弃的历史块并冷存储闲置会话")
+    p.add_argument("--dry-run", action="store_true", help="只统计，不修改文件")
+    p.add_argument("--no-compact", action="store_true", help="跳过历史压缩")
+    p.add_argument("--no-freeze", action="store_true", help="跳过冷存储")
+    p.add_argument("--no-drop-views", action="store_true", help="跳过块存储会话的视图清空")
+    p.add_argument("--days", type=int, default=COLD_AFTER_DAYS, help="闲置多少天后冷存储")
+    p.set_defaults(func=cmd_maintenance)
+
+    p = sub.add_parser("report", help="查看最近一次维护报告")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("thaw", help="手动解压冷存储会话")
+    p.add_argument("username")
+    p.add_argument("filename")
+    p.set_defaults(func=cmd_thaw)
+
+    p = sub.add_parser("search-rebuild", help="重建全文搜索索引（默认全部用户）")
+    p.add_argument("usernames", nargs="*")
+    p.set_defaults(func=cmd_search_rebuild)
+
+    p = sub.add_parser("block-store", help="把已有会话转为块存储（on），或补齐 txt 后恢复为普通会话（off）")
+    p.add_argument("mode", choices=["on", "off"])
+    p.add_argument("usernames", nargs="*")
+    p.set_defaults(func=cmd_block_store)
+
+    p = sub.add_parser("migrate", help="把旧版 web_app 的数据目录迁移为新版布局（可中断后继续）")
+    p.add_argument("source", help="旧版数据根目录（含 users.json、configs、prompt_data、data）")
+    p.add_argument("--target", help="目标根目录，默认为本服务的 PROJECT_ROOT")
+    p.add_argument("--workers", type=int, default=None, help="进程数，默认 CPU 核数")
+    p.add_argument("--users", nargs="*", help="只迁移指定用户")
+    p.add_argument("--restart", action="store_true", help="忽略已有的迁移进度，全部重做")
+    p.set_defaults(func=cmd_migrate)
+
+    args = parser.parse_args()
+    init_dirs()
+    stats_service.load()
+    args.func(args)
+    stats_service.flush(force=True)
+
+if __name__ == "__main__":
+    main()
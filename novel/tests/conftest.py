@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 测试使用临时数据目录，须在导入 app 之前设置（配置在导入时读取）
+os.environ["NOVEL_PROJECT_ROOT"] = tempfile.mkdtemp(prefix="novel_test_")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import pytest
+from app.core import codec
+from app.core.config import init_dirs
+
+@pytest.fixture
+def fake_upstream(monkeypatch):
+    """替换上游客户端（见 stubs.FakeUpstream），并清空上游健康状态"""
+    from stubs import FakeUpstream
+    from app.services import upstream_service
+    fake = FakeUpstream()
+    monkeypatch.setattr(upstream_service, "get_client", fake.get_client)
+    upstream_service.HEALTH.clear()
+    yield fake
+    upstream_service.HEALTH.clear()
+
+@pytest.fixture
+def json_file():
+    """写入 PROJECT_ROOT 下的配置文件（upstreams.json 等），测试结束后删除"""
+    written = []
+
+    def write(path: Path, data):
+        init_dirs()
+        codec.write_file(path, data)
+        written.append(Path(path))
+
+    yield write
+    for path in written:
+        path.unlink(missing_ok=True)
+
+@pytest.fixture(scope="session")
+def client():
+    """不触发 lifespan（不启动后台 worker 与维护任务）的 TestClient"""
+    from fastapi.testclient import TestClient
+    import main
+    init_dirs()
+    return TestClient(main.app)
+
+@pytest.fixture
+def login():
+    """login(username) 登记一个内存会话，返回带 Authorization 的请求头"""
+    from app.api import deps
+    tokens = []
+
+    def login(username: str) -> dict:
+        token = f"test-{username}"
+        deps.SESSIONS[token] = username
+        tokens.append(token)
+        return {"Authorization": f"Bearer {token}"}
+
+    yield login
+    for token in tokens:
+        deps.SESSIONS.pop(token, None)
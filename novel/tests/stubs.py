@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, List
+
+# 测试用的假上游：替换 upstream_service.get_client，按 base_url 预先排好每次请求的行为。
+#   Reply(chunks, delay)   成功；流式按 chunks 逐段输出，非流式返回拼接结果；delay 为首段之前的等待
+#   Fail(error)            请求失败（首 token 之前）
+#   Hang()                 一直不返回，用于超时与对冲
+
+class Reply:
+    def __init__(self, chunks=("ok",), delay: float = 0.0, usage: dict = None):
+        self.chunks = list(chunks)
+        self.delay = delay
+        self.usage = usage
+
+class Fail:
+    def __init__(self, error: Exception):
+        self.error = error
+
+class Hang:
+    pass
+
+def _usage(data):
+    return SimpleNamespace(model_dump=lambda: dict(data)) if data else None
+
+class FakeStream:
+    def __init__(self, reply: Reply, upstream: "FakeUpstream"):
+        self.reply = reply
+        self.upstream = upstream
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await asyncio.sleep(self.reply.delay)
+        for text in self.reply.chunks:
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+        if self.reply.usage:
+            yield SimpleNamespace(usage=_usage(self.reply.usage), choices=[])
+
+    async def close(self):
+        self.closed = True
+        self.upstream.closed += 1
+
+class FakeUpstream:
+    def __init__(self):
+        self.plans: Dict[str, List[object]] = {}
+        self.calls: List[dict] = []
+        self.closed = 0
+
+    def plan(self, base_url: str, *behaviours):
+        self.plans.setdefault(base_url, []).extend(behaviours)
+
+    def get_client(self, endpoint: dict, policy: dict):
+        upstream = self
+
+        async def create(model, messages, stream, **params):
+            base_url = endpoint["base_url"]
+            upstream.calls.append({"base_url": base_url, "model": model, "stream": stream, "params": params})
+            plan = upstream.plans.get(base_url) or [Reply()]
+            behaviour = plan.pop(0) if len(plan) > 1 else plan[0]
+            if isinstance(behaviour, Fail):
+                raise behaviour.error
+            if isinstance(behaviour, Hang):
+                await asyncio.Event().wait()
+            if stream:
+                return FakeStream(behaviour, upstream)
+            await asyncio.sleep(behaviour.delay)
+            message = SimpleNamespace(content="".join(behaviour.chunks))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(behaviour.usage))
+
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def urls(self) -> List[str]:
+        return [call["base_url"] for call in self.calls]
@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.core import codec
+from app.api.endpoints import admin
+from app.models.schemas import BulkUserGroupUpdate, BulkGroupCreate
+from app.services import user_manager
+
+# NDJSON 导入边接收边解析：跨 chunk 的行能正确拼接，坏行在后续数据到达前就报错；
+# 批量接口默认原子执行，allow_partial 时部分生效
+
+class NdjsonRequest:
+    headers = {"content-type": "application/x-ndjson"}
+
+    def __init__(self, *chunks, then_fail=False):
+        self.chunks = chunks
+        self.then_fail = then_fail
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+        if self.then_fail:
+            raise AssertionError("请求体在出错后仍被继续读取")
+
+def user_line(username: str) -> bytes:
+    return codec.dumps({"username": username, "hash": "h", "salt": "s"}).encode() + b"\n"
+
+def run_import(request, **params):
+    return asyncio.run(admin.import_users(request, format="json", overwrite=False,
+                                          allow_partial=params.get("allow_partial", False), admin="admin"))
+
+def test_ndjson_lines_split_across_chunks():
+    body = user_line("ndjson_a") + b"\n" + user_line("ndjson_b")
+    result = run_import(NdjsonRequest(body[:7], body[7:30], body[30:].rstrip(b"\n")))
+    assert result["applied"] == 2
+    assert {"ndjson_a", "ndjson_b"} <= set(user_manager.get_users_db())
+
+def test_ndjson_bad_line_stops_reading():
+    with pytest.raises(HTTPException) as exc:
+        run_import(NdjsonRequest(user_line("ndjson_c"), b"not json\n", then_fail=True))
+    assert exc.value.status_code == 400
+    assert "第 2 行" in exc.value.detail
+    assert "ndjson_c" not in user_manager.get_users_db()
+
+def test_ndjson_duplicates_roll_back_unless_partial():
+    body = user_line("ndjson_d") + user_line("ndjson_d")
+    result = run_import(NdjsonRequest(body))
+    assert (result["applied"], result["failed"]) == (0, 2)
+    assert "ndjson_d" not in user_manager.get_users_db()
+
+    result = run_import(NdjsonRequest(body), allow_partial=True)
+    assert (result["applied"], result["failed"]) == (1, 1)
+    assert "ndjson_d" in user_manager.get_users_db()
+
+# --- 批量分组、建组与 NDJSON 输出 ---
+
+def test_bulk_group_update_is_atomic_by_default():
+    run_import(NdjsonRequest(user_line("bulk_user_a")))
+    update = BulkUserGroupUpdate(assignments=[
+        {"username": "bulk_user_a", "group_name": "bulk_vip"},
+        {"username": "bulk_missing", "group_name": "default"},
+    ])
+    asyncio.run(admin.bulk_create_groups(BulkGroupCreate(groups=[{"name": "bulk_vip", "description": ""}]),
+                                         format="json", admin="admin"))
+
+    result = asyncio.run(admin.bulk_update_user_group(update, format="json", admin="admin"))
+    assert (result["applied"], result["failed"]) == (0, 2)
+    assert user_manager.get_user_group("bulk_user_a") == "default"
+
+    update.allow_partial = True
+    result = asyncio.run(admin.bulk_update_user_group(update, format="json", admin="admin"))
+    assert (result["applied"], result["failed"]) == (1, 1)
+    assert user_manager.get_user_group("bulk_user_a") == "bulk_vip"
+
+def test_bulk_ndjson_output_ends_with_summary():
+    req = BulkGroupCreate(groups=[{"name": "bulk_dup", "description": ""}, {"name": "bulk_dup", "description": ""}],
+                          allow_partial=True)
+    response = asyncio.run(admin.bulk_create_groups(req, format="ndjson", admin="admin"))
+
+    async def body():
+        return b"".join([chunk if isinstance(chunk, bytes) else chunk.encode() async for chunk in response.body_iterator])
+    lines = [codec.loads(line) for line in asyncio.run(body()).splitlines()]
+    assert [line.get("ok") for line in lines[:2]] == [True, False]
+    assert lines[-1] == {"summary": {"applied": 1, "failed": 1, "total": 2}}
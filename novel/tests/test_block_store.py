@@ -0,0 +1,71 @@
+from pathlib import Path
+import pytest
+from app.core.config import init_dirs
+from app.services import block_store, novel_service, session_service, stats_service
+
+# 块存储模式：增量补齐与整体重建生成相同的视图，章节偏移与存储统计不随重建方式变化
+
+def new_block_session(username: str) -> Path:
+    init_dirs()
+    path = Path(session_service.create_new_session(username)["path"])
+    assert block_store.enable(path) == {"status": "enabled"}
+    return path
+
+def rendered(path: Path) -> bytes:
+    return b"".join(block_store._render(path.with_suffix(".json")))
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    calls = []
+    original = block_store._rebuild
+    monkeypatch.setattr(block_store, "_rebuild", lambda path: (calls.append(path), original(path)))
+    return calls
+
+def test_catch_up_matches_full_rebuild(rebuilds):
+    path = new_block_session("block_catch_up")
+    ids = [novel_service.save_novel_content("block_catch_up", "第一章 起\n甲。")]
+    assert path.read_bytes() == b""  # save 只写历史
+    novel_service.get_novel_content("block_catch_up")
+    ids.append(novel_service.save_novel_content("block_catch_up", "乙。", "继续"))
+    ids.append(novel_service.save_novel_content("block_catch_up", "第二章 承\n丙。"))
+
+    chapters = novel_service.get_chapters("block_catch_up")
+
+    data = path.read_bytes()
+    assert data == rendered(path) == "第一章 起\n甲。\n\n乙。\n\n第二章 承\n丙。\n".encode("utf-8")
+    assert rebuilds == []
+    segments = {s["block_id"]: s for s in chapters["segments"]}
+    for block_id, text in zip(ids, ["第一章 起\n甲。", "乙。", "第二章 承\n丙。"]):
+        assert data[segments[block_id]["start"]:segments[block_id]["end"]] == text.encode("utf-8")
+    assert [c["title"] for c in chapters["chapters"]] == ["第一章 起", "第二章 承"]
+    assert "block_catch_up" not in stats_service.reconcile()["drift"]
+
+def test_drop_and_rebuild_keeps_view_and_stats(rebuilds):
+    path = new_block_session("block_drop")
+    for text in ("一。", "二。", "三。"):
+        novel_service.save_novel_content("block_drop", text)
+    block_store.ensure_view(path)
+    before = path.read_bytes()
+
+    assert block_store.drop_view(path)["bytes_before"] == len(before)
+    assert path.read_bytes() == b""
+    assert block_store.ensure_view(path)
+
+    assert path.read_bytes() == before
+    assert len(rebuilds) == 1
+    assert "block_drop" not in stats_service.reconcile()["drift"]
+
+def test_enable_normalises_legacy_separators():
+    init_dirs()
+    path = Path(session_service.create_new_session("block_legacy")["path"])
+    novel_service.save_novel_content("block_legacy", "甲。")
+    novel_service.save_novel_content("block_legacy", "乙。")
+    # 普通会话 save 的追加格式（"\n\n" + 正文 + "\n"）与视图格式只差空白
+    assert path.read_bytes() != rendered(path)
+
+    assert block_store.enable(path) == {"status": "enabled"}
+    novel_service.save_novel_content("block_legacy", "丙。")
+    block_store.ensure_view(path)
+
+    assert path.read_bytes() == rendered(path) == "甲。\n\n乙。\n\n丙。\n".encode("utf-8")
+    assert "block_legacy" not in stats_service.reconcile()["drift"]
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from starlette.requests import ClientDisconnect
+from app.core.config import init_dirs
+from app.api.deps import StreamSlotResponse
+from app.services import novel_service, rate_limit_service, upstream_service, metrics
+
+# 客户端断开时取消上游（cancel_on_disconnect）：用假的上游流驱动 generate_novel_stream，
+# 经 StreamSlotResponse 按 ASGI 调用，断开后检查上游流被关闭、取消指标计数、并发名额释放。
+# 另覆盖第一段内容之前就断开（生成器从未开始）的情况。
+
+USERNAME = "cancel_tester"
+
+class StubUpstream:
+    """持续输出的上游流，记录是否被关闭"""
+    def __init__(self):
+        self.sent = 0
+        self.closed = False
+
+    async def stream_chat(self, config, messages, on_usage=None, task=None, **params):
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                self.sent += 1
+                yield "字" * 10
+        finally:
+            self.closed = True
+
+def counter(name: str, **labels) -> float:
+    return metrics.snapshot()["counters"].get(metrics._key(name, labels), 0)
+
+def scope(spec_version: str) -> dict:
+    return {"type": "http", "method": "POST", "asgi": {"spec_version": spec_version}}
+
+@pytest.fixture
+def stub(monkeypatch):
+    init_dirs()
+    stub = StubUpstream()
+    monkeypatch.setattr(upstream_service, "stream_chat", stub.stream_chat)
+    monkeypatch.setattr(novel_service, "DISCONNECT_POLL_INTERVAL", 0.01)
+    return stub
+
+def test_disconnect_cancels_upstream(stub):
+    cancelled_before = counter("generation_cancelled_total", task="generate")
+    saved_before = counter("upstream_tokens_saved_estimate_total", task="generate")
+
+    disconnected = False
+
+    async def is_disconnected():
+        return disconnected
+
+    async def run():
+        nonlocal disconnected
+        rate_limit_service.admit_stream(USERNAME)
+        assert rate_limit_service.ACTIVE_STREAMS[USERNAME] == 1
+        stream = novel_service.generate_novel_stream(USERNAME, "继续", 1, is_disconnected)
+        received = []
+
+        async def send(message):
+            nonlocal disconnected
+            if message["type"] == "http.response.body" and message["body"]:
+                received.append(message["body"])
+                if len(received) == 3:
+                    disconnected = True
+
+        await StreamSlotResponse(USERNAME, stream)(scope("2.4"), None, send)
+        return received
+
+    received = asyncio.run(asyncio.wait_for(run(), timeout=10))
+
+    assert len(received) >= 3
+    assert stub.closed
+    assert counter("generation_cancelled_total", task="generate") == cancelled_before + 1
+    assert counter("upstream_tokens_saved_estimate_total", task="generate") > saved_before
+    assert rate_limit_service.ACTIVE_STREAMS[USERNAME] == 0
+
+def test_disconnect_before_first_chunk_releases_slots(stub):
+    """ASGI 2.4：发送响应头即失败，生成器从未开始"""
+    async def send(message):
+        raise OSError("connection reset")
+
+    async def run():
+        rate_limit_service.admit_stream(USERNAME, 2)
+        stream = novel_service.generate_novel_stream(USERNAME, "继续", 2, lambda: asyncio.sleep(0, False))
+        with pytest.raises(ClientDisconnect):
+            await StreamSlotResponse(USERNAME, stream, 2)(scope("2.4"), None, send)
+
+    asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert rate_limit_service.ACTIVE_STREAMS[USERNAME] == 0
+    assert stub.sent == 0
+
+def test_disconnect_listener_cancel_releases_slots(stub):
+    """ASGI 2.4 之前：断开监听先结束，响应任务被取消"""
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await asyncio.sleep(1)
+
+    async def run():
+        rate_limit_service.admit_stream(USERNAME)
+        stream = novel_service.generate_novel_stream(USERNAME, "继续", 1, lambda: asyncio.sleep(0, False))
+        await StreamSlotResponse(USERNAME, stream)(scope("2.3"), receive, send)
+
+    asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert rate_limit_service.ACTIVE_STREAMS[USERNAME] == 0
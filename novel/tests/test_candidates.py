@@ -0,0 +1,50 @@
+import asyncio
+from stubs import Reply, Fail
+from app.core import codec
+from app.services import novel_service
+
+# 多候选续写：同一条响应流按行输出各候选的 JSON 帧，单个候选出错不影响其他候选
+
+PROFILE = {"task": "continuation", "max_tokens": 100, "temperature": 0.8, "top_p": 1.0, "stream": True}
+CONFIG = {"model": "m", "base_url": "http://user/v1", "api_key": "k", "profile": PROFILE}
+MESSAGES = [{"role": "user", "content": "续写"}]
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=10))
+
+async def frames(candidates: int):
+    stream = novel_service._multiplex_candidates(CONFIG, MESSAGES, candidates)
+    return [codec.loads(line) async for line in stream]
+
+def test_frames_per_candidate(fake_upstream):
+    fake_upstream.plan("http://user/v1", Reply(["甲", "乙"]), Fail(ValueError("401")), Reply(["丙"]))
+    result = run(frames(3))
+    assert result[0] == {"candidates": 3}
+
+    by_candidate = {i: [f for f in result[1:] if f["candidate"] == i] for i in range(3)}
+    texts = {i: "".join(f.get("delta", "") for f in fs) for i, fs in by_candidate.items()}
+    errors = {i: [f["error"] for f in fs if "error" in f] for i, fs in by_candidate.items()}
+    assert sorted(texts.values()) == ["", "丙", "甲乙"]
+    assert sorted(len(e) for e in errors.values()) == [0, 0, 1]
+    for fs in by_candidate.values():
+        assert fs[-1] == {"candidate": fs[0]["candidate"], "done": True}
+    assert len(fake_upstream.calls) == 3
+    assert all(call["params"]["max_tokens"] == 100 for call in fake_upstream.calls)
+
+def test_closing_early_cancels_every_candidate(fake_upstream):
+    fake_upstream.plan("http://user/v1", Reply(["迟"], delay=5))
+
+    async def first_frame_then_close():
+        stream = novel_service._multiplex_candidates(CONFIG, MESSAGES, 2)
+        assert codec.loads(await stream.__anext__()) == {"candidates": 2}
+        # 等待候选输出时被取消（相当于客户端断开）
+        try:
+            await asyncio.wait_for(stream.__anext__(), 0.1)
+        except asyncio.TimeoutError:
+            pass
+        await stream.aclose()
+
+    run(first_frame_then_close())
+    assert len(fake_upstream.calls) == 2
+    # 两个候选的上游流都已关闭
+    assert fake_upstream.closed == 2
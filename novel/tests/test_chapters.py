@@ -0,0 +1,64 @@
+from pathlib import Path
+from app.core.config import init_dirs
+from app.services import chapter_index, novel_service, session_service
+
+# 章节索引：增量追加与重建结果一致；章节与 /novel/range 按字节偏移读取，边界对齐到完整字符
+
+def chapter_session(username: str) -> Path:
+    init_dirs()
+    path = Path(session_service.create_new_session(username)["path"])
+    novel_service.save_novel_content(username, "楔子。")
+    novel_service.save_novel_content(username, "第一章 相遇\n他们相遇了。")
+    novel_service.save_novel_content(username, "继续。", "继续")
+    novel_service.save_novel_content(username, "第二章 别离\n他们分开了。")
+    return path
+
+def test_chapters_and_reads(client, login):
+    path = chapter_session("chapter_reader")
+    headers = login("chapter_reader")
+    chapters = client.get("/api/novel/chapters", headers=headers).json()
+    assert [c["title"] for c in chapters["chapters"]] == [chapter_index.PROLOGUE_TITLE, "第一章 相遇", "第二章 别离"]
+
+    data = path.read_bytes()
+    assert chapters["size"] == len(data)
+    assert chapters["chapters"][-1]["end"] == len(data)
+    for chapter in chapters["chapters"]:
+        body = client.get(f"/api/novel/chapters/{chapter['index']}", headers=headers).json()
+        assert body["content"].encode("utf-8") == data[chapter["start"]:chapter["end"]]
+    assert client.get("/api/novel/chapters/9", headers=headers).status_code == 404
+
+def test_incremental_index_matches_rebuild():
+    path = chapter_session("chapter_incremental")
+    incremental = chapter_index.get(path, lambda: [])
+    history = novel_service.fork_store.load_history(path.with_suffix(".json"))
+    rebuilt = chapter_index.rebuild(path, history)
+    assert incremental["segments"] == rebuilt["segments"]
+    # 用户 prompt（"继续"）是后一段正文的子串，重建时不能把它当作正文块
+    assert [s["role"] for s in rebuilt["segments"]] == ["assistant"] * 4
+    assert incremental["chapters"] == chapter_index.get(path, lambda: history)["chapters"]
+
+def test_range_aligns_to_characters(client, login):
+    path = chapter_session("chapter_range")
+    headers = login("chapter_range")
+    data = path.read_bytes()
+
+    # 从汉字中间开始、在汉字中间结束
+    pos = data.index("楔子".encode("utf-8"))
+    page = client.get("/api/novel/range", params={"start": pos + 1, "end": pos + 4}, headers=headers).json()
+    assert (page["start"], page["end"]) == (pos + 3, pos + 6)
+    assert page["content"] == "子"
+    assert page["size"] == len(data)
+
+    tail = client.get("/api/novel/range", params={"start": len(data) - 3, "end": len(data) + 100}, headers=headers).json()
+    assert tail["end"] == len(data)
+    assert client.get("/api/novel/range", params={"start": -1, "end": 3}, headers=headers).status_code == 422
+
+def test_discard_rebuilds_index():
+    path = chapter_session("chapter_discard")
+    history = novel_service.fork_store.load_history(path.with_suffix(".json"))
+    second = next(b for b in history if b["content"].startswith("第二章"))
+    novel_service.discard_novel_block("chapter_discard", second["id"])
+
+    chapters = novel_service.get_chapters("chapter_discard")
+    assert [c["title"] for c in chapters["chapters"]][-1] == "第一章 相遇"
+    assert second["id"] not in {s["block_id"] for s in chapters["segments"]}
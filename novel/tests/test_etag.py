@@ -0,0 +1,41 @@
+import pytest
+from app.core.config import init_dirs
+from app.services import novel_service, session_service
+
+# 条件 GET：未变化时返回 304 且无正文；写入后 ETag 改变
+
+URLS = ["/api/novel", "/api/novel?full=true", "/api/novel/chapters", "/api/history", "/api/sessions", "/api/config"]
+
+@pytest.fixture
+def headers(login):
+    init_dirs()
+    session_service.create_new_session("etag_tester")
+    novel_service.save_novel_content("etag_tester", "第一章 开端\n正文。")
+    return login("etag_tester")
+
+@pytest.mark.parametrize("url", URLS)
+def test_unchanged_resource_returns_304(client, headers, url):
+    first = client.get(url, headers=headers)
+    assert first.status_code == 200
+    tag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    cached = client.get(url, headers={**headers, "If-None-Match": tag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == tag
+    # 弱比较与多值列表
+    assert client.get(url, headers={**headers, "If-None-Match": f'"other", W/{tag}'}).status_code == 304
+
+@pytest.mark.parametrize("url", ["/api/novel", "/api/novel/chapters", "/api/history", "/api/sessions"])
+def test_save_changes_etag(client, headers, url):
+    tag = client.get(url, headers=headers).headers["etag"]
+    novel_service.save_novel_content("etag_tester", "第二章 发展\n更多正文。")
+    fresh = client.get(url, headers={**headers, "If-None-Match": tag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != tag
+
+def test_query_parameters_are_part_of_the_tag(client, headers):
+    a = client.get("/api/history", params={"limit": 1}, headers=headers).headers["etag"]
+    b = client.get("/api/history", params={"limit": 2}, headers=headers).headers["etag"]
+    assert a != b
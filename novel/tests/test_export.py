@@ -0,0 +1,73 @@
+import io
+import zipfile
+from pathlib import Path
+from app.core import codec
+from app.core.config import init_dirs
+from app.services import fork_store, history_store, novel_service, session_service, storage_service
+
+# 导出与下载：zip 流包含全部会话（分叉会话为完整逻辑内容，冷存储会话直接解压写入）；
+# 分叉会话的下载支持单个 Range
+
+USERNAME = "export_tester"
+
+def build_sessions():
+    init_dirs()
+    cold = Path(session_service.create_new_session(USERNAME)["path"])
+    novel_service.save_novel_content(USERNAME, "冷会话正文。")
+    cold_bytes = cold.read_bytes()
+    cold_history = history_store.load(cold.with_suffix(".json"))
+    assert storage_service.freeze_session(cold)
+
+    parent = Path(session_service.create_new_session(USERNAME)["path"])
+    first = novel_service.save_novel_content(USERNAME, "父会话第一段。")
+    novel_service.save_novel_content(USERNAME, "父会话第二段。")
+    child = Path(session_service.fork_session(USERNAME, first)["path"])
+    novel_service.save_novel_content(USERNAME, "分叉后的新段落。")
+    return {"cold": (cold, cold_bytes, cold_history), "parent": parent, "child": child}
+
+def test_zip_export_contains_logical_content(client, login):
+    sessions = build_sessions()
+    response = client.get("/api/sessions/export", headers=login(USERNAME))
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        assert zf.testzip() is None
+        names = set(zf.namelist())
+        for path in (sessions["parent"], sessions["child"]):
+            assert {path.name, path.with_suffix(".json").name} <= names
+            assert zf.read(path.name) == fork_store.read_bytes(path)
+        child = sessions["child"]
+        assert "父会话第一段。".encode("utf-8") in zf.read(child.name)
+        assert "父会话第二段。".encode("utf-8") not in zf.read(child.name)
+        history = [b["content"] for b in codec.loads(zf.read(child.with_suffix(".json").name))]
+        assert history == ["父会话第一段。", "分叉后的新段落。"]
+
+        cold, cold_bytes, cold_history = sessions["cold"]
+        assert zf.read(cold.name) == cold_bytes
+        assert codec.loads(zf.read(cold.with_suffix(".json").name)) == cold_history
+    # 导出不会解冻会话
+    assert storage_service.is_cold(cold)
+
+def test_fork_download_ranges(client, login):
+    child = build_sessions()["child"]
+    headers = login(USERNAME)
+    data = fork_store.read_bytes(child)
+    url = f"/api/novel/download?filename={child.name}"
+
+    full = client.get(url, headers=headers)
+    assert full.status_code == 200
+    assert full.content == data
+    assert full.headers["content-length"] == str(len(data))
+
+    # 跨越父会话前缀与自身内容的区间
+    start = fork_store.prefix_size(child) - 3
+    part = client.get(url, headers={**headers, "Range": f"bytes={start}-{start + 9}"})
+    assert part.status_code == 206
+    assert part.content == data[start:start + 10]
+    assert part.headers["content-range"] == f"bytes {start}-{start + 9}/{len(data)}"
+
+    suffix = client.get(url, headers={**headers, "Range": "bytes=-4"})
+    assert suffix.content == data[-4:]
+    assert client.get(url, headers={**headers, "Range": f"bytes={len(data)}-"}).status_code == 416
+    assert client.get("/api/novel/download?filename=missing.txt", headers=headers).status_code == 404
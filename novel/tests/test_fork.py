@@ -0,0 +1,23 @@
+from pathlib import Path
+from app.core.config import init_dirs
+from app.services import session_service, novel_service
+
+# 同一秒内连续创建、分叉会话不冲突：文件名追加序号，已有会话不被覆盖
+
+USERNAME = "fork_tester"
+
+def test_fork_within_same_second_gets_unique_name():
+    init_dirs()
+    created = session_service.create_new_session(USERNAME)
+    block_id = novel_service.save_novel_content(USERNAME, "第一章\n正文内容。", "继续")
+
+    forks = [session_service.fork_session(USERNAME, block_id, switch=False) for _ in range(3)]
+    names = {created["filename"]} | {f["filename"] for f in forks}
+
+    assert len(names) == 4
+    for fork in forks:
+        path = Path(fork["path"])
+        assert path.exists()
+        assert path.with_suffix(".fork.json").exists()
+    # 父会话未被分叉覆盖
+    assert "正文内容" in Path(created["path"]).read_text(encoding="utf-8")
@@ -0,0 +1,81 @@
+import json
+from app.core import codec
+from app.core.config import init_dirs
+from app.services import history_store, novel_service, session_service
+
+# 会话历史始终为每块一行的 JSON 数组，与 JSON_STORAGE_PRETTY 无关
+
+BLOCKS = [
+    {"id": "a", "role": "user", "content": "第一章"},
+    {"id": "b", "role": "assistant", "content": "正文", "status": "discarded"},
+]
+
+def test_codec_round_trip_keeps_chinese():
+    data = codec.dumpb({"text": "中文"})
+    assert "中文".encode("utf-8") in data
+    assert codec.loads(data) == {"text": "中文"}
+    assert codec.loads(codec.dumpb({"text": "中文"}, pretty=True)) == {"text": "中文"}
+
+def test_save_ignores_pretty_setting(tmp_path, monkeypatch):
+    monkeypatch.setattr(codec, "JSON_STORAGE_PRETTY", True)
+    path = tmp_path / "s.json"
+    history_store.save(path, BLOCKS)
+    lines = path.read_bytes().split(b"\n")
+    assert lines[0] == b"["
+    assert [codec.loads(line.rstrip(b",")) for line in lines[1:3]] == BLOCKS
+    assert json.loads(path.read_text("utf-8")) == BLOCKS
+
+    # 其余存储文件仍按设置缩进
+    other = tmp_path / "other.json"
+    codec.write_file(other, {"k": 1})
+    assert b"\n  " in other.read_bytes()
+
+def test_append_converts_legacy_indent_file(tmp_path):
+    path = tmp_path / "s.json"
+    path.write_text(json.dumps(BLOCKS[:1], ensure_ascii=False, indent=2), "utf-8")
+    history_store.append(path, BLOCKS[1:])
+    assert history_store.load(path) == BLOCKS
+    assert path.read_bytes().startswith(b"[\n{")
+
+    # 按行格式下原地追加，last_block 只读文件末尾
+    history_store.append(path, [{"id": "c", "role": "user", "content": "续"}])
+    assert history_store.last_block(path)["id"] == "c"
+    assert len(history_store.load(path)) == 3
+
+# --- 分页：cursor、fields、倒序与丢弃块过滤 ---
+
+def history_session(username: str, count: int) -> list:
+    init_dirs()
+    session_service.create_new_session(username)
+    ids = [novel_service.save_novel_content(username, f"第{i}段。") for i in range(count)]
+    novel_service.discard_novel_block(username, ids[2])
+    return ids
+
+def test_cursor_pages_cover_history_once(client, login):
+    ids = history_session("history_pager", 5)
+    headers = login("history_pager")
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor is not None else {})}
+        page = client.get("/api/history", params=params, headers=headers).json()
+        assert page["total"] == 5
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ids
+
+    page = client.get("/api/history", params={"order": "desc", "limit": 2}, headers=headers).json()
+    assert [item["index"] for item in page["items"]] == [4, 3]
+    assert page["next_cursor"] == 2
+
+def test_fields_and_discarded_filter(client, login):
+    ids = history_session("history_fields", 4)
+    headers = login("history_fields")
+    page = client.get("/api/history", params={"fields": "id,status,content_length", "include_discarded": False},
+                      headers=headers).json()
+    assert [item["id"] for item in page["items"]] == [ids[0], ids[1], ids[3]]
+    assert page["items"][0] == {"index": 0, "id": ids[0], "status": "active", "content_length": len("第0段。")}
+
+    assert client.get("/api/history", params={"limit": 0}, headers=headers).status_code == 422
+    assert client.get("/api/history", params={"order": "sideways"}, headers=headers).status_code == 422
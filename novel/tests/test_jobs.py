@@ -0,0 +1,78 @@
+import os
+import time
+import asyncio
+from pathlib import Path
+from app.core import codec
+from app.core.config import init_dirs, JOBS_ROOT, JOB_RETENTION_DAYS
+from app.services import job_service, novel_service, rate_limit_service
+
+# 后台任务共享 worker：同一用户同时只执行 MAX_RUNNING_JOBS_PER_USER 个任务，
+# 执行中的任务计入该用户的并发名额，其他用户的任务不被阻塞。
+
+def test_one_user_cannot_occupy_every_worker(monkeypatch):
+    init_dirs()
+    running = {}
+    peak = {}
+    slots_seen = []
+
+    async def stub_continuation(config, messages, on_usage=None):
+        username = Path(config["file_path"]).parent.name
+        running[username] = running.get(username, 0) + 1
+        peak[username] = max(peak.get(username, 0), running[username])
+        slots_seen.append(rate_limit_service.ACTIVE_STREAMS[username])
+        try:
+            for _ in range(3):
+                await asyncio.sleep(0.02)
+                yield "字"
+        finally:
+            running[username] -= 1
+
+    monkeypatch.setattr(novel_service, "stream_continuation", stub_continuation)
+    monkeypatch.setattr(job_service, "JOB_WORKERS", 2)
+    monkeypatch.setattr(job_service, "JOB_DEFER_SECONDS", 0.01)
+
+    async def run():
+        job_service.start_workers()
+        try:
+            busy = [job_service.submit_job("job_busy", "generate") for _ in range(3)]
+            other = job_service.submit_job("job_other", "generate")
+            jobs = [job_service.JOBS[j["id"]] for j in busy + [other]]
+            while any(j.record["status"] not in job_service.FINAL_STATUSES for j in jobs):
+                await asyncio.sleep(0.01)
+            return jobs
+        finally:
+            await job_service.stop_workers()
+
+    jobs = asyncio.run(asyncio.wait_for(run(), timeout=10))
+
+    assert all(j.record["status"] == job_service.STATUS_COMPLETED for j in jobs)
+    assert peak["job_busy"] == 1
+    assert peak["job_other"] == 1
+    assert all(slots >= 1 for slots in slots_seen)
+    assert rate_limit_service.ACTIVE_STREAMS["job_busy"] == 0
+    assert rate_limit_service.ACTIVE_STREAMS["job_other"] == 0
+
+def job_record(job_id: str, username: str, status: str) -> dict:
+    return {
+        "id": job_id, "username": username, "type": "generate", "status": status,
+        "params": {"user_prompt": None, "outline": None}, "target_path": "", "progress_chars": 2,
+        "block_id": "", "error": "", "created_at": "2026-01-01T00:00:00", "started_at": "", "finished_at": "",
+        "output": "正文",
+    }
+
+def test_recover_keeps_unexpired_final_jobs():
+    init_dirs()
+    username = "job_restart"
+    for job_id, status in (("r_done", "completed"), ("r_failed", "failed"), ("r_running", "running"), ("r_old", "completed")):
+        codec.write_file(JOBS_ROOT / f"{job_id}.json", job_record(job_id, username, status))
+    expired = time.time() - (JOB_RETENTION_DAYS + 1) * 86400
+    os.utime(JOBS_ROOT / "r_old.json", (expired, expired))
+
+    job_service.recover_jobs()
+
+    listed = {j["id"]: j["status"] for j in job_service.list_jobs(username)}
+    assert listed == {"r_done": "completed", "r_failed": "failed", "r_running": "failed"}
+    assert not (JOBS_ROOT / "r_old.json").exists()
+    assert job_service.get_job(username, "r_done").public(include_output=True)["output"] == "正文"
+    # 已结束的任务只读：取消不改变状态
+    assert job_service.cancel_job(username, "r_done")["status"] == "completed"
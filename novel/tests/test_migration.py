@@ -0,0 +1,36 @@
+from app.core import codec
+from app.services import migration_service
+
+# 迁移到已有数据的目标目录：目标中原有的用户不被旧数据覆盖，重新执行时本迁移加入的用户不算原有用户
+
+def write(path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+def make_legacy(root):
+    users = {name: {"hash": "h", "salt": "s"} for name in ("alice", "bob")}
+    codec.write_file(root / "users.json", users)
+    for name in users:
+        codec.write_file(root / "configs" / f"{name}.json", {"model": "legacy-model", "file_path": ""})
+        write(root / "data" / name / "a.txt", f"{name} 的旧正文\n")
+
+def test_existing_target_users_are_not_overwritten(tmp_path):
+    source, target = tmp_path / "legacy", tmp_path / "target"
+    make_legacy(source)
+    codec.write_file(target / "users.json", {"alice": {"hash": "new", "salt": "new", "group": "vip"}})
+    codec.write_file(target / "configs" / "alice.json", {"model": "current-model", "file_path": ""})
+    write(target / "data" / "alice" / "a.txt", "alice 的新正文\n")
+
+    report = migration_service.migrate(source, target, workers=1)
+
+    assert codec.read_file(target / "configs" / "alice.json")["model"] == "current-model"
+    assert (target / "data" / "alice" / "a.txt").read_text(encoding="utf-8") == "alice 的新正文\n"
+    assert codec.read_file(target / "users.json")["alice"]["hash"] == "new"
+    assert any(p["username"] == "alice" and "already exists" in p["problem"] for p in report["problems"])
+    assert codec.read_file(target / "configs" / "bob.json")["model"] == "legacy-model"
+    assert (target / "data" / "bob" / "a.txt").read_text(encoding="utf-8") == "bob 的旧正文\n"
+
+    # 重做：bob 是本迁移加入的，重新迁移而不是被当作已有用户跳过
+    again = migration_service.migrate(source, target, workers=1, restart=True)
+    assert again["users"] == 1
+    assert not any(p["username"] == "bob" and "already exists" in p["problem"] for p in again["problems"])
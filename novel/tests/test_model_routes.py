@@ -0,0 +1,61 @@
+import asyncio
+from stubs import Reply
+from app.core.config import MODEL_ROUTES_FILE, UPSTREAMS_FILE, init_dirs
+from app.services import upstream_service, usage_service, metrics
+
+# model_routes.json 按任务类型换模型；用量与指标按任务细分
+
+CONFIG = {"model": "creative-model", "base_url": "http://user/v1", "api_key": "user-key"}
+MESSAGES = [{"role": "user", "content": "正文"}]
+ROUTES = {
+    "title": {"model": "cheap-model", "base_url": "http://cheap/v1", "api_key": "cheap-key"},
+    "summary": {"model": "pooled-model"},
+}
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=10))
+
+def counter(name: str, **labels) -> float:
+    return metrics.snapshot()["counters"].get(metrics._key(name, labels), 0)
+
+def test_route_config_replaces_model_only_for_routed_tasks(json_file):
+    json_file(MODEL_ROUTES_FILE, ROUTES)
+    assert upstream_service.route_config(CONFIG, upstream_service.TASK_CONTINUATION) is CONFIG
+    title = upstream_service.route_config(CONFIG, upstream_service.TASK_TITLE)
+    assert (title["model"], title["base_url"], title["api_key"]) == ("cheap-model", "http://cheap/v1", "cheap-key")
+    summary = upstream_service.route_config(CONFIG, upstream_service.TASK_SUMMARY)
+    assert (summary["model"], summary["base_url"]) == ("pooled-model", "http://user/v1")
+    assert CONFIG["model"] == "creative-model"
+
+def test_routed_calls_hit_routed_upstream(fake_upstream, json_file):
+    json_file(MODEL_ROUTES_FILE, ROUTES)
+    json_file(UPSTREAMS_FILE, {"pooled-model": {"endpoints": [{"base_url": "http://pool/v1", "api_key": "k"}]}})
+    fake_upstream.plan("http://cheap/v1", Reply(["书名"]))
+
+    assert run(upstream_service.complete_chat(CONFIG, MESSAGES, task=upstream_service.TASK_TITLE)) == "书名"
+    run(upstream_service.complete_chat(CONFIG, MESSAGES, task=upstream_service.TASK_SUMMARY))
+    run(upstream_service.complete_chat(CONFIG, MESSAGES))
+    assert [(c["base_url"], c["model"]) for c in fake_upstream.calls] == [
+        ("http://cheap/v1", "cheap-model"),
+        ("http://pool/v1", "pooled-model"),
+        ("http://user/v1", "creative-model"),
+    ]
+
+def test_usage_and_metrics_are_split_by_task(fake_upstream, json_file):
+    init_dirs()
+    json_file(MODEL_ROUTES_FILE, ROUTES)
+    fake_upstream.plan("http://cheap/v1", Reply(["书名"], usage={"prompt_tokens": 10, "completion_tokens": 3}))
+    fake_upstream.plan("http://user/v1", Reply(["正文"], usage={"prompt_tokens": 100, "completion_tokens": 50}))
+    username = "route_usage_tester"
+    before = counter("task_requests_total", task="title", model="cheap-model")
+
+    recorder = usage_service.usage_recorder(username)
+    run(upstream_service.complete_chat(CONFIG, MESSAGES, on_usage=recorder, task=upstream_service.TASK_TITLE))
+    run(upstream_service.complete_chat(CONFIG, MESSAGES, on_usage=recorder))
+
+    day = usage_service.get_user_usage(username, days=1)[0]
+    assert (day["requests"], day["prompt_tokens"], day["completion_tokens"]) == (2, 110, 53)
+    assert day["tasks"]["title"] == {"requests": 1, "prompt_tokens": 10, "completion_tokens": 3}
+    assert day["tasks"]["continuation"]["completion_tokens"] == 50
+    assert counter("task_requests_total", task="title", model="cheap-model") == before + 1
+    assert counter("task_completion_tokens_total", task="title", model="cheap-model") >= 3
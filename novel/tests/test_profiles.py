@@ -0,0 +1,54 @@
+import pytest
+from stubs import Reply
+from app.core.config import DEFAULT_API_CONFIG, init_dirs
+from app.services import group_service, rate_limit_service, session_service, user_manager
+
+# 生成档位：按用户组限制任务、模型与采样参数；不允许时返回 403，不占用并发名额也不调用上游
+
+MODEL = DEFAULT_API_CONFIG["model"]
+OUTLINE = {"protagonist": "甲", "age": "20", "style": "武侠", "plot": "复仇", "word_count": "1000"}
+
+def setup_user(username: str, profile: dict):
+    init_dirs()
+    groups = group_service.get_groups_db()
+    groups[f"{username}_group"] = {"name": f"{username}_group", "description": "", "generation_profile": profile}
+    group_service.save_groups_db(groups)
+    users = user_manager.get_users_db()
+    users[username] = {"hash": "h", "salt": "s", "group": f"{username}_group"}
+    user_manager.save_users_db(users)
+    session_service.create_new_session(username)
+
+def test_profile_shapes_upstream_request(client, login, fake_upstream):
+    setup_user("profile_buffered", {"max_tokens": {"continuation": 321}, "temperature": 0.3, "stream": False})
+    fake_upstream.plan(DEFAULT_API_CONFIG["base_url"], Reply(["整段续写"]))
+
+    response = client.post("/api/generate", json={}, headers=login("profile_buffered"))
+    assert response.status_code == 200
+    assert response.text == "整段续写"
+    [call] = fake_upstream.calls
+    assert call["stream"] is False
+    assert call["params"]["max_tokens"] == 321
+    assert call["params"]["temperature"] == 0.3
+    assert call["params"]["top_p"] == group_service.DEFAULT_GENERATION_PROFILE["top_p"]
+    assert rate_limit_service.ACTIVE_STREAMS["profile_buffered"] == 0
+
+@pytest.mark.parametrize("url, body", [("/api/outline", OUTLINE), ("/api/jobs", {"type": "outline", "outline": OUTLINE})])
+def test_disabled_task_is_forbidden(client, login, fake_upstream, url, body):
+    setup_user("profile_no_outline", {"max_tokens": {"outline": 0}})
+    response = client.post(url, json=body, headers=login("profile_no_outline"))
+    assert response.status_code == 403
+    assert "大纲生成" in response.json()["detail"]
+    assert fake_upstream.calls == []
+
+def test_model_outside_allow_list_is_forbidden(client, login, fake_upstream):
+    setup_user("profile_models", {"allowed_models": ["cheap-model"]})
+    headers = login("profile_models")
+    response = client.post("/api/generate", json={}, headers=headers)
+    assert response.status_code == 403
+    assert "cheap-model" in response.json()["detail"]
+    assert fake_upstream.calls == []
+
+    config = {**user_manager.get_user_config("profile_models"), "model": "other-model"}
+    config.pop("file_path", None)
+    assert client.post("/api/config", json=config, headers=headers).status_code == 403
+    assert client.post("/api/config", json={**config, "model": "cheap-model"}, headers=headers).status_code == 200
@@ -0,0 +1,68 @@
+import pytest
+from app.core.config import init_dirs
+from app.services import rate_limit_service, usage_service
+from app.services.rate_limit_service import RateLimitExceeded
+
+# 并发名额按上游流计数：多候选续写占用与候选数相同的名额；
+# 频率限制给出 Retry-After，每日 token 配额取自用量账本
+
+USERNAME = "stream_limit_tester"
+LIMITS = {"group": "default", "max_concurrent_streams": 2}
+
+def test_candidates_take_one_slot_each():
+    rate_limit_service.acquire_stream(USERNAME, LIMITS, 2)
+    try:
+        assert rate_limit_service.ACTIVE_STREAMS[USERNAME] == 2
+        with pytest.raises(RateLimitExceeded):
+            rate_limit_service.acquire_stream(USERNAME, LIMITS)
+    finally:
+        rate_limit_service.release_stream(USERNAME, 2)
+    assert rate_limit_service.ACTIVE_STREAMS[USERNAME] == 0
+
+def test_rejects_more_candidates_than_limit():
+    with pytest.raises(RateLimitExceeded):
+        rate_limit_service.acquire_stream(USERNAME, LIMITS, 3)
+    assert rate_limit_service.ACTIVE_STREAMS[USERNAME] == 0
+
+# --- 频率与每日 token 配额 ---
+
+def test_requests_per_minute_sets_retry_after():
+    limits = {"group": "rpm_group", "requests_per_minute": 2, "group_requests_per_minute": None,
+              "max_concurrent_streams": None, "daily_token_limit": None}
+    rate_limit_service.check_request("rpm_tester", limits)
+    rate_limit_service.check_request("rpm_tester", limits)
+    with pytest.raises(RateLimitExceeded) as exc:
+        rate_limit_service.check_request("rpm_tester", limits)
+    assert exc.value.retry_after >= 1
+
+def test_daily_quota_comes_from_usage_ledger():
+    init_dirs()
+    username = "quota_tester"
+    limits = {"group": "quota_group", "requests_per_minute": None, "group_requests_per_minute": None,
+              "max_concurrent_streams": 1, "daily_token_limit": 100}
+    usage_service.record_usage(username, {"prompt_tokens": 60, "completion_tokens": 30})
+    rate_limit_service.check_request(username, limits)
+    assert not rate_limit_service.has_headroom(username, 20, limits)
+
+    usage_service.record_usage(username, {"prompt_tokens": 5, "completion_tokens": 5})
+    with pytest.raises(RateLimitExceeded, match="上限"):
+        rate_limit_service.check_request(username, limits)
+
+def test_admit_releases_slots_when_quota_exceeded(monkeypatch):
+    username = "quota_admit_tester"
+    limits = {"group": "quota_group", "requests_per_minute": None, "group_requests_per_minute": None,
+              "max_concurrent_streams": 4, "daily_token_limit": 0, "speculative_generation": False}
+    monkeypatch.setattr(rate_limit_service, "get_limits", lambda _: limits)
+    with pytest.raises(RateLimitExceeded):
+        rate_limit_service.admit_stream(username, 2)
+    assert rate_limit_service.ACTIVE_STREAMS[username] == 0
+
+def test_rate_limited_generate_returns_429(client, login, monkeypatch):
+    limits = {"group": "quota_group", "requests_per_minute": 1, "group_requests_per_minute": None,
+              "max_concurrent_streams": None, "daily_token_limit": None, "speculative_generation": False}
+    monkeypatch.setattr(rate_limit_service, "get_limits", lambda _: limits)
+    monkeypatch.setitem(rate_limit_service.BUCKETS, "user:quota_http_tester", rate_limit_service.TokenBucket(1))
+    rate_limit_service.BUCKETS["user:quota_http_tester"].tokens = 0
+    response = client.post("/api/generate", json={}, headers=login("quota_http_tester"))
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
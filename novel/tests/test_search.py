@@ -0,0 +1,62 @@
+from pathlib import Path
+from app.core.config import init_dirs
+from app.services import novel_service, search_service, session_service
+
+# 全文搜索：3 字及以上走 FTS5 trigram（按相关度），更短的关键词走 LIKE（按时间倒序）；
+# save / discard / 改名时增量维护，与全量重建结果一致
+
+def search_session(username: str) -> dict:
+    init_dirs()
+    path = Path(session_service.create_new_session(username)["path"])
+    ids = {
+        "meet": novel_service.save_novel_content(username, "林黛玉初见贾宝玉，两人相视一笑。"),
+        "rain": novel_service.save_novel_content(username, "窗外下着雨，宝玉独自读书。"),
+        "percent": novel_service.save_novel_content(username, "折扣 50% 的告示。"),
+    }
+    return {"path": path, "ids": ids}
+
+def block_ids(result: dict) -> list:
+    return [hit["block_id"] for hit in result["hits"]]
+
+def test_long_terms_use_fts_ranking():
+    ids = search_session("search_fts")["ids"]
+    result = search_service.search("search_fts", "贾宝玉")
+    assert block_ids(result) == [ids["meet"]]
+    assert result["hits"][0]["score"] is not None
+    assert "贾宝玉" in result["hits"][0]["snippet"]
+    # 多个关键词需同时命中
+    assert block_ids(search_service.search("search_fts", "林黛玉 读书")) == []
+
+def test_short_terms_use_like_newest_first():
+    ids = search_session("search_like")["ids"]
+    result = search_service.search("search_like", "宝玉")
+    assert block_ids(result) == [ids["rain"], ids["meet"]]
+    assert all(hit["score"] is None for hit in result["hits"])
+    # 长短关键词混合
+    assert block_ids(search_service.search("search_like", "贾宝玉 一笑")) == [ids["meet"]]
+    # LIKE 通配符按字面匹配
+    assert block_ids(search_service.search("search_like", "%")) == [ids["percent"]]
+    assert block_ids(search_service.search("search_like", "_")) == []
+
+def test_index_follows_discard_and_rename_and_matches_rebuild():
+    session = search_session("search_sync")
+    ids = session["ids"]
+    novel_service.discard_novel_block("search_sync", ids["rain"])
+    assert block_ids(search_service.search("search_sync", "宝玉")) == [ids["meet"]]
+
+    renamed = session["path"].with_name("红楼.txt")
+    session["path"].rename(renamed)
+    session["path"].with_suffix(".json").rename(renamed.with_suffix(".json"))
+    search_service.on_renamed("search_sync", session["path"].name, renamed.name)
+    assert search_service.search("search_sync", "林黛玉", session="红楼.txt")["hits"][0]["session"] == "红楼.txt"
+
+    before = search_service.search("search_sync", "的")["hits"]
+    search_service.rebuild("search_sync")
+    assert search_service.search("search_sync", "的")["hits"] == before
+
+def test_search_endpoint_validates_query(client, login):
+    search_session("search_api")
+    headers = login("search_api")
+    assert client.get("/api/search", params={"q": ""}, headers=headers).status_code == 422
+    body = client.get("/api/search", params={"q": "读书", "limit": 1}, headers=headers).json()
+    assert len(body["hits"]) == 1
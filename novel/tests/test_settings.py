@@ -0,0 +1,31 @@
+import json
+from pathlib import Path
+from app.core import config
+
+# 设置优先级：NOVEL_<字段> 环境变量 > NOVEL_SETTINGS_FILE > 默认值
+
+def test_defaults(monkeypatch):
+    monkeypatch.delenv("NOVEL_PROJECT_ROOT")
+    settings = config.load_settings()
+    assert settings == config.Settings()
+
+def test_env_overrides_settings_file(tmp_path, monkeypatch, capsys):
+    settings_file = tmp_path / "settings.json"
+    settings_file.write_text(json.dumps({"project_root": "/srv/file", "port": 19001,
+                                         "job_workers": 3, "unknown_key": 1}), "utf-8")
+    monkeypatch.setenv("NOVEL_SETTINGS_FILE", str(settings_file))
+    monkeypatch.setenv("NOVEL_PROJECT_ROOT", "/srv/env")
+    monkeypatch.setenv("NOVEL_JOB_WORKERS", "4")
+    monkeypatch.setenv("NOVEL_BLOCK_STORE", "yes")
+
+    settings = config.load_settings()
+    assert settings.project_root == Path("/srv/env")
+    assert settings.job_workers == 4
+    assert settings.port == 19001
+    assert settings.block_store is True
+    assert settings.host == config.Settings.host
+    assert "unknown_key" in capsys.readouterr().out
+
+def test_bool_parsing(monkeypatch):
+    monkeypatch.setenv("NOVEL_BLOCK_STORE", "off")
+    assert config.load_settings().block_store is False
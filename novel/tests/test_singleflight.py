@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+from app.services import singleflight
+
+# 合并重复请求：进行中的相同 key 只执行一次；流式订阅者回放已生成内容，全部断开后才取消生产者
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=10))
+
+def test_do_runs_once_for_concurrent_callers():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "书名"
+
+    async def main():
+        results = await asyncio.gather(*(singleflight.do("k:do", "rename", work) for _ in range(3)))
+        # 结束后立即移除，不缓存结果
+        assert await singleflight.do("k:do", "rename", work) == "书名"
+        return results
+
+    assert run(main()) == ["书名"] * 3
+    assert len(calls) == 2
+
+def test_make_key_depends_on_parts():
+    key = singleflight.make_key("u", "generate", "s.txt", [{"content": "甲"}], 1)
+    assert key == singleflight.make_key("u", "generate", "s.txt", [{"content": "甲"}], 1)
+    assert key != singleflight.make_key("u", "generate", "s.txt", [{"content": "甲"}], 2)
+
+class Source:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.started = 0
+        self.release = None
+        self.cancelled = False
+
+    def __call__(self):
+        self.started += 1
+        return self.produce()
+
+    async def produce(self):
+        try:
+            for chunk in self.chunks:
+                await self.release.wait()
+                self.release.clear()
+                yield chunk
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+async def read(stream, count=None):
+    items = []
+    async for item in stream:
+        items.append(item)
+        if count is not None and len(items) >= count:
+            break
+    return items
+
+def test_late_subscriber_replays_and_follows():
+    source = Source(["甲", "乙", "丙"])
+
+    async def main():
+        source.release = asyncio.Event()
+        first = singleflight.stream("k:replay", "generate", source)
+        source.release.set()
+        assert await first.__anext__() == "甲"
+        second = asyncio.ensure_future(read(singleflight.stream("k:replay", "generate", source)))
+        for _ in range(2):
+            await asyncio.sleep(0.01)
+            source.release.set()
+        rest = await read(first)
+        return rest, await second
+
+    rest, second = run(main())
+    assert rest == ["乙", "丙"]
+    assert second == ["甲", "乙", "丙"]
+    assert source.started == 1
+
+def test_producer_cancelled_only_when_all_subscribers_leave():
+    source = Source(["甲", "乙"])
+
+    async def main():
+        source.release = asyncio.Event()
+        first = singleflight.stream("k:leave", "generate", source)
+        second = singleflight.stream("k:leave", "generate", source)
+        source.release.set()
+        assert await first.__anext__() == "甲"
+        assert await second.__anext__() == "甲"
+        await first.aclose()
+        await asyncio.sleep(0.01)
+        assert not source.cancelled
+        await second.aclose()
+
+    run(main())
+    assert source.cancelled
+
+def test_error_reaches_every_subscriber():
+    async def failing():
+        yield "甲"
+        raise ValueError("上游出错")
+
+    async def main():
+        streams = [singleflight.stream("k:error", "generate", failing) for _ in range(2)]
+        return await asyncio.gather(*(read(s) for s in streams), return_exceptions=True)
+
+    results = run(main())
+    assert all(isinstance(r, ValueError) for r in results)
@@ -0,0 +1,42 @@
+import asyncio
+from app.services import singleflight, speculative_service
+
+# 预生成被接管后由 singleflight.stream 回放已生成内容并继续跟随；key 不一致时丢弃
+
+USERNAME = "spec_tester"
+
+async def source(chunks: list, finished: list):
+    try:
+        for chunk in chunks:
+            await asyncio.sleep(0.01)
+            yield chunk
+    finally:
+        finished.append(True)
+
+def test_claimed_speculation_is_replayed_through_singleflight():
+    async def run():
+        finished, released = [], []
+        key = singleflight.make_key(USERNAME, "generate", "s.txt", "msgs", 1)
+        speculative_service.start(USERNAME, key, lambda: source(["a", "b", "c"], finished), lambda: released.append(True))
+        await asyncio.sleep(0.025)  # 部分内容已生成
+        claimed = lambda: speculative_service.claim(USERNAME, key) or source(["x"], [])
+        output = [chunk async for chunk in singleflight.stream(key, "generate", claimed)]
+        await asyncio.sleep(0)
+        return output, finished, released
+
+    output, finished, released = asyncio.run(run())
+    assert output == ["a", "b", "c"]
+    assert finished and released
+
+def test_mismatched_key_cancels_speculation():
+    async def run():
+        finished, released = [], []
+        speculative_service.start(USERNAME, "k1", lambda: source(["a"] * 100, finished), lambda: released.append(True))
+        await asyncio.sleep(0.02)
+        assert speculative_service.claim(USERNAME, "k2") is None
+        await asyncio.sleep(0.01)
+        return finished, released
+
+    finished, released = asyncio.run(run())
+    assert finished and released
+    assert USERNAME not in speculative_service._SPECULATIONS
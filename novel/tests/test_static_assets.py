@@ -0,0 +1,12 @@
+from app.core.static_assets import PrecompressedStaticFiles
+
+# 构造（即导入 main）时不读取、不压缩文件，预压缩在启动时显式执行
+
+def test_precompress_is_deferred(tmp_path):
+    (tmp_path / "index.html").write_text("<p>正文</p>\n" * 200, encoding="utf-8")
+    static = PrecompressedStaticFiles(directory=str(tmp_path))
+    assert static.assets == {}
+
+    summary = static.precompress()
+    assert summary["files"] == 1
+    assert "gzip" in static.assets[str(tmp_path / "index.html")].variants
@@ -0,0 +1,52 @@
+from pathlib import Path
+from app.core.config import init_dirs
+from app.services import session_service, novel_service, stats_service, user_manager
+
+# 存储统计随写操作增量更新，结果与 reconcile 全量扫描一致；手工改动文件造成的漂移由 reconcile 修正
+
+def counters(username: str) -> dict:
+    stats = stats_service.get_user_stats(username)
+    return {field: stats[field] for field in stats_service.FIELDS}
+
+def test_incremental_counters_match_reconcile():
+    init_dirs()
+    username = "stats_tester"
+    path = Path(session_service.create_new_session(username)["path"])
+    novel_service.save_novel_content(username, "第一段。")
+    discarded = novel_service.save_novel_content(username, "第二段。", "继续")
+    novel_service.discard_novel_block(username, discarded)
+
+    stats = counters(username)
+    assert stats["sessions"] == 1
+    assert stats["text_bytes"] == path.stat().st_size
+    assert stats["discarded_blocks"] == 1
+    assert stats_service.get_user_stats(username)["discarded_ratio"] == round(1 / stats["blocks"], 4)
+    assert username not in stats_service.reconcile()["drift"]
+    assert counters(username) == stats
+
+def test_reconcile_reports_and_fixes_drift():
+    init_dirs()
+    username = "stats_drift"
+    path = Path(session_service.create_new_session(username)["path"])
+    novel_service.save_novel_content(username, "正文。")
+    path.write_bytes(path.read_bytes() + b"hand edit")
+
+    assert stats_service.reconcile()["drift"][username] == {"text_bytes": len(b"hand edit")}
+    assert counters(username)["text_bytes"] == path.stat().st_size
+    assert username not in stats_service.reconcile()["drift"]
+
+def test_group_totals_follow_user_group_changes():
+    init_dirs()
+    username = "stats_mover"
+    session_service.create_new_session(username)
+    novel_service.save_novel_content(username, "正文。")
+    user_manager.save_users_db({**user_manager.get_users_db(), username: {"hash": "h", "salt": "s", "group": "default"}})
+    stats_service.reconcile()
+    moved = counters(username)
+    before = stats_service.get_summary()["groups"]["default"]
+
+    user_manager.update_user_group(username, "stats_group")
+    summary = stats_service.get_summary(include_users=True)
+    assert summary["groups"]["stats_group"]["text_bytes"] == moved["text_bytes"]
+    assert summary["groups"]["default"]["text_bytes"] == before["text_bytes"] - moved["text_bytes"]
+    assert summary["users"][username]["group"] == "stats_group"
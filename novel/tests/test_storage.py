@@ -0,0 +1,90 @@
+import datetime
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from app.core.config import init_dirs
+from app.services import session_service, novel_service, storage_service, history_store, stats_service
+
+# 压缩与保存互斥：压缩线程写好临时文件、等待会话锁时有新的保存，压缩放弃本次结果，保存不丢失；
+# 压缩 -> 冷存储 -> 解冻往返后内容、修改时间与统计不变
+
+USERNAME = "storage_tester"
+
+def test_save_during_compaction_is_kept():
+    init_dirs()
+    path = Path(session_service.create_new_session(USERNAME)["path"])
+    novel_service.save_novel_content(USERNAME, "第一段。")
+    discarded = novel_service.save_novel_content(USERNAME, "第二段。")
+    novel_service.discard_novel_block(USERNAME, discarded)
+
+    results = []
+    lock = history_store.session_lock(path)
+    with lock:
+        worker = threading.Thread(target=lambda: results.append(storage_service.compact_session(path)))
+        worker.start()
+        tmp_path = path.with_suffix(".json.tmp")
+        deadline = time.monotonic() + 5
+        while not tmp_path.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert tmp_path.exists()
+        # 压缩线程此时阻塞在会话锁上；本线程持有可重入锁，保存直接写入
+        kept = novel_service.save_novel_content(USERNAME, "第三段。")
+    worker.join(timeout=5)
+
+    assert results == [None]
+    history = history_store.load(path.with_suffix(".json"))
+    assert any(block["id"] == kept for block in history)
+    assert "第三段" in path.read_text(encoding="utf-8")
+
+def test_new_session_does_not_reuse_cold_session_name(monkeypatch):
+    init_dirs()
+    username = "storage_name_tester"
+    cold = Path(session_service.create_new_session(username)["path"])
+    novel_service.save_novel_content(username, "冷存储的正文。")
+    assert storage_service.freeze_session(cold)
+
+    # 新会话与冷存储会话创建于同一秒
+    frozen_at = datetime.datetime.strptime(cold.stem, "%Y%m%d_%H%M%S")
+    fixed = type("FixedNow", (datetime.datetime,), {"now": classmethod(lambda cls: frozen_at)})
+    monkeypatch.setattr(session_service, "datetime", SimpleNamespace(datetime=fixed))
+    path = Path(session_service.create_new_session(username)["path"])
+    assert path != cold
+    novel_service.save_novel_content(username, "新会话的正文。")
+
+    assert storage_service.is_cold(cold)
+    assert "冷存储" not in path.read_text(encoding="utf-8")
+
+def test_compact_freeze_thaw_round_trip(client, login):
+    init_dirs()
+    username = "storage_round_trip"
+    path = Path(session_service.create_new_session(username)["path"])
+    novel_service.save_novel_content(username, "保留的正文。")
+    discarded = novel_service.save_novel_content(username, "被丢弃的正文。")
+    novel_service.discard_novel_block(username, discarded)
+    json_path = path.with_suffix(".json")
+
+    # 压缩：丢弃块的正文移入归档，仍可按 id 读取原文
+    report = storage_service.compact_session(path)
+    assert report["blocks"] == 1 and report["bytes_after"] < report["bytes_before"]
+    assert storage_service.compact_session(path) is None
+    block = next(b for b in history_store.load(json_path) if b["id"] == discarded)
+    assert block["archived"] and block["content"] == ""
+    archived = client.get(f"/api/history/archived/{discarded}", headers=login(username)).json()
+    assert archived["content"] == "被丢弃的正文。"
+
+    # 冷存储：原文件删除，会话列表与统计照常；访问时解压并恢复原内容与修改时间
+    txt_bytes, json_bytes = path.read_bytes(), json_path.read_bytes()
+    mtime_ns = path.stat().st_mtime_ns
+    assert storage_service.freeze_session(path)
+    assert not path.exists() and not json_path.exists()
+    listed = {s["filename"]: s for s in session_service.list_user_sessions(username)}
+    assert listed[path.name]["cold"] and listed[path.name]["size"] == len(txt_bytes)
+    assert username not in stats_service.reconcile()["drift"]
+
+    session_service.switch_user_session(username, path.name)
+    assert path.read_bytes() == txt_bytes and json_path.read_bytes() == json_bytes
+    assert path.stat().st_mtime_ns == mtime_ns
+    assert not storage_service.is_cold(path)
+    assert storage_service.find_archived_block(path, discarded)["content"] == "被丢弃的正文。"
+    assert username not in stats_service.reconcile()["drift"]
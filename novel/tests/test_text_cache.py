@@ -0,0 +1,64 @@
+import sys
+import pytest
+from app.services import text_cache
+
+# 会话正文 LRU：按 (mtime, size) 校验命中，save 原地追加，超出字节上限时淘汰最久未用的用户
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(text_cache, "_ENTRIES", text_cache.OrderedDict())
+    monkeypatch.setattr(text_cache, "_resident_bytes", 0)
+    return text_cache
+
+def write(path, text: str):
+    path.write_text(text, encoding="utf-8")
+
+def test_hit_miss_and_external_change(cache, tmp_path):
+    path = tmp_path / "a.txt"
+    write(path, "第一章")
+    hits, misses = cache.stats()["hits"], cache.stats()["misses"]
+
+    assert cache.read_text("u", path) == "第一章"
+    assert cache.read_text("u", path) == "第一章"
+    assert (cache.stats()["hits"] - hits, cache.stats()["misses"] - misses) == (1, 1)
+
+    # 外部程序改动文件（大小变化）后自动失效
+    write(path, "第一章 改")
+    assert cache.read_text("u", path) == "第一章 改"
+    assert cache.read_text("u", tmp_path / "missing.txt") == ""
+
+def test_append_updates_entry_in_place(cache, tmp_path):
+    path = tmp_path / "a.txt"
+    write(path, "甲")
+    cache.read_text("u", path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("乙")
+    cache.append("u", path, "乙")
+    hits = cache.stats()["hits"]
+    assert cache.read_text("u", path) == "甲乙"
+    assert cache.stats()["hits"] == hits + 1
+
+    # 缓存的是别的会话时直接丢弃
+    cache.append("u", tmp_path / "b.txt", "丙")
+    assert cache.stats()["entries"] == 0
+
+def test_evicts_least_recently_used_by_bytes(cache, tmp_path, monkeypatch):
+    paths = {}
+    for name in ("a", "b", "c"):
+        paths[name] = tmp_path / f"{name}.txt"
+        write(paths[name], name * 100)
+    entry_size = sys.getsizeof("a" * 100)
+    monkeypatch.setattr(text_cache, "TEXT_CACHE_MAX_BYTES", entry_size * 2)
+
+    cache.read_text("a", paths["a"])
+    cache.read_text("b", paths["b"])
+    cache.read_text("a", paths["a"])  # a 变为最近使用
+    cache.read_text("c", paths["c"])
+    assert list(cache._ENTRIES) == ["a", "c"]
+    assert cache.stats()["resident_bytes"] == entry_size * 2
+
+    # 超过上限的单个正文不缓存
+    big = tmp_path / "big.txt"
+    write(big, "x" * 1000)
+    cache.read_text("big", big)
+    assert "big" not in cache._ENTRIES
@@ -0,0 +1,162 @@
+import time
+import asyncio
+import pytest
+from stubs import Reply, Fail, Hang
+from app.core.config import UPSTREAMS_FILE
+from app.services import upstream_service, metrics
+
+# 上游池：首字延迟只取自流式请求；超时路径关闭流出错时仍报告超时；
+# 按首字延迟排序、首 token 前故障切换、对冲请求；重试退避与熔断
+
+CONFIG = {"model": "pool-model", "base_url": "http://user/v1", "api_key": "k"}
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=10))
+
+async def collect(stream):
+    return [text async for text in stream]
+
+def test_non_stream_latency_is_not_a_ttft_sample(fake_upstream):
+    fake_upstream.plan("http://user/v1", Reply(["整段"], delay=0.05))
+    assert run(upstream_service.complete_chat(CONFIG, [{"role": "user", "content": "hi"}])) == "整段"
+    health = upstream_service.get_health("http://user/v1")
+    assert len(health.ttft_samples) == 0
+    assert len(health.latency_samples) == 1
+    assert health.recent_ttft() == 0.0
+
+    run(collect(upstream_service.stream_chat(CONFIG, [{"role": "user", "content": "hi"}])))
+    assert len(health.ttft_samples) == 1
+
+def test_timeout_is_reported_when_close_fails(fake_upstream, json_file, monkeypatch):
+    json_file(UPSTREAMS_FILE, {"pool-model": {"policy": {"first_token_timeout": 0.05, "max_retries": 0}}})
+    fake_upstream.plan("http://user/v1", Reply(["迟到"], delay=5))
+
+    async def broken_close(self):
+        raise RuntimeError("close failed")
+    monkeypatch.setattr("stubs.FakeStream.close", broken_close)
+
+    with pytest.raises(asyncio.TimeoutError, match="首个 token"):
+        run(collect(upstream_service.stream_chat(CONFIG, [{"role": "user", "content": "hi"}])))
+
+# --- 池内排序、故障切换与对冲 ---
+
+POOL = {"pool-model": {
+    "policy": {"max_retries": 0},
+    "endpoints": [
+        {"name": "a", "base_url": "http://a/v1", "api_key": "k"},
+        {"name": "b", "base_url": "http://b/v1", "api_key": "k"},
+    ],
+}}
+
+def counter(name: str, **labels) -> float:
+    return metrics.snapshot()["counters"].get(metrics._key(name, labels), 0)
+
+def test_rank_prefers_fast_and_healthy_endpoints(fake_upstream):
+    endpoints = POOL["pool-model"]["endpoints"]
+    upstream_service.get_health("http://a/v1").record_success(ttft=2.0)
+    upstream_service.get_health("http://b/v1").record_success(ttft=0.5)
+    assert [e["name"] for e in upstream_service.rank_endpoints(endpoints)] == ["b", "a"]
+
+    upstream_service.get_health("http://b/v1").record_failure(ValueError("x"), upstream_service.DEFAULT_POLICY)
+    assert [e["name"] for e in upstream_service.rank_endpoints(endpoints)] == ["a", "b"]
+
+def test_failover_before_first_token(fake_upstream, json_file):
+    json_file(UPSTREAMS_FILE, POOL)
+    fake_upstream.plan("http://a/v1", Fail(ValueError("bad gateway")))
+    fake_upstream.plan("http://b/v1", Reply(["来自", "b"]))
+    failovers = counter("upstream_failovers_total", model="pool-model")
+
+    assert run(collect(upstream_service.stream_chat(CONFIG, [{"role": "user", "content": "hi"}]))) == ["来自", "b"]
+    assert fake_upstream.urls() == ["http://a/v1", "http://b/v1"]
+    assert upstream_service.get_health("http://a/v1").failures == 1
+    assert counter("upstream_failovers_total", model="pool-model") == failovers + 1
+
+def test_all_endpoints_failing_raises_last_error(fake_upstream, json_file):
+    json_file(UPSTREAMS_FILE, POOL)
+    fake_upstream.plan("http://a/v1", Fail(ValueError("a down")))
+    fake_upstream.plan("http://b/v1", Fail(ValueError("b down")))
+    with pytest.raises(ValueError, match="down"):
+        run(upstream_service.complete_chat(CONFIG, [{"role": "user", "content": "hi"}]))
+    assert len(fake_upstream.calls) == 2
+
+def test_hedge_takes_first_responder_and_cancels_slow_request(fake_upstream, json_file):
+    json_file(UPSTREAMS_FILE, {"pool-model": {**POOL["pool-model"], "hedge": True, "hedge_delay": 0.05}})
+    fake_upstream.plan("http://a/v1", Hang())
+    fake_upstream.plan("http://b/v1", Reply(["对冲"]))
+    hedges = counter("upstream_hedges_total", model="pool-model")
+
+    assert run(collect(upstream_service.stream_chat(CONFIG, [{"role": "user", "content": "hi"}]))) == ["对冲"]
+    assert fake_upstream.urls() == ["http://a/v1", "http://b/v1"]
+    assert counter("upstream_hedges_total", model="pool-model") == hedges + 1
+    # 被取消的慢请求不算失败
+    assert upstream_service.get_health("http://a/v1").failures == 0
+
+def test_hedge_delay_uses_p95_once_sampled(fake_upstream):
+    spec = {"hedge_delay": 3.0}
+    endpoint = {"base_url": "http://a/v1"}
+    assert upstream_service.hedge_delay(spec, endpoint) == 3.0
+    health = upstream_service.get_health("http://a/v1")
+    for ttft in (0.1, 0.2, 1.0, 1.2, 2.0):
+        health.record_success(ttft=ttft)
+    assert upstream_service.hedge_delay(spec, endpoint) == 2.0
+
+# --- 重试、退避与熔断 ---
+
+def single_pool(**policy):
+    return {"pool-model": {"policy": {"backoff_base": 0, **policy}}}
+
+def test_retryable_error_is_retried_on_same_endpoint(fake_upstream, json_file):
+    json_file(UPSTREAMS_FILE, single_pool(max_retries=2))
+    fake_upstream.plan("http://user/v1", Fail(asyncio.TimeoutError()), Fail(asyncio.TimeoutError()), Reply(["第三次"]))
+    assert run(upstream_service.complete_chat(CONFIG, [{"role": "user", "content": "hi"}])) == "第三次"
+    assert len(fake_upstream.calls) == 3
+    health = upstream_service.get_health("http://user/v1")
+    assert (health.failures, health.consecutive_failures, health.successes) == (2, 0, 1)
+
+def test_non_retryable_error_fails_immediately(fake_upstream, json_file):
+    json_file(UPSTREAMS_FILE, single_pool(max_retries=2))
+    fake_upstream.plan("http://user/v1", Fail(ValueError("401")))
+    with pytest.raises(ValueError):
+        run(upstream_service.complete_chat(CONFIG, [{"role": "user", "content": "hi"}]))
+    assert len(fake_upstream.calls) == 1
+
+def test_backoff_is_capped():
+    policy = {**upstream_service.DEFAULT_POLICY, "backoff_base": 1.0, "backoff_max": 3.0}
+    assert all(0 <= upstream_service.backoff_delay(policy, retry) <= 3.0 for retry in range(10))
+
+def test_breaker_opens_fails_fast_and_recovers_through_probe(fake_upstream, json_file):
+    json_file(UPSTREAMS_FILE, single_pool(max_retries=0, breaker_threshold=2, breaker_cooldown=0.1))
+    messages = [{"role": "user", "content": "hi"}]
+    fake_upstream.plan("http://user/v1", Fail(ValueError("down")), Fail(ValueError("down")),
+                       Fail(ValueError("probe down")), Reply(["恢复"]))
+    health = upstream_service.get_health("http://user/v1")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            run(upstream_service.complete_chat(CONFIG, messages))
+    assert health.breaker_state == upstream_service.BREAKER_OPEN
+
+    # 冷却期内不再请求上游
+    with pytest.raises(upstream_service.UpstreamUnavailable):
+        run(upstream_service.complete_chat(CONFIG, messages))
+    assert len(fake_upstream.calls) == 2
+
+    # 冷却后半开：探测失败重新熔断，探测成功关闭
+    time.sleep(0.12)
+    with pytest.raises(ValueError, match="probe"):
+        run(upstream_service.complete_chat(CONFIG, messages))
+    assert health.breaker_state == upstream_service.BREAKER_OPEN
+    time.sleep(0.12)
+    assert run(upstream_service.complete_chat(CONFIG, messages)) == "恢复"
+    assert health.breaker_state == upstream_service.BREAKER_CLOSED
+
+def test_half_open_admits_a_single_probe(fake_upstream):
+    policy = {**upstream_service.DEFAULT_POLICY, "breaker_threshold": 1, "breaker_cooldown": 0}
+    health = upstream_service.get_health("http://user/v1")
+    health.record_failure(ValueError("down"), policy)
+    assert health.allow_request(policy)
+    assert health.breaker_state == upstream_service.BREAKER_HALF_OPEN
+    assert not health.allow_request(policy)
+    # 探测被取消时释放名额
+    health.release_probe()
+    assert health.allow_request(policy)